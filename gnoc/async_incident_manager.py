@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from incident_manager_agent import IncidentManager, parse_tool_result
+from tracing import span
+
+
+class AsyncIncidentManager:
+    """
+    Coroutine versions of the `IncidentManager` creation tools, so many incidents can be declared concurrently
+    from one event loop.
+
+    Status pages are created through a pooled `httpx.AsyncClient` with explicit timeouts and keep-alive. The Jira
+    and Google SDKs are blocking, so their calls run on a bounded thread pool (INCIDENT_EXECUTOR_WORKERS) and reuse
+    the managed clients of the wrapped `IncidentManager`.
+
+    The HTTP client belongs to the event loop it was created in; a new one is opened when the manager is used
+    from another loop (e.g. one `asyncio.run` per Streamlit rerun).
+    """
+
+    def __init__(self, incident_manager=None, max_workers=None, max_connections=None):
+        self.incident_manager = incident_manager or IncidentManager()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or int(os.getenv("INCIDENT_EXECUTOR_WORKERS", "8")),
+                                           thread_name_prefix="incident-io")
+        self.max_connections = max_connections or int(os.getenv("STATUS_PAGE_MAX_CONNECTIONS", "10"))
+        self.timeout = httpx.Timeout(self.incident_manager.status_page_timeout,
+                                     connect=float(os.getenv("STATUS_PAGE_CONNECT_TIMEOUT_SECONDS", "5")))
+        self._http = None
+        self._http_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def http_client(self):
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop:
+            self._http = httpx.AsyncClient(
+                headers=self.incident_manager.status_page_headers, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=30.0))
+            self._http_loop = loop
+        return self._http
+
+    async def run_blocking(self, func, *args, **kwargs):
+        # run_in_executor does not carry the context over, the spans of `func` would start a trace of their own
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                functools.partial(context.run, func, *args, **kwargs))
+
+    async def create_jira_ticket(self, priority, summary, description):
+        """
+        Creates the Jira ticket and returns the `create_jira_ticket` payload as a dict.
+        """
+        content = await self.run_blocking(self.incident_manager.create_jira_ticket, priority, summary, description)
+        return parse_tool_result(content, "create_jira_ticket")
+
+    async def create_white_board(self, jira_id, summary, segment, product):
+        """
+        Creates the white board and returns the `create_white_board` payload as a dict.
+        """
+        content = await self.run_blocking(self.incident_manager.create_white_board, jira_id, summary, segment,
+                                          product)
+        return parse_tool_result(content, "create_white_board")
+
+    async def create_status_page(self, jira_id, priority, summary, description):
+        """
+        Creates the status page incident and returns the `create_status_page` payload as a dict.
+        """
+        incident_data = self.incident_manager.status_page_incident(jira_id, priority, summary, description)
+        try:
+            with span("http.status_page.create_incident",
+                      payload_bytes=len(json.dumps(incident_data).encode())) as http_span:
+                response = await self.http_client().post(self.incident_manager.url, json=incident_data)
+                http_span.set(status_code=response.status_code)
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Failed to create status page: {e}")
+            raise
+        return self.incident_manager.status_page_result(response.json())
+
+    async def declare(self, priority, summary, description, segment, product):
+        """
+        Creates the Jira ticket, then the white board and the status page concurrently.
+
+        Returns:
+          A dict with the `jira`, `white_board` and `status_page` payloads.
+        """
+        jira = await self.create_jira_ticket(priority, summary, description)
+        white_board, status_page = await asyncio.gather(
+            self.create_white_board(jira["jira_id"], summary, segment, product),
+            self.create_status_page(jira["jira_id"], priority, summary, description))
+        return {"jira": jira, "white_board": white_board, "status_page": status_page}
+
+    async def aclose(self):
+        if self._http is not None and self._http_loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._http = None
+        self._http_loop = None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,283 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_servers import FakeBackends
+
+DEFAULT_PRIORITY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Priority.pdf")
+ISSUE_TEMPLATES = [
+    "We are experiencing a critical issue in the merchant segment impacting our TransIT product. Customers have been "
+    "unable to perform Mastercard card transactions for the past {minutes} minutes. Approximately {count},000 "
+    "transactions have been declined, leading to a revenue loss of ${amount},000.",
+    "In the consumer segment our Wallet product is down: {count},000 cardholders cannot log in and ${amount}K of "
+    "settlements are delayed for {minutes} minutes.",
+    "Around {count},000 employees in the corporate segment cannot access the Payroll product since {minutes} minutes.",
+    "The issuing segment sees intermittent latency on the Card product, about {count},000 transactions failed in the "
+    "last {minutes} minutes.",
+]
+
+
+def benchmark_issues(count):
+    # Every issue is distinct so that neither the semantic cache nor the incident index merges them
+    return [ISSUE_TEMPLATES[index % len(ISSUE_TEMPLATES)].format(minutes=5 + index, count=3 + index,
+                                                                 amount=40 + 7 * index) for index in range(count)]
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {"count": len(ordered), "mean": statistics.mean(ordered), "p50": at(0.50), "p95": at(0.95),
+            "p99": at(0.99), "max": ordered[-1]}
+
+
+def write_credentials(workdir, token_url):
+    """
+    Writes a service account for Drive/Docs and user tokens for Gmail/Calendar whose token endpoint is the fake
+    server, so the Google clients authenticate exactly as they do in production.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+    service_account_path = os.path.join(workdir, "service_account.json")
+    with open(service_account_path, "w") as service_account_file:
+        json.dump({"type": "service_account", "project_id": "benchmark", "private_key_id": "benchmark",
+                   "private_key": private_key, "client_email": "benchmark@benchmark.iam.gserviceaccount.com",
+                   "client_id": "benchmark", "token_uri": token_url}, service_account_file)
+    expiry = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).strftime(
+        "%Y-%m-%dT%H:%M:%SZ")
+    for token_file in ("gmail_token.json", "calendar_token.json"):
+        with open(os.path.join(workdir, token_file), "w") as user_token_file:
+            json.dump({"token": "benchmark", "refresh_token": "benchmark", "client_id": "benchmark",
+                       "client_secret": "benchmark", "token_uri": token_url, "expiry": expiry}, user_token_file)
+    return service_account_path
+
+
+def configure_environment(backends, workdir, args):
+    """
+    Points every client of the pipeline at the fake backends. Must run before the pipeline modules are imported,
+    some of them read their settings at import time.
+    """
+    model_config_file = os.path.join(workdir, "MODEL_CONFIG_LIST")
+    with open(model_config_file, "w") as config_file:
+        # A large and a small tier, so the model router has something to route between
+        json.dump([{"model": "gpt-4o", "base_url": f"{backends.url}/v1", "api_key": "benchmark"},
+                   {"model": "gpt-4o-mini", "base_url": f"{backends.url}/v1", "api_key": "benchmark",
+                    "tags": ["small"]}], config_file)
+    os.environ.update({
+        "MODEL_CONFIG_FILE": model_config_file,
+        "PRIORITY_FILE": os.path.abspath(args.priority_file),
+        "EMBEDDING_BACKEND": "openai",
+        "EMBEDDING_BASE_URL": f"{backends.url}/v1",
+        "OPENAI_EMBEDDING_MODEL": "text-embedding-3-small",
+        "PRIORITY_RERANKER": "lexical",
+        "PRIORITY_AGENT_POOL_SIZE": str(args.concurrency),
+        "PRIORITY_HEDGING_ENABLED": str(not args.no_hedging).lower(),
+        # A run sees few completions; learn the hedge deadline after a handful of them
+        "HEDGE_MIN_SAMPLES": "5",
+        "PRIORITY_RULES_ENABLED": str(args.use_rules).lower(),
+        "SEMANTIC_CACHE_ENABLED": str(args.use_cache).lower(),
+        "JIRA_URL": backends.url,
+        "STATUS_PAGE_URL": backends.url,
+        "STATUS_API_TOKEN": "benchmark",
+        "GOOGLE_API_ROOT_URL": backends.url,
+        "SERVICE_ACCOUNT_JSON": write_credentials(workdir, f"{backends.url}/token"),
+        "WHITEBOARD_TEMPLATE_DOC_ID": "whiteboard-template",
+        "WHITEBOARD_POOL_SIZE": str(args.whiteboard_pool),
+        "NOTIFICATION_OUTBOX_PATH": os.path.join(workdir, "notification_outbox.sqlite3"),
+        "FROM_EMAIL": "gnoc@example.com",
+        "MERCHANT_SENSITIVE_TO_EMAIL": "merchant-sensitive@example.com",
+        "ISSUING_SENSITIVE_TO_EMAIL": "issuing-sensitive@example.com",
+        "MERCHANT_INSENSITIVE_TO_EMAIL": "merchant@example.com",
+        "ISSUING_INSENSITIVE_TO_EMAIL": "issuing@example.com",
+        "LLM_CACHE_ENABLED": str(not args.no_llm_cache).lower(),
+        "LLM_CACHE_PATH": args.llm_cache_path or os.path.join(workdir, "llm_cache.sqlite3"),
+        "TRACE_OTLP_FILE": os.path.join(workdir, "traces.otlp.jsonl"),
+        "TRACE_PROMETHEUS_FILE": os.path.join(workdir, "metrics.prom"),
+    })
+
+
+def run(args):
+    """
+    Drives issue text -> priority -> Jira ticket, white board and status page -> two emails for `args.issues`
+    issues, `args.concurrency` at a time, against the fake backends, and returns the results as a dict.
+    """
+    backends = FakeBackends(args.llm_latency, args.llm_tokens_per_second, args.service_latency,
+                            llm_slow_fraction=args.llm_slow_fraction, llm_slow_seconds=args.llm_slow_seconds).start()
+    workdir = tempfile.mkdtemp(prefix="gnoc-benchmark-")
+    configure_environment(backends, workdir, args)
+    # The Gmail/Calendar token files and the autogen work dir are relative to the working directory
+    os.chdir(workdir)
+
+    from incident_index import IncidentIndex
+    from incident_manager_agent import IncidentManager
+    from incident_pipeline import IncidentPipeline
+    from notification_manager_agent import NotificationService
+    from prioritization_result import PrioritizationResult
+    from priority_agent_pool import PriorityAgentPool
+    from priority_identification_agent import PriorityIdentificationAgent
+    from model_router import usage_ledger
+    from llm_cache import llm_cache
+    from tracing import span, tracer
+
+    started = time.perf_counter()
+    chromadb_path = os.path.join(workdir, "chromadb")
+    pool = PriorityAgentPool(agent_factory=lambda: PriorityIdentificationAgent(chromadb_file_path=chromadb_path))
+    incident_manager = IncidentManager().start()
+    notification_service = NotificationService()
+    incident_index = IncidentIndex() if args.use_index else None
+    setup_seconds = time.perf_counter() - started
+    setup_stats = backends.stats()
+
+    stage_samples = {}
+    failures = {}
+    traces = []
+    lock = threading.Lock()
+
+    def record(name, seconds):
+        with lock:
+            stage_samples.setdefault(name, []).append(seconds)
+
+    def declare(issue):
+        # One budget and one trace for prioritization and declaration
+        with usage_ledger.incident_budget(), span("incident") as incident_span:
+            declare_issue(issue)
+        with lock:
+            traces.append((incident_span.seconds, incident_span.trace_id))
+
+    def declare_issue(issue):
+        issue_started = time.perf_counter()
+        prioritization = pool.prioritize_issue(issue)
+        record("prioritize", time.perf_counter() - issue_started)
+        result = PrioritizationResult.from_dict(prioritization or {})
+        if not result.actionable:
+            with lock:
+                failures["not_actionable"] = failures.get("not_actionable", 0) + 1
+            return
+        report = IncidentPipeline(incident_manager, notification_service, incident_index=incident_index).run(result)
+        for name, outcome in report.outcomes.items():
+            if outcome.status == "succeeded":
+                record(name, outcome.seconds)
+            else:
+                with lock:
+                    failures[name] = failures.get(name, 0) + 1
+        record("pipeline", report.total_seconds)
+        record("end_to_end", time.perf_counter() - issue_started)
+
+    issues = benchmark_issues(args.issues)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(declare, issues))
+    wall_seconds = time.perf_counter() - started
+
+    # Notifications are delivered by the outbox worker; wait for it so the email counts are complete
+    delivery_started = time.perf_counter()
+    if notification_service.outbox is not None:
+        notification_service.outbox.drain()
+    delivery_seconds = time.perf_counter() - delivery_started
+
+    server_stats = backends.stats()
+    tracer.write_prometheus()
+    slowest_seconds, slowest_trace_id = max(traces, default=(0.0, None))
+    for name in ("llm_calls", "prompt_tokens", "completion_tokens", "embedding_calls", "embedded_texts",
+                 "slow_llm_calls"):
+        server_stats[name] -= setup_stats[name]
+    incident_manager.stop()
+    backends.stop()
+    return {
+        "config": {name: value for name, value in vars(args).items() if name != "output"},
+        "workdir": workdir,
+        "setup_seconds": setup_seconds,
+        "wall_seconds": wall_seconds,
+        "throughput_per_second": len(issues) / wall_seconds if wall_seconds else 0.0,
+        "notification_drain_seconds": delivery_seconds,
+        "stages": {name: percentiles(samples) for name, samples in stage_samples.items()},
+        "failures": failures,
+        "llm": {name: server_stats[name] for name in ("llm_calls", "prompt_tokens", "completion_tokens",
+                                                      "embedding_calls", "embedded_texts", "slow_llm_calls")},
+        "requests": server_stats["requests"],
+        "emails_sent": server_stats["emails_sent"],
+        "events_created": server_stats["events_created"],
+        "clients": {"priority_pool": pool.stats(), "incident_manager": incident_manager.client_stats(),
+                    "notification_service": notification_service.client_stats()},
+        "spans": tracer.stats(),
+        "llm_usage": usage_ledger.stats(),
+        "llm_cache": llm_cache.stats(),
+        "slowest_incident": {"seconds": slowest_seconds, "trace_id": slowest_trace_id,
+                             "breakdown": tracer.breakdown(slowest_trace_id) if slowest_trace_id else None},
+        "trace_files": {"otlp": tracer.otlp_path, "prometheus": tracer.prometheus_path},
+    }
+
+
+def print_summary(results):
+    print(f"{results['config']['issues']} issues at concurrency {results['config']['concurrency']}: "
+          f"{results['wall_seconds']:.2f}s, {results['throughput_per_second']:.2f} incidents/s")
+    print(f"{'stage':<20} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, summary in results["stages"].items():
+        print(f"{name:<20} {summary['count']:>5} {summary['p50']:>8.3f}s {summary['p95']:>8.3f}s "
+              f"{summary['p99']:>8.3f}s")
+    print(f"llm:- {results['llm']}")
+    for name, hedger in results["clients"]["priority_pool"]["hedging"].items():
+        print(f"hedging {name}:- {hedger['hedged']} of {hedger['requests']} requests hedged, "
+              f"{hedger['hedge_wins']} won by the hedge, {hedger['budget_denied']} denied by the budget, "
+              f"deadline {hedger['deadline_seconds']:.3f}s")
+    cache = results["llm_cache"]
+    print(f"llm cache:- {cache['hit_ratio']:.1%} hit ratio, {cache['llm_calls_saved']} LLM calls and "
+          f"{cache['tokens_saved']} tokens saved ({cache['memory_hits']} memory, {cache['disk_hits']} disk hits)")
+    for name, agent in results["llm_usage"]["agents"].items():
+        print(f"{name:<28} {agent['calls']:>4} calls {agent['prompt_tokens']:>7} prompt "
+              f"{agent['completion_tokens']:>6} completion tokens {agent['mean_seconds']:>7.3f}s mean  {agent['models']}")
+    print(f"emails sent:- {results['emails_sent']}, calendar events:- {results['events_created']}, "
+          f"failures:- {results['failures']}")
+    if results["slowest_incident"]["breakdown"]:
+        print(f"slowest incident:-\n{results['slowest_incident']['breakdown']}")
+    print(f"traces:- {results['trace_files']['otlp']}, metrics:- {results['trace_files']['prometheus']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the whole incident flow against local fake LLM, Jira, Statuspage and Google servers.")
+    parser.add_argument("--issues", type=int, default=20, help="Number of issues to declare.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Issues declared at the same time.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the fake LLM answers.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0,
+                        help="Generation speed of the fake LLM.")
+    parser.add_argument("--llm-slow-fraction", type=float, default=0.0,
+                        help="Fraction of LLM completions that are slow.")
+    parser.add_argument("--llm-slow-seconds", type=float, default=10.0,
+                        help="Extra seconds a slow completion takes.")
+    parser.add_argument("--no-hedging", action="store_true", help="Do not hedge slow prioritization completions.")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Do not cache LLM responses.")
+    parser.add_argument("--llm-cache-path",
+                        help="LLM cache database to use, e.g. one shared with a previous run (default: a fresh one).")
+    parser.add_argument("--service-latency", type=float, default=0.05,
+                        help="Seconds every fake Jira, Statuspage and Google call takes.")
+    parser.add_argument("--whiteboard-pool", type=int, default=0, help="WHITEBOARD_POOL_SIZE to run with.")
+    parser.add_argument("--use-rules", action="store_true", help="Let the rule-based pre-classifier answer.")
+    parser.add_argument("--use-cache", action="store_true", help="Enable the semantic prioritization cache.")
+    parser.add_argument("--use-index", action="store_true", help="Attach duplicate reports to open incidents.")
+    parser.add_argument("--priority-file", default=DEFAULT_PRIORITY_FILE, help="Priority document to ingest.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    results = run(args)
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, default=str)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+from llm_json import EMAIL_SCHEMA, EMAILS_SCHEMA, PRIORITY_SCHEMA, parse_llm_json
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_json_corpus.jsonl")
+SCHEMAS = {
+    "email": EMAIL_SCHEMA,
+    "emails": EMAILS_SCHEMA,
+    "priority": PRIORITY_SCHEMA,
+    "priority_batch": [PRIORITY_SCHEMA],
+}
+
+
+def read_corpus(corpus_path):
+    with open(corpus_path, "r") as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def strict_parse(text):
+    # What prioritize_issue used to do: strip a ```json fence and hand the rest to json.loads
+    return json.loads(text.strip().strip("```json\n").strip("\n```"))
+
+
+def measure(parse, text, iterations):
+    try:
+        parse(text)
+    except Exception:
+        return None
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse(text)
+    return (time.perf_counter() - started) / iterations
+
+
+def run(corpus, iterations):
+    """
+    Parses every malformed LLM output of the corpus with the tolerant parser (validating its shape) and with a
+    fence-stripping json.loads, reporting which ones each could read and how long it took.
+    """
+    rows = []
+    for case in corpus:
+        schema = SCHEMAS[case["schema"]]
+        tolerant = measure(lambda text: parse_llm_json(text, schema), case["text"], iterations)
+        strict = measure(strict_parse, case["text"], iterations)
+        rows.append((case["name"], len(case["text"]), tolerant, strict))
+
+    print(f"{'case':<36} {'chars':>7} {'tolerant':>12} {'json.loads':>12}")
+    for name, chars, tolerant, strict in rows:
+        print(f"{name:<36} {chars:>7} {format_seconds(tolerant):>12} {format_seconds(strict):>12}")
+    tolerant_times = [row[2] for row in rows if row[2] is not None]
+    print(f"tolerant parser read {len(tolerant_times)}/{len(rows)} outputs, "
+          f"json.loads read {sum(row[3] is not None for row in rows)}/{len(rows)}")
+    if tolerant_times:
+        print(f"tolerant parser mean={statistics.mean(tolerant_times) * 1e6:.1f} us  "
+              f"max={max(tolerant_times) * 1e6:.1f} us")
+
+
+def format_seconds(seconds):
+    return "failed" if seconds is None else f"{seconds * 1e6:.1f} us"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tolerant LLM JSON parser on malformed outputs.")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="JSONL file of {name, schema, text} cases.")
+    parser.add_argument("--iterations", type=int, default=200, help="Parses per case.")
+    args = parser.parse_args()
+    run(read_corpus(args.corpus), args.iterations)
@@ -0,0 +1,58 @@
+import argparse
+import statistics
+import time
+
+from priority_agent_pool import PriorityAgentPool
+from priority_identification_agent import PriorityIdentificationAgent
+
+SAMPLE_ISSUE = (
+    "We are experiencing a critical issue in the merchant segment impacting our Transit product. "
+    "Customers have been unable to perform Mastercard card transactions for the past 15 minutes. "
+    "Approximately 10,000 transactions have been declined during this time, leading to a revenue loss of $80,000."
+)
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} n={len(samples):<4} mean={statistics.mean(samples) * 1000:10.2f} ms  "
+          f"p50={statistics.median(samples) * 1000:10.2f} ms  p95={p95 * 1000:10.2f} ms")
+
+
+def run(iterations, pool_size, with_llm):
+    """
+    Compares building a fresh agent per request (what the app used to do) with borrowing one from a warm pool.
+    """
+    cold = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        agent = PriorityIdentificationAgent()
+        if with_llm:
+            agent.prioritize_issue(SAMPLE_ISSUE)
+        cold.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    pool = PriorityAgentPool(size=pool_size)
+    startup = time.perf_counter() - started
+
+    steady = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        with pool.acquire() as agent:
+            if with_llm:
+                agent.prioritize_issue(SAMPLE_ISSUE)
+        steady.append(time.perf_counter() - started)
+
+    print(f"pool startup ({pool_size} agents): {startup * 1000:.2f} ms")
+    summarize("cold (new agent per call)", cold)
+    summarize("steady state (pooled)", steady)
+    print(f"pool stats: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup vs steady-state latency of the priority agent pool.")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--with-llm", action="store_true", help="Also run prioritize_issue for every request.")
+    args = parser.parse_args()
+    run(args.iterations, args.pool_size, args.with_llm)
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+from autogen.retrieve_utils import get_files_from_dir
+from dotenv import load_dotenv
+
+from priority_rules import compile_priority_rules, document_text
+
+SAMPLE_ISSUES = [
+    "We are experiencing a critical issue in the merchant segment impacting our Transit product. "
+    "Customers have been unable to perform Mastercard card transactions for the past 15 minutes. "
+    "Approximately 10,000 transactions have been declined during this time, leading to a revenue loss of $80,000.",
+    "In the consumer segment our Wallet product is down: 12,000 cardholders cannot log in and $500K of settlements "
+    "are delayed.",
+    "Around 3,000 employees in the corporate segment cannot access the Payroll product.",
+    "The issuing segment sees intermittent latency on the Card product, about 5,000 transactions were slow.",
+    "The merchant segment reports that 150,000 transactions failed on the POS product in the last hour.",
+    "A single user cannot log in to the Reporting product of the corporate segment.",
+    "The coffee machine on the third floor is broken.",
+]
+COMPARED_FIELDS = ("priority", "impact", "urgency", "segment", "product")
+
+
+def read_issues(issues_path):
+    if not issues_path:
+        return SAMPLE_ISSUES
+    with open(issues_path, "r") as issues_file:
+        issues = [json.loads(line) for line in issues_file if line.strip()]
+    return [issue if isinstance(issue, str) else issue.get("issue") or issue.get("description") for issue in issues]
+
+
+def normalized(value):
+    return str(value or "").replace(" ", "").lower()
+
+
+def run(issues, iterations, min_confidence, with_llm):
+    """
+    Measures the latency and coverage of the rule-based pre-classifier and, with `with_llm`, how often it agrees
+    with the RAG agent.
+    """
+    load_dotenv()
+    started = time.perf_counter()
+    text = "\n".join(document_text(file_path) for file_path in sorted(get_files_from_dir(os.getenv("PRIORITY_FILE"))))
+    rules = compile_priority_rules(text)
+    print(f"compiled rules in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    samples = []
+    for _ in range(iterations):
+        for issue in issues:
+            started = time.perf_counter()
+            rules.classify(issue)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    print(f"classify n={len(samples)} mean={statistics.mean(samples) * 1e6:.1f} us  "
+          f"p50={statistics.median(samples) * 1e6:.1f} us  p95={samples[int(len(samples) * 0.95)] * 1e6:.1f} us")
+
+    decisions = [rules.classify(issue) for issue in issues]
+    confident = [decision.result is not None and decision.confidence >= min_confidence for decision in decisions]
+    print(f"coverage at confidence >= {min_confidence}: {sum(confident)}/{len(issues)}")
+    if not with_llm:
+        for issue, decision in zip(issues, decisions):
+            priority = decision.result["priority"] if decision.result else "-"
+            print(f"  {priority:<3} confidence={decision.confidence:<6} {issue[:80]}")
+        return
+
+    from priority_identification_agent import PriorityIdentificationAgent
+
+    agent = PriorityIdentificationAgent()
+    agreements = {name: [0, 0] for name in COMPARED_FIELDS}
+    for issue, decision, is_confident in zip(issues, decisions, confident):
+        llm_result = agent.prioritize_issue(issue)
+        agent.reset()
+        rule_result = decision.result or {}
+        matches = {name: normalized(rule_result.get(name)) == normalized((llm_result or {}).get(name))
+                   for name in COMPARED_FIELDS}
+        print(f"  rules={rule_result.get('priority', '-'):<3} llm={(llm_result or {}).get('priority', '-'):<3} "
+              f"confidence={decision.confidence:<6} {issue[:60]}")
+        if is_confident:
+            for name, match in matches.items():
+                agreements[name][0] += match
+                agreements[name][1] += 1
+    for name, (agreed, total) in agreements.items():
+        print(f"agreement on {name:<9} for confident issues: {agreed}/{total}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and LLM agreement of the rule-based priority classifier.")
+    parser.add_argument("--issues", help="JSONL file of issues (default: built-in samples).")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--min-confidence", type=float, default=float(os.getenv("PRIORITY_RULES_MIN_CONFIDENCE",
+                                                                                "0.8")))
+    parser.add_argument("--with-llm", action="store_true", help="Also prioritize every issue with the RAG agent.")
+    args = parser.parse_args()
+    run(read_issues(args.issues), args.iterations, args.min_confidence, args.with_llm)
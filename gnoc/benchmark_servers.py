@@ -0,0 +1,264 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SEGMENTS = ("merchant", "consumer", "corporate", "issuing")
+NARRATIVE = ("We are actively investigating an issue affecting {product} in the {segment} segment. The incident team "
+             "has been engaged and is working on restoring normal service as quickly as possible. Further updates "
+             "will follow on the status page.")
+EMBEDDING_DIMENSIONS = 64
+
+
+def count_tokens(text):
+    # Close enough to a BPE tokenizer for English prose and JSON
+    return max(1, math.ceil(len(text) / 4))
+
+
+def hashed_embedding(text):
+    """
+    A deterministic bag-of-words embedding, so texts sharing words are close to each other.
+    """
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in re.findall(r"[a-z0-9$%]+", text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=4).digest()
+        vector[int.from_bytes(digest[:2], "little") % EMBEDDING_DIMENSIONS] += 1.0 if digest[2] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def fake_prioritization(issue):
+    lowered = issue.lower()
+    segment = next((segment for segment in SEGMENTS if segment in lowered), None)
+    if segment is None:
+        return {"priority": "NA", "impact": "NA", "urgency": "NA",
+                "description": "This issue does not appear to be related to any GP products.", "summary": "NA",
+                "segment": "NA", "product": "NA"}
+    product = re.search(r"\b(?:our|the)\s+([A-Z][\w-]*)\s+product\b", issue)
+    critical = any(word in lowered for word in ("critical", "down", "unable", "failed", "declined"))
+    return {"priority": "P1" if critical else "P3", "impact": "High" if critical else "Low",
+            "urgency": "High" if critical else "Low", "description": issue.strip(),
+            "summary": " ".join(issue.split()[:10]), "segment": segment.title(),
+            "product": product.group(1) if product else "Payments"}
+
+
+class FakeBackends:
+    """
+    Local stand-ins for every service an incident touches, served from one threaded HTTP server:
+
+    - an OpenAI-compatible LLM (`/v1/chat/completions`, `/v1/embeddings`) answering like the real agents expect,
+      with `llm_latency` seconds of time to first token plus `llm_tokens_per_second` of generation; a random
+      `llm_slow_fraction` of the completions takes `llm_slow_seconds` longer, the tail hedging is meant to cut
+    - Jira (`/rest/api/2/...`), Statuspage (`.../incidents`), Drive, Docs, Gmail and Calendar (including their
+      batch endpoints) and the Google OAuth token endpoint, each taking `service_latency` seconds
+
+    Every call is counted, and LLM calls with their token usage, so a benchmark can report them.
+    """
+
+    def __init__(self, llm_latency=0.5, llm_tokens_per_second=50.0, service_latency=0.05, host="127.0.0.1", port=0,
+                 llm_slow_fraction=0.0, llm_slow_seconds=10.0, seed=0):
+        self.llm_latency = llm_latency
+        self.llm_tokens_per_second = llm_tokens_per_second
+        self.llm_slow_fraction = llm_slow_fraction
+        self.llm_slow_seconds = llm_slow_seconds
+        self._random = random.Random(seed)
+        self.service_latency = service_latency
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self.metrics = {"requests": {}, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                        "embedding_calls": 0, "embedded_texts": 0, "emails_sent": 0, "events_created": 0,
+                        "slow_llm_calls": 0}
+        backends = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def do_PATCH(self):
+                self._handle()
+
+            def do_DELETE(self):
+                self._handle()
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, content_type, payload = backends.dispatch(
+                    self.command, self.path, self.headers.get("Content-Type", ""), body)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-backends", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self.metrics))
+
+    def _next_id(self, prefix):
+        with self._lock:
+            self._sequence += 1
+            return f"{prefix}{self._sequence}"
+
+    def _count(self, route, **metrics):
+        with self._lock:
+            self.metrics["requests"][route] = self.metrics["requests"].get(route, 0) + 1
+            for name, value in metrics.items():
+                self.metrics[name] += value
+
+    def dispatch(self, method, path, content_type, body):
+        """
+        Returns the (status, content type, body) of a request.
+        """
+        path = urlparse(path).path
+        if path == "/batch" or path.startswith("/batch/"):
+            time.sleep(self.service_latency)
+            return self._batch(content_type, body)
+        if path == "/v1/chat/completions":
+            return self._json(200, self._chat_completion(json.loads(body)))
+        if path == "/v1/embeddings":
+            return self._json(200, self._embeddings(json.loads(body)))
+        time.sleep(self.service_latency)
+        status, payload = self._service(method, path, json.loads(body) if "json" in content_type and body else {})
+        return self._json(status, payload)
+
+    @staticmethod
+    def _json(status, payload):
+        return status, "application/json", json.dumps(payload).encode() if payload is not None else b""
+
+    def _chat_completion(self, request):
+        messages = request.get("messages", [])
+        prompt = "\n".join(str(message.get("content") or "") for message in messages)
+        last = str(messages[-1].get("content") or "") if messages else ""
+        if "narrative paragraph" in last:
+            fields = dict(re.findall(r"(Segment|Product): ([^,\n.]+)", last))
+            narrative = NARRATIVE.format(segment=fields.get("Segment", "affected"),
+                                         product=fields.get("Product", "the product"))
+            content = json.dumps({"insensitive": narrative,
+                                  "sensitive": narrative + " Transactions are being declined."})
+        elif "prioritize" in last.lower():
+            issue = last.split("Issue:-", 1)[-1].split("Context", 1)[0]
+            content = f"```json\n{json.dumps(fake_prioritization(issue), indent=4)}\n```"
+        else:
+            content = "TERMINATE"
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+        with self._lock:
+            slow = self._random.random() < self.llm_slow_fraction
+        time.sleep(self.llm_latency + completion_tokens / self.llm_tokens_per_second +
+                   (self.llm_slow_seconds if slow else 0.0))
+        self._count("llm", llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    slow_llm_calls=int(slow))
+        return {
+            "id": self._next_id("chatcmpl-"), "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _embeddings(self, request):
+        texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        self._count("embeddings", embedding_calls=1, embedded_texts=len(texts))
+        return {"object": "list", "model": request.get("model", "fake"),
+                "data": [{"object": "embedding", "index": index, "embedding": hashed_embedding(text)}
+                         for index, text in enumerate(texts)],
+                "usage": {"prompt_tokens": sum(map(count_tokens, texts)),
+                          "total_tokens": sum(map(count_tokens, texts))}}
+
+    def _service(self, method, path, body):
+        if path == "/token":
+            self._count("google_token")
+            return 200, {"access_token": uuid.uuid4().hex, "token_type": "Bearer", "expires_in": 3600}
+        if path.startswith("/rest/api/2/"):
+            self._count("jira")
+            if path.endswith("/serverInfo"):
+                return 200, {"baseUrl": self.url, "version": "9.0.0", "versionNumbers": [9, 0, 0],
+                             "deploymentType": "Cloud"}
+            if path.endswith("/myself"):
+                return 200, {"accountId": "benchmark", "displayName": "Benchmark"}
+            if path.endswith("/issue") and method == "POST":
+                key = self._next_id("GNOC-")
+                return 201, {"id": key.split("-")[1], "key": key, "self": f"{self.url}/rest/api/2/issue/{key}"}
+            key = path.rsplit("/", 1)[-1]
+            return 200, {"id": key.split("-")[-1], "key": key, "self": f"{self.url}/rest/api/2/issue/{key}",
+                         "fields": {"summary": "", "status": {"name": "Open"}}}
+        if path.endswith("/incidents") and method == "POST":
+            self._count("status_page")
+            return 201, {"id": self._next_id("incident"), "name": body.get("incident", {}).get("name")}
+        if path.startswith("/drive/v3/files"):
+            self._count("drive")
+            parts = path.split("/")
+            if path.endswith("/copy"):
+                return 200, {"id": self._next_id("doc"), "name": body.get("name")}
+            if path.endswith("/permissions"):
+                return 200, {"id": "anyoneWithLink", "role": body.get("role")}
+            if method == "GET":
+                return 200, {"files": []}
+            if method == "DELETE":
+                return 204, None
+            return 200, {"id": parts[-1], "name": body.get("name")}
+        if path.startswith("/v1/documents/"):
+            self._count("docs")
+            return 200, {"documentId": path.split("/")[3].split(":")[0], "replies": []}
+        if path.endswith("/messages/send"):
+            self._count("gmail", emails_sent=1)
+            return 200, {"id": self._next_id("message"), "labelIds": ["SENT"]}
+        if "/calendars/" in path and path.endswith("/events"):
+            self._count("calendar", events_created=1)
+            event_id = body.get("id") or self._next_id("event")
+            return 200, {"id": event_id, "htmlLink": f"{self.url}/calendar/event?eid={event_id}"}
+        self._count("unknown")
+        return 404, {"error": {"code": 404, "message": f"No fake for {method} {path}"}}
+
+    def _batch(self, content_type, body):
+        """
+        Answers a Google batch request (multipart/mixed of HTTP requests) part by part.
+        """
+        boundary = content_type.split("boundary=", 1)[1].strip('"')
+        parts = body.decode().split(f"--{boundary}")
+        response_boundary = f"batch_{uuid.uuid4().hex}"
+        lines = []
+        for part in parts:
+            part = part.replace("\r\n", "\n").strip("\n")
+            if not part or part == "--":
+                continue
+            outer_headers, _, inner = part.partition("\n\n")
+            content_id = re.search(r"Content-ID:\s*<([^>]*)>", outer_headers, re.IGNORECASE).group(1)
+            request_head, _, request_body = inner.partition("\n\n")
+            method, target = request_head.splitlines()[0].split(" ")[:2]
+            status, payload = self._service(method, urlparse(target).path,
+                                            json.loads(request_body) if request_body.strip() else {})
+            lines += [f"--{response_boundary}", "Content-Type: application/http",
+                      f"Content-ID: <response-{content_id}>", "", f"HTTP/1.1 {status} OK",
+                      "Content-Type: application/json", "", json.dumps(payload) if payload is not None else ""]
+        lines.append(f"--{response_boundary}--")
+        return 200, f"multipart/mixed; boundary={response_boundary}", "\r\n".join(lines).encode()
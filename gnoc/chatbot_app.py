@@ -1,27 +1,99 @@
-import json
 import os
+import uuid
 import streamlit as st
 
 from notification_manager_agent import NotificationService
 from incident_manager_agent import IncidentManager
-from priority_identification_agent import PriorityIdentificationAgent
+from priority_agent_pool import PriorityAgentPool
+from incident_pipeline import IncidentPipeline
+from incident_index import IncidentIndex
+from prioritization_result import PrioritizationResult
+from tracing import tracer
+
+@st.cache_resource
+def get_priority_agent_pool():
+  """
+  Returns the warm prioritization agent pool shared by every Streamlit session of this process.
+  """
+  return PriorityAgentPool()
 
-def extract_tool_responses(chat_result):
+@st.cache_resource
+def get_incident_manager():
+  """
+  Returns the IncidentManager shared by every Streamlit session; its Jira, Statuspage and Google clients stay
+  authenticated across incidents, and it keeps spare whiteboards ready.
   """
-  Extracts tool_responses from a given ChatResult object.
+  return IncidentManager().start()
 
-  Args:
-    chat_result: A ChatResult object containing chat history.
+@st.cache_resource
+def get_notification_service():
+  """
+  Returns the NotificationService shared by every Streamlit session; its Gmail and Calendar clients stay
+  authenticated across incidents.
+  """
+  return NotificationService()
 
-  Returns:
-    A list of tool_responses.
+@st.cache_resource
+def get_incident_index():
+  """
+  Returns the index of open incidents shared by every Streamlit session, used to attach duplicate reports.
   """
+  return IncidentIndex()
 
-  tool_responses = []
-  for message in chat_result.chat_history:
-    if 'tool_responses' in message:
-      tool_responses.extend(message['tool_responses'])
-  return tool_responses
+# Shown instead of the 👍 button of a record no incident can be declared for
+NOT_ACTIONABLE_INFO = ("No incident can be declared: the issue does not appear to be related to any GP product. "
+                       "Use 👎 to add more details.")
+
+def declare_incident(message_id):
+  """
+  Runs the incident pipeline for the prioritization record of a message and records the Jira, Status IO and White
+  Board links in the chat history. A message is declared at most once per session. Stages that failed or timed out
+  are reported to the user instead of aborting the whole declaration.
+  """
+  result = st.session_state.prioritizations.get(message_id)
+  if result is None or not result.actionable or message_id in st.session_state.declared:
+    return None
+  st.session_state.declared.add(message_id)
+  try:
+    report = IncidentPipeline(get_incident_manager(), get_notification_service(),
+                              incident_index=get_incident_index()).run(result)
+  except Exception:
+    st.session_state.declared.discard(message_id)
+    raise
+  if report.duplicate_of:
+    st.info(f"This issue matches the open incident {report.duplicate_of}; your report has been attached to it.")
+  jira = report.result("jira", {})
+  status_page = report.result("status_page", {})
+  white_board = report.result("white_board", {})
+
+  assistant_response = ""
+  if jira:
+    assistant_response = assistant_response + f"<b>Jira Information:</b> <a href='{jira.get("jira_link")}'>{jira.get("jira_id")}</a>\n\n"
+  if status_page:
+    assistant_response = assistant_response + f"<b>Status IO Page Information:</b> <a href='{status_page.get("status_io_page_link")}'>Status IO Page</a>\n\n"
+  if white_board:
+    assistant_response = assistant_response + f"<b>White Board Information:</b> <a href='{white_board.get("white_board_link")}'>White Board</a>\n\n"
+  if assistant_response:
+    st.session_state.messages.append({"id": uuid.uuid4().hex, "role": "assistant", "content": assistant_response})
+  for name, outcome in report.failed_stages.items():
+    st.error(f"Incident step `{name}` {outcome.status.replace("_", " ")}: {outcome.error}")
+  if report.trace_id and report.total_seconds >= tracer.slow_seconds:
+    with st.expander(f"Declaring the incident took {report.total_seconds:.0f}s, see where the time went"):
+      st.code(tracer.breakdown(report.trace_id))
+  return report
+
+PRIORITIZATION_LABELS = [("summary", "Issue Summary"), ("description", "Issue Description"),
+                         ("priority", "Issue Priority"), ("segment", "Issue Segment"), ("product", "Issue Product"),
+                         ("impact", "Issue Impact"), ("urgency", "Issue Urgency")]
+
+def render_prioritization(result):
+  """
+  Renders a (possibly partial) prioritization result; fields that have not arrived yet are shown as an ellipsis.
+  """
+  assistant_response = ""
+  for name, label in PRIORITIZATION_LABELS:
+    assistant_response = assistant_response + f"<b>{label}:</b> {result.get(name, "…")}\n\n"
+  return assistant_response
 
 image_path = f"{os.getcwd()}/gp.png"
 i = 0
@@ -46,89 +118,33 @@ if "messages" not in st.session_state:
 if "feedback" not in st.session_state:
     st.session_state["feedback"] = []
 
+# Prioritization records keyed by the id of the assistant message displaying them
+if "prioritizations" not in st.session_state:
+    st.session_state["prioritizations"] = {}
+
+if "declared" not in st.session_state:
+    st.session_state["declared"] = set()
+
 # Display chat messages from history on app rerun
 for i, message in enumerate(st.session_state["messages"]):
     with st.chat_message(message["role"]):
         st.markdown(message["content"], unsafe_allow_html=True)
         # Display feedback buttons for assistant messages
-        if message["role"] == "assistant":
-            if "Jira Information" not in message["content"]:
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("👍", key=f"thumbs_up_{i}"):
-                        st.session_state.feedback.append({"message_index": i, "feedback": "positive"})
-                        st.success("Thanks for your feedback!")
-                        assistant_message = message["content"]
-                        if "This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.".lower() not in assistant_message.lower():
-                            assistant_messages = assistant_message.split("\n\n")
-                            summary = assistant_messages[0].split("</b>")[1].strip()
-                            description = assistant_messages[1].split("</b>")[1].strip()
-                            priority = assistant_messages[2].split("</b>")[1].strip()
-                            segment = assistant_messages[3].split("</b>")[1].strip()
-                            product = assistant_messages[4].split("</b>")[1].strip()
-                            impact = assistant_messages[5].split("</b>")[1].strip()
-                            urgency = assistant_messages[6].split("</b>")[1].strip()
-                            # jira_creator = IncidentManager()
-                            incident_manager = IncidentManager()
-                            jira_response = incident_manager.initiate_jira_ticket_creation(priority, summary, description)
-                            jira_extracted_responses = json.loads(
-                            extract_tool_responses(jira_response)[0].get("content"))
-                            jira_id = jira_extracted_responses.get("jira_id")
-                            jira_link = f"https://rahuluraneai.atlassian.net/browse/{jira_id}"
-
-                            white_board_response = incident_manager.initiate_white_board_creation(jira_id, summary,
-                                                                                                  segment, product)
-                            white_board_extracted_responses = json.loads(
-                                extract_tool_responses(white_board_response)[0].get("content"))
-                            white_board_link = white_board_extracted_responses.get("white_board_link")
-
-                            status_page_response = incident_manager.initiate_status_page_creation(jira_id, priority,
-                                                                                                  summary, description)
-                            status_page_extracted_responses = json.loads(
-                                extract_tool_responses(status_page_response)[0].get("content"))
-                            status_io_page_link = status_page_extracted_responses.get("status_io_page_link")
-
-                            # result = main.kickoff(summary, description, priority, segment, product, impact, urgency)
-                            assistant_response = ""
-                            assistant_response = assistant_response + f"<b>Jira Information:</b> <a href='{jira_link}'>{jira_id}</a>\n\n"
-                            assistant_response = assistant_response + f"<b>Status IO Page Information:</b> <a href='{status_io_page_link}'>Status IO Page</a>\n\n"
-                            assistant_response = assistant_response + f"<b>White Board Information:</b> <a href='{white_board_link}'>White Board</a>\n\n"
-                            st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-
-                            # Notification service
-                            notification_service = NotificationService()
-
-                            # Insensitive email
-                            email_insensitive_content = notification_service.generate_insensitive_email(description, segment, product, priority, impact,
-                                                                       jira_id, jira_link, status_io_page_link,
-                                                                       white_board_link)
-                            print(f"email_insensitive_content:- {email_insensitive_content}")
-                            print(f"email_insensitive_content :: subject:- {email_insensitive_content.get("subject")}")
-                            print(f"email_insensitive_content :: body:- {email_insensitive_content.get("body")}")
-                            notification_service.insensitive_notification_tool(email_insensitive_content.get("subject"), email_insensitive_content.get("body"))
-
-                            # Sensitive email
-                            email_sensitive_content = notification_service.generate_sensitive_email(description,
-                                                                                                        segment,
-                                                                                                        product,
-                                                                                                        priority,
-                                                                                                        impact,
-                                                                                                        jira_id,
-                                                                                                        jira_link,
-                                                                                                        status_io_page_link,
-                                                                                                        white_board_link)
-                            print(f"email_sensitive_content:- {email_sensitive_content}")
-                            print(f"email_sensitive_content :: subject:- {email_sensitive_content.get("subject")}")
-                            print(f"email_sensitive_content :: body:- {email_sensitive_content.get("body")}")
-                            notification_service.sensitive_notification_tool(
-                                email_sensitive_content.get("subject"), email_sensitive_content.get("body"))
-
-                            continue
-                with col2:
-                    if st.button("👎", key=f"thumbs_down_{i}"):
-                        st.session_state.feedback.append({"message_index": i, "feedback": "negative"})
-                        st.warning("Thanks for your feedback!\n\nPlease provide more details so that the system can process your request.")
-                        continue
+        if message.get("id") in st.session_state.prioritizations:
+            col1, col2 = st.columns(2)
+            with col1:
+                if not st.session_state.prioritizations[message["id"]].actionable:
+                    st.info(NOT_ACTIONABLE_INFO)
+                elif st.button("👍", key=f"thumbs_up_{i}"):
+                    st.session_state.feedback.append({"message_index": i, "feedback": "positive"})
+                    st.success("Thanks for your feedback!")
+                    declare_incident(message["id"])
+                    continue
+            with col2:
+                if st.button("👎", key=f"thumbs_down_{i}"):
+                    st.session_state.feedback.append({"message_index": i, "feedback": "negative"})
+                    st.warning("Thanks for your feedback!\n\nPlease provide more details so that the system can process your request.")
+                    continue
 
 # React to user input
 if user_input := st.chat_input("Please enter your GNOC related query..."):
@@ -145,106 +161,57 @@ if user_input := st.chat_input("Please enter your GNOC related query..."):
         break
 
     # Use the last_user_message if it exists
-    if last_user_message and feedback_type == "negative":
+    follow_up = bool(last_user_message and feedback_type == "negative")
+    if follow_up:
         user_input = last_user_message + "\n" + user_input
 
     # Display user message in the chat message container
     with st.chat_message("user"):
         st.markdown(user_input, unsafe_allow_html=True)
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.messages.append({"id": uuid.uuid4().hex, "role": "user", "content": user_input})
     initial_task = f"""Please prioritize the below issue reported by user.
     Issue:- {user_input}
     """
-    result = PriorityIdentificationAgent().prioritize_issue(user_input)
-    # Append bot message
-    assistant_response = ""
-    # if result.get("description").lower() == "This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.".lower():
-    if result is None:
-        assistant_response = assistant_response + f"<b>Issue Description:</b> <span style='color:red;'>This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.</span>"
-    else:
-        assistant_response = assistant_response + f"<b>Issue Summary:</b> {result.get("summary")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Description:</b> {result.get("description")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Priority:</b> {result.get("priority")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Segment:</b> {result.get("segment")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Product:</b> {result.get("product")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Impact:</b> {result.get("impact")}\n\n"
-        assistant_response = assistant_response + f"<b>Issue Urgency:</b> {result.get("urgency")}\n\n"
-
     # Display assistant response in the chat message containers
     with st.chat_message("assistant"):
-        st.markdown(assistant_response, unsafe_allow_html=True)
-        if "Jira Information" not in assistant_response:
+        # Fields are rendered as soon as they are streamed, pending ones show a placeholder
+        response_placeholder = st.empty()
+        streamed_fields = {}
+
+        def render_field(name, value):
+            streamed_fields[name] = value
+            response_placeholder.markdown(render_prioritization(streamed_fields), unsafe_allow_html=True)
+
+        # A correction after 👎 is applied by the agent, the rules and the cache would ignore it
+        result = get_priority_agent_pool().prioritize_issue_stream(user_input, render_field, follow_up=follow_up)
+        message_id = uuid.uuid4().hex
+        # Append bot message
+        assistant_response = ""
+        # if result.get("description").lower() == "This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.".lower():
+        if result is None:
+            assistant_response = assistant_response + f"<b>Issue Description:</b> <span style='color:red;'>This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.</span>"
+        else:
+            record = PrioritizationResult.from_dict(result)
+            st.session_state.prioritizations[message_id] = record
+            assistant_response = render_prioritization(record.to_dict())
+        response_placeholder.markdown(assistant_response, unsafe_allow_html=True)
+        if message_id in st.session_state.prioritizations:
             i += 1
             col1, col2 = st.columns(2)
             with col1:
-                if st.button("👍", key=f"thumbs_up_{i}"):
+                if not st.session_state.prioritizations[message_id].actionable:
+                    st.info(NOT_ACTIONABLE_INFO)
+                elif st.button("👍", key=f"thumbs_up_{i}"):
                     st.session_state.feedback.append({"message_index": i, "feedback": "positive"})
                     st.success("Thanks for your feedback!")
-                    assistant_message = assistant_response
-                    if "This issue does not appear to be related to any GP products, and unfortunately, I am unable to proceed with further action. Thank you for your understanding.".lower() not in assistant_message.lower():
-                        assistant_messages = assistant_message.split("\n\n")
-                        summary = assistant_messages[0].split("</b>")[1].strip()
-                        description = assistant_messages[1].split("</b>")[1].strip()
-                        priority = assistant_messages[2].split("</b>")[1].strip()
-                        segment = assistant_messages[3].split("</b>")[1].strip()
-                        product = assistant_messages[4].split("</b>")[1].strip()
-                        impact = assistant_messages[5].split("</b>")[1].strip()
-                        urgency = assistant_messages[6].split("</b>")[1].strip()
-                        # jira_creator = JiraTicketCreator()
-                        incident_manager = IncidentManager()
-                        # jira_response = jira_creator.create_ticket(priority, summary, description)
-                        jira_response = incident_manager.initiate_jira_ticket_creation(priority, summary, description)
-                        jira_extracted_responses = json.loads(extract_tool_responses(jira_response)[0].get("content"))
-                        jira_id = jira_extracted_responses.get("jira_id")
-                        jira_link = f"https://rahuluraneai.atlassian.net/browse/{jira_id}"
-
-                        white_board_response = incident_manager.initiate_white_board_creation(jira_id, summary, segment, product)
-                        white_board_extracted_responses = json.loads(extract_tool_responses(white_board_response)[0].get("content"))
-                        white_board_link = white_board_extracted_responses.get("white_board_link")
-
-                        status_page_response = incident_manager.initiate_status_page_creation(jira_id, priority,
-                                                                                              summary, description)
-                        status_page_extracted_responses = json.loads(extract_tool_responses(status_page_response)[0].get("content"))
-                        status_io_page_link = status_page_extracted_responses.get("status_io_page_link")
-
-                        assistant_response = ""
-                        assistant_response = assistant_response + f"<b>Jira Information:</b> <a href='{jira_link}'>{jira_id}</a>\n\n"
-                        assistant_response = assistant_response + f"<b>Status IO Page Information:</b> <a href='{status_io_page_link}'>Status IO Page</a>\n\n"
-                        assistant_response = assistant_response + f"<b>White Board Information:</b> <a href='{white_board_link}'>White Board</a>\n\n"
-                        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-
-                        # Notification service
-                        notification_service = NotificationService()
-
-                        # Insensitive email
-                        email_insensitive_content = notification_service.generate_insensitive_email(description,
-                                                                                                    segment, product,
-                                                                                                    priority, impact,
-                                                                                                    jira_id, jira_link,
-                                                                                                    status_io_page_link,
-                                                                                                    white_board_link)
-                        notification_service.insensitive_notification_tool(email_insensitive_content.get("subject"),
-                                                                           email_insensitive_content.get("body"))
-
-                        # Sensitive email
-                        email_sensitive_content = notification_service.generate_sensitive_email(description,
-                                                                                                segment,
-                                                                                                product,
-                                                                                                priority,
-                                                                                                impact,
-                                                                                                jira_id,
-                                                                                                jira_link,
-                                                                                                status_io_page_link,
-                                                                                                white_board_link)
-                        notification_service.sensitive_notification_tool(
-                            email_sensitive_content.get("subject"), email_sensitive_content.get("body"))
+                    declare_incident(message_id)
             with col2:
                 if st.button("👎", key=f"thumbs_down_{i}"):
                     st.session_state.feedback.append({"message_index": i, "feedback": "negative"})
                     st.warning(
                         "Thanks for your feedback!\n\nPlease provide more details so that the system can process your request.")
     # Add assistant response to the chat history
-    st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+    st.session_state.messages.append({"id": message_id, "role": "assistant", "content": assistant_response})
 
 print(f"\n\n#### execution completed ####\n\n")
\ No newline at end of file
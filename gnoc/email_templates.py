@@ -0,0 +1,59 @@
+import html
+from string import Template
+
+# Compiled once at import; rendering is a dict lookup per placeholder
+SUBJECT_TEMPLATES = {
+    "insensitive": Template("$priority Incident $jira_id: $product issue in the $segment segment"),
+    "sensitive": Template("[Restricted] $priority Incident $jira_id: $product issue in the $segment segment"),
+}
+BODY_TEMPLATE = Template("""<p>Dear Team,</p>
+$narrative
+<table border="1" cellpadding="6" cellspacing="0">
+<tr><td><b>Segment</b></td><td>$segment</td></tr>
+<tr><td><b>Product</b></td><td>$product</td></tr>
+<tr><td><b>Priority</b></td><td>$priority</td></tr>
+<tr><td><b>Impact</b></td><td>$impact</td></tr>
+</table>
+<p>Jira: <a href="$jira_link">$jira_id</a><br>
+Status page: <a href="$status_io_link">Status IO Page</a><br>
+White board: <a href="$white_board_link">White Board</a></p>
+<p>Best Regards,<br>
+AI Team,<br>
+GNOC Project</p>
+""")
+FALLBACK_NARRATIVES = {
+    "insensitive": Template("We are investigating an issue affecting $product in the $segment segment. It has been "
+                            "classified as $priority with $impact impact, and updates will follow on the status page."),
+    "sensitive": Template("$description"),
+}
+FIELDS = ("segment", "product", "priority", "impact", "jira_id", "jira_link", "status_io_link", "white_board_link")
+
+
+def narrative_html(narrative):
+    """
+    Escapes a plain-text narrative and turns its blank-line separated paragraphs into <p> elements.
+    """
+    paragraphs = [" ".join(paragraph.split()) for paragraph in narrative.strip().split("\n\n")]
+    return "\n".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs if paragraph)
+
+
+def fallback_narrative(variant, **fields):
+    """
+    The narrative used when the LLM is skipped or did not answer; only the sensitive one quotes the description.
+    """
+    return FALLBACK_NARRATIVES[variant].substitute({name: str(value) for name, value in fields.items()})
+
+
+def render_email(variant, narrative, **fields):
+    """
+    Renders the `insensitive` or `sensitive` email around a plain-text `narrative`; every other part of the email
+    comes from `fields` (see `FIELDS`).
+
+    Returns:
+      A dict with the `subject` and the HTML `body`.
+    """
+    values = {name: html.escape(str(fields[name])) for name in FIELDS}
+    return {
+        "subject": SUBJECT_TEMPLATES[variant].substitute({name: str(fields[name]) for name in FIELDS}),
+        "body": BODY_TEMPLATE.substitute(values, narrative=narrative_html(narrative)),
+    }
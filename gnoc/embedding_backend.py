@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from tracing import span
+
+DEFAULT_LOCAL_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# One EmbeddingCache per (directory, model) per process, see `shared_embedding_cache`
+_embedding_caches = {}
+_embedding_caches_lock = threading.Lock()
+
+
+class LocalEmbeddingBackend:
+    """
+    Embeds texts with a sentence_transformers model running locally, in batches of `batch_size`.
+    """
+
+    def __init__(self, model_name=DEFAULT_LOCAL_EMBEDDING_MODEL, batch_size=64, device="cpu"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_id = f"local/{model_name}"
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def embed(self, texts):
+        return np.asarray(self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                            show_progress_bar=False), dtype=np.float32)
+
+
+class RemoteEmbeddingBackend:
+    """
+    Embeds texts with a Google embedding model (e.g. `text-embedding-004`) through the Gemini API.
+    """
+
+    def __init__(self, model_name="text-embedding-004", batch_size=100):
+        from chromadb.utils import embedding_functions
+
+        self.model_id = f"google/{model_name}"
+        self.batch_size = batch_size
+        self.embedding_function = embedding_functions.GoogleGenerativeAiEmbeddingFunction(
+            api_key=os.getenv("GOOGLE_API_KEY"), model_name=f"models/{model_name}")
+
+    def embed(self, texts):
+        texts = list(texts)
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with span("http.embeddings", model=self.model_id, texts=len(batch),
+                      payload_bytes=sum(len(text.encode()) for text in batch)):
+                embeddings.extend(self.embedding_function(batch))
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class OpenAIEmbeddingBackend:
+    """
+    Embeds texts through an OpenAI-compatible `/embeddings` endpoint at `base_url` (EMBEDDING_BASE_URL).
+    """
+
+    def __init__(self, model_name, base_url=None, batch_size=100):
+        from openai import OpenAI
+
+        self.model_name = model_name
+        self.model_id = f"openai/{model_name}"
+        self.batch_size = batch_size
+        self.client = OpenAI(base_url=base_url or os.getenv("EMBEDDING_BASE_URL"),
+                             api_key=os.getenv("EMBEDDING_API_KEY") or os.getenv("OPENAI_API_KEY") or "none")
+
+    def embed(self, texts):
+        texts = list(texts)
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with span("http.embeddings", model=self.model_id, texts=len(batch),
+                      payload_bytes=sum(len(text.encode()) for text in batch)):
+                response = self.client.embeddings.create(model=self.model_name, input=batch)
+            embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """
+    A persistent embedding cache for one model.
+
+    Vectors are stored in a memory-mapped float32 matrix (`<model>.f32`) that grows by doubling; the index file
+    (`<model>.index`) holds one content key per line, the line number being the matrix row. A vector is flushed
+    before its key is appended, so after a crash the index never points to a row that was not written. An instance
+    assumes it is the only writer of its files: within a process, get it from `shared_embedding_cache`; a cache
+    directory is meant to be written by one process at a time.
+    """
+
+    def __init__(self, cache_dir, model_id):
+        self.cache_dir = cache_dir
+        self.model_id = model_id
+        slug = model_id.replace("/", "--")
+        self.matrix_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.index_path = os.path.join(cache_dir, f"{slug}.index")
+        self.meta_path = os.path.join(cache_dir, f"{slug}.json")
+        self.dimension = None
+        self._matrix = None
+        self._rows = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, keys):
+        """
+        Returns a dict mapping the cached keys of `keys` to a copy of their vector.
+        """
+        with self._lock:
+            return {key: np.array(self._matrix[self._rows[key]]) for key in keys if key in self._rows}
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                with open(self.meta_path, "w") as meta_file:
+                    json.dump({"model_id": self.model_id, "dimension": self.dimension}, meta_file)
+            new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._rows]
+            if not new:
+                return
+            self._reserve(len(self._rows) + len(new))
+            first_row = len(self._rows)
+            for offset, (_, vector) in enumerate(new):
+                self._matrix[first_row + offset] = vector
+            self._matrix.flush()
+            with open(self.index_path, "a") as index_file:
+                index_file.write("".join(f"{key}\n" for key, _ in new))
+            for offset, (key, _) in enumerate(new):
+                self._rows[key] = first_row + offset
+
+    def _load(self):
+        try:
+            with open(self.meta_path, "r") as meta_file:
+                self.dimension = json.load(meta_file)["dimension"]
+        except (OSError, ValueError, KeyError):
+            return
+        if not os.path.exists(self.matrix_path):
+            return
+        capacity = os.path.getsize(self.matrix_path) // (4 * self.dimension)
+        if capacity:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+        try:
+            with open(self.index_path, "r") as index_file:
+                keys = [line.strip() for line in index_file]
+        except OSError:
+            keys = []
+        # A torn last line or rows beyond the matrix come from an interrupted write and are dropped
+        for row, key in enumerate(keys[:capacity]):
+            if len(key) == 64:
+                self._rows.setdefault(key, row)
+
+    def _reserve(self, rows):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(256, capacity * 2, rows)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.matrix_path, "ab") as matrix_file:
+            matrix_file.truncate(new_capacity * self.dimension * 4)
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                 shape=(new_capacity, self.dimension))
+
+
+def shared_embedding_cache(cache_dir, model_id):
+    """
+    Returns the process-wide `EmbeddingCache` of `model_id` under `cache_dir`, creating it on first use.
+    """
+    key = (os.path.abspath(cache_dir), model_id)
+    with _embedding_caches_lock:
+        if key not in _embedding_caches:
+            _embedding_caches[key] = EmbeddingCache(cache_dir, model_id)
+        return _embedding_caches[key]
+
+
+class CachedEmbeddingFunction:
+    """
+    A Chroma embedding function that serves repeated texts (chunks and queries) from an `EmbeddingCache` and
+    embeds only the texts it has never seen with its backend.
+    """
+
+    def __init__(self, backend, cache_dir=None):
+        self.backend = backend
+        self.model_id = backend.model_id
+        self.cache = shared_embedding_cache(cache_dir, backend.model_id) if cache_dir else None
+        self.metrics = {"hits": 0, "misses": 0}
+        self._metrics_lock = threading.Lock()
+
+    def __call__(self, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        with span("embedding", model=self.model_id, texts=len(texts)) as embedding_span:
+            if self.cache is None:
+                with self._metrics_lock:
+                    self.metrics["misses"] += len(texts)
+                embedding_span.set(misses=len(texts))
+                return [vector.tolist() for vector in self.backend.embed(texts)]
+
+            keys = [self.cache.key(text) for text in texts]
+            vectors = self.cache.get_many(keys)
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors:
+                    missing.setdefault(key, text)
+            if missing:
+                embeddings = self.backend.embed(list(missing.values()))
+                self.cache.put_many(list(missing), embeddings)
+                vectors.update(zip(missing, embeddings))
+            with self._metrics_lock:
+                self.metrics["hits"] += len(texts) - len(missing)
+                self.metrics["misses"] += len(missing)
+            embedding_span.set(misses=len(missing))
+            return [vectors[key].tolist() for key in keys]
+
+    def stats(self):
+        with self._metrics_lock:
+            return {**self.metrics, "model_id": self.model_id,
+                    "cached_vectors": len(self.cache) if self.cache is not None else 0}
+
+
+def build_embedding_function(embedding_model, backend=None, cache_dir=None):
+    """
+    Returns the Chroma embedding function used for both ingestion and retrieval.
+
+    The backend is `remote` (the Gemini API) for Google embedding models and `local` (sentence_transformers on CPU)
+    otherwise, unless EMBEDDING_BACKEND says differently; a local backend asked for a Google model uses
+    LOCAL_EMBEDDING_MODEL instead. The `openai` backend calls the OpenAI-compatible server at EMBEDDING_BASE_URL
+    with OPENAI_EMBEDDING_MODEL (or `embedding_model`). Embeddings are cached on disk under EMBEDDING_CACHE_DIR when
+    it is set.
+    """
+    backend = backend or os.getenv("EMBEDDING_BACKEND") or (
+        "remote" if embedding_model.startswith("text-embedding") else "local")
+    cache_dir = cache_dir or os.getenv("EMBEDDING_CACHE_DIR")
+    if backend == "remote":
+        return CachedEmbeddingFunction(RemoteEmbeddingBackend(embedding_model), cache_dir)
+    if backend == "local":
+        if embedding_model.startswith("text-embedding"):
+            embedding_model = os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_LOCAL_EMBEDDING_MODEL)
+        return CachedEmbeddingFunction(LocalEmbeddingBackend(embedding_model), cache_dir)
+    if backend == "openai":
+        return CachedEmbeddingFunction(
+            OpenAIEmbeddingBackend(os.getenv("OPENAI_EMBEDDING_MODEL", embedding_model)), cache_dir)
+    raise ValueError(f"Unknown embedding backend: {backend}")
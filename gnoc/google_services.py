@@ -0,0 +1,156 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build, build_from_document
+
+DEFAULT_REFRESH_MARGIN_SECONDS = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+DEFAULT_HTTP_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_HTTP_TIMEOUT_SECONDS", "30"))
+# Sends every API (and batch) request to another host, e.g. an emulator or a local benchmark server
+API_ROOT_URL = os.getenv("GOOGLE_API_ROOT_URL")
+
+
+def static_discovery_document(api, version):
+    """
+    Returns the discovery document bundled with googleapiclient for `api`/`version`, or None.
+    """
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:
+        return None
+    document = get_static_doc(api, version)
+    if not document:
+        return None
+    document = json.loads(document)
+    if API_ROOT_URL:
+        root_url = API_ROOT_URL.rstrip("/") + "/"
+        document.update(rootUrl=root_url, baseUrl=root_url + document.get("servicePath", ""))
+    return document
+
+
+class GoogleServiceCache:
+    """
+    Shares one set of Google credentials between the API services of a client and memoizes the services.
+
+    Credentials are loaded once by `credentials_factory` and refreshed only when they expire within
+    `refresh_margin` seconds. Discovery documents are parsed once per API/version; googleapiclient services (and
+    their httplib2 transports) are not thread-safe, so every thread gets its own service object built from the
+    cached document with its own authorized transport. Time spent loading credentials and building services is
+    recorded so `stats()` can show what the cache saves.
+    """
+
+    def __init__(self, name, credentials_factory, refresh_margin=DEFAULT_REFRESH_MARGIN_SECONDS,
+                 http_timeout=DEFAULT_HTTP_TIMEOUT_SECONDS, on_refresh=None):
+        self.name = name
+        self.credentials_factory = credentials_factory
+        self.refresh_margin = refresh_margin
+        self.http_timeout = http_timeout
+        self.on_refresh = on_refresh
+        self._credentials = None
+        self._credentials_generation = 0
+        self._documents = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.metrics = {"credential_loads": 0, "token_refreshes": 0, "service_builds": 0, "service_hits": 0,
+                        "credential_seconds": 0.0, "build_seconds": 0.0}
+
+    def credentials(self):
+        """
+        Returns the shared credentials, loading them on first use and refreshing them when they are about to expire.
+        """
+        with self._lock:
+            if self._credentials is None:
+                started = time.perf_counter()
+                self._credentials = self.credentials_factory()
+                self._credentials_generation += 1
+                self.metrics["credential_loads"] += 1
+                self.metrics["credential_seconds"] += time.perf_counter() - started
+            if self._expires_soon(self._credentials):
+                started = time.perf_counter()
+                self._credentials.refresh(Request())
+                self.metrics["token_refreshes"] += 1
+                self.metrics["credential_seconds"] += time.perf_counter() - started
+                if self.on_refresh is not None:
+                    self.on_refresh(self._credentials)
+            return self._credentials
+
+    def service(self, api, version):
+        """
+        Returns this thread's service object for `api`/`version`.
+        """
+        credentials = self.credentials()
+        services = self._thread_services()
+        cached = services.get((api, version))
+        if cached is not None and cached[0] == self._credentials_generation:
+            with self._lock:
+                self.metrics["service_hits"] += 1
+            return cached[1]
+
+        started = time.perf_counter()
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=self.http_timeout))
+        document = self._document(api, version)
+        if document is not None:
+            service = build_from_document(document, http=http)
+        else:
+            service = build(api, version, http=http, cache_discovery=False)
+        services[(api, version)] = (self._credentials_generation, service)
+        with self._lock:
+            self.metrics["service_builds"] += 1
+            self.metrics["build_seconds"] += time.perf_counter() - started
+        return service
+
+    @contextmanager
+    def lease(self, api, version):
+        """
+        Yields this thread's service for one unit of work; the service is rebuilt next time if that work raises.
+        """
+        try:
+            yield self.service(api, version)
+        except Exception:
+            self._thread_services().pop((api, version), None)
+            raise
+
+    def invalidate(self):
+        """
+        Drops the credentials; every service is rebuilt with freshly loaded credentials on next use.
+        """
+        with self._lock:
+            self._credentials = None
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        builds = max(metrics["service_builds"], 1)
+        loads = max(metrics["credential_loads"], 1)
+        # What every hit would have cost without the cache: one credential load and one service build
+        metrics["estimated_seconds_saved"] = metrics["service_hits"] * (
+            metrics["build_seconds"] / builds + metrics["credential_seconds"] / loads)
+        return {"name": self.name, **metrics}
+
+    def _thread_services(self):
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        return services
+
+    def _document(self, api, version):
+        with self._lock:
+            if (api, version) not in self._documents:
+                self._documents[(api, version)] = static_discovery_document(api, version)
+            return self._documents[(api, version)]
+
+    def _expires_soon(self, credentials):
+        if not credentials.valid:
+            return True
+        expiry = getattr(credentials, "expiry", None)
+        if expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds() < self.refresh_margin
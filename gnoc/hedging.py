@@ -0,0 +1,292 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from autogen import OpenAIWrapper
+from autogen.io import IOStream
+from autogen.oai.client import OpenAIClient
+
+from tracing import current_span
+
+
+class RequestHedger:
+    """
+    Runs a request and, if it has not answered by the hedge deadline, a duplicate of it, returning whichever
+    answers first.
+
+    The deadline adapts to the observed latency: it is the `percentile` (HEDGE_PERCENTILE, 0.95) of the last
+    `window` (HEDGE_WINDOW) answered requests, never below `min_delay` (HEDGE_MIN_DELAY_SECONDS), and
+    `initial_delay` (HEDGE_INITIAL_DELAY_SECONDS) until `min_samples` (HEDGE_MIN_SAMPLES) latencies were seen.
+    Hedges are limited by a budget: at most `budget_ratio` (HEDGE_BUDGET_RATIO) of the last `window` requests plus
+    `budget_burst` (HEDGE_BUDGET_BURST) may be hedged, so a slow upstream is not hit with twice the load. Hedges
+    still running count against the budget from the moment they are granted, so a burst of concurrent slow
+    requests cannot all be hedged before the first of them answers.
+
+    The blocking SDK call that loses the race cannot be interrupted; it is abandoned on a worker thread and its
+    answer dropped.
+    """
+
+    def __init__(self, name, percentile=None, window=None, min_samples=None, initial_delay=None, min_delay=None,
+                 budget_ratio=None, budget_burst=None, max_workers=None):
+        self.name = name
+        self.percentile = percentile or float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+        self.window = window or int(os.getenv("HEDGE_WINDOW", "200"))
+        self.min_samples = min_samples or int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        self.initial_delay = initial_delay or float(os.getenv("HEDGE_INITIAL_DELAY_SECONDS", "15"))
+        self.min_delay = min_delay if min_delay is not None else float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1"))
+        self.budget_ratio = budget_ratio if budget_ratio is not None else float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+        self.budget_burst = budget_burst if budget_burst is not None else int(os.getenv("HEDGE_BUDGET_BURST", "3"))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or int(os.getenv("HEDGE_MAX_WORKERS", "16")),
+                                            thread_name_prefix=f"hedge-{name}")
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.window)
+        self._hedged = deque(maxlen=self.window)
+        self._hedges_in_flight = 0
+        self.metrics = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0, "failed": 0, "cached": 0}
+
+    def deadline(self):
+        """
+        Returns how long to wait for the first request before hedging it.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(self._latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def _allow_hedge(self):
+        with self._lock:
+            if sum(self._hedged) + self._hedges_in_flight < self.budget_ratio * len(self._hedged) + self.budget_burst:
+                self._hedges_in_flight += 1
+                return True
+            self.metrics["budget_denied"] += 1
+            return False
+
+    def call(self, primary, hedge, cached=None):
+        """
+        Calls `primary()` and, past the deadline and within budget, `hedge()` too; returns the first answer
+        together with whether the hedge produced it. Fails only when every request that was started failed.
+
+        `cached(answer)` tells whether an answer came from a cache; those neither feed the latency window nor use
+        up the hedge budget, which are about the upstream's behaviour.
+        """
+        started = time.perf_counter()
+        deadline = self.deadline()
+        # The requests run in copies of the caller's context so their spans stay in the caller's trace
+        futures = {self._executor.submit(contextvars.copy_context().run, primary): "primary"}
+        done, _ = wait(futures, timeout=deadline)
+        hedged = not done and self._allow_hedge()
+        if hedged:
+            futures[self._executor.submit(contextvars.copy_context().run, hedge)] = "hedge"
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                seconds = time.perf_counter() - started
+                winner = futures[future]
+                if cached is not None and cached(future.result()):
+                    with self._lock:
+                        self.metrics["cached"] += 1
+                        self._hedges_in_flight -= hedged
+                    return future.result(), winner == "hedge"
+                self._record(seconds, hedged, winner == "hedge", failed=False)
+                span = current_span()
+                if span is not None and hedged:
+                    span.set(hedged=True, hedge_winner=winner, hedge_deadline_seconds=round(deadline, 3))
+                return future.result(), winner == "hedge"
+        self._record(time.perf_counter() - started, hedged, False, failed=True)
+        raise error
+
+    def _record(self, seconds, hedged, hedge_won, failed):
+        with self._lock:
+            self.metrics["requests"] += 1
+            self.metrics["hedged"] += hedged
+            self.metrics["hedge_wins"] += hedge_won
+            self.metrics["failed"] += failed
+            self._hedges_in_flight -= hedged
+            self._hedged.append(hedged)
+            if not failed:
+                self._latencies.append(seconds)
+
+    def stats(self):
+        deadline = self.deadline()
+        with self._lock:
+            requests = self.metrics["requests"]
+            return {**self.metrics, "name": self.name, "deadline_seconds": deadline,
+                    "hedges_in_flight": self._hedges_in_flight,
+                    "hedge_rate": self.metrics["hedged"] / requests if requests else 0.0}
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name):
+    """
+    Returns the process-wide hedger of `name`, so every agent of a pool shares its latency window and budget.
+    """
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = RequestHedger(name)
+        return _hedgers[name]
+
+
+class CacheHitRecorder:
+    """
+    Passes an autogen cache through, remembering whether a lookup was answered.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hit = False
+
+    def get(self, key, default=None):
+        value = self.cache.get(key, None)
+        if value is None:
+            return default
+        self.hit = True
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def close(self):
+        self.cache.close()
+
+    def __enter__(self):
+        self.cache.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cache.__exit__(exc_type, exc_value, traceback)
+
+
+class ChunkRelay:
+    """
+    The IOStream of one side of a hedged streaming completion: holds back everything the completion prints until
+    the side is bound to the caller's stream, which then gets it in order, and signals the first streamed chunk.
+    """
+
+    def __init__(self):
+        self.first_chunk = threading.Event()
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._output = None
+
+    def _emit(self, method, *args, **kwargs):
+        # Forwarded under the lock, so nothing overtakes the buffer while it is replayed
+        with self._lock:
+            if self._output is None:
+                self._buffer.append((method, args, kwargs))
+            else:
+                getattr(self._output, method)(*args, **kwargs)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self._emit("print", *objects, sep=sep, end=end, flush=flush)
+
+    def send(self, message):
+        self._emit("send", message)
+        if type(message).__name__ == "StreamMessage":
+            self.first_chunk.set()
+
+    def input(self, prompt="", *, password=False):
+        return ""
+
+    def bind(self, output):
+        with self._lock:
+            for method, args, kwargs in self._buffer:
+                getattr(output, method)(*args, **kwargs)
+            self._buffer = []
+            self._output = output
+
+
+class HedgingOpenAIWrapper(OpenAIWrapper):
+    """
+    An autogen `OpenAIWrapper` whose completions are hedged by a `RequestHedger`: the first request goes to the
+    config list as given, the hedge to the same list rotated by one entry, i.e. to the second entry first (or to
+    the only entry again, on a new connection).
+
+    Each side has its own wrapper, so the abandoned request cannot touch this wrapper's usage summary; only the
+    winning completion is added to it, and like in `OpenAIWrapper.create` only to the actual usage when it was not
+    served from the `cache` of the config. Each call passes that cache to the sides wrapped in a `CacheHitRecorder`.
+
+    A streamed completion (`stream` in the config) is hedged on its first chunk instead: when none has arrived by
+    the deadline a duplicate is started, and the side that streams first is bound to the caller's IOStream while
+    the other one streams into a `ChunkRelay` nobody reads. The hedger then measures the time to first chunk, so
+    streamed and plain completions should not share one.
+    """
+
+    def __init__(self, hedger, *, config_list=None, **base_config):
+        super().__init__(config_list=config_list, **base_config)
+        config_list = list(config_list or [])
+        self.hedger = hedger
+        self.stream = base_config.get("stream", False)
+        self.cache = base_config.pop("cache", None)
+        if self.cache is not None:
+            # Without a cache autogen would fall back to its legacy disk cache
+            base_config["cache_seed"] = None
+        self._primary = OpenAIWrapper(config_list=config_list, **base_config)
+        self._hedge = OpenAIWrapper(config_list=config_list[1:] + config_list[:1], **base_config)
+
+    def create(self, **config):
+        cache = config.pop("cache", None) or self.cache
+
+        def send(wrapper):
+            recorder = CacheHitRecorder(cache) if cache is not None else None
+            response = wrapper.create(cache=recorder, **config)
+            return response, recorder is not None and recorder.hit
+
+        if config.get("stream", self.stream):
+            response, cached = self._create_stream(send)
+        else:
+            (response, cached), _ = self.hedger.call(lambda: send(self._primary), lambda: send(self._hedge),
+                                                     cached=lambda answer: answer[1])
+        usage = OpenAIClient.get_usage(response)
+        self._update_usage(actual_usage=None if cached else usage, total_usage=usage)
+        return response
+
+    def _create_stream(self, send):
+        output = IOStream.get_default()
+
+        def start(wrapper):
+            """
+            Starts the completion on its own thread and returns once it streamed its first chunk or finished.
+            """
+            relay, completion = ChunkRelay(), Future()
+
+            def run():
+                with IOStream.set_default(relay):
+                    try:
+                        completion.set_result(send(wrapper))
+                    except Exception as e:
+                        completion.set_exception(e)
+                    finally:
+                        relay.first_chunk.set()
+
+            threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True,
+                             name=f"hedge-{self.hedger.name}-stream").start()
+            relay.first_chunk.wait()
+            if completion.done() and completion.exception() is not None:
+                raise completion.exception()
+            return relay, completion
+
+        # Cache hits answer without streaming, so they are done by the time they are returned
+        (relay, completion), _ = self.hedger.call(
+            lambda: start(self._primary), lambda: start(self._hedge),
+            cached=lambda answer: answer[1].done() and answer[1].result()[1])
+        relay.bind(output)
+        return completion.result()
+
+
+def hedger_stats():
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.name: hedger.stats() for hedger in hedgers}
@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+STOP_WORDS = frozenset(
+    "a an and are as at be been by for from has have in is it its of on or our over past please that the this to "
+    "was we were with issue issues customers customer unable".split())
+
+
+def issue_tokens(text):
+    """
+    Returns the set of discriminating word tokens of an issue report.
+    """
+    return frozenset(token for token in re.findall(r"[a-z0-9$%]+", text.lower())
+                     if token not in STOP_WORDS and len(token) > 1)
+
+
+def incident_bucket(segment, product):
+    return (segment or "").strip().lower(), (product or "").strip().lower()
+
+
+@dataclass
+class OpenIncident:
+    jira_id: str
+    segment: str
+    product: str
+    tokens: frozenset
+    opened_at: float
+    last_seen_at: float
+    links: dict = field(default_factory=dict)
+    reports: list = field(default_factory=list)
+    ready: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+class IncidentIndex:
+    """
+    Matches new issue reports against incidents that are still open so that one outage produces one Jira ticket,
+    one status page and one round of notifications.
+
+    Incidents are bucketed by segment/product and each bucket keeps an inverted index of issue tokens, so a lookup
+    only scores incidents sharing a discriminating token with the new report. A report matches when the Jaccard
+    similarity of the full token sets reaches `threshold` and the incident was last seen within `window_seconds`.
+    """
+
+    def __init__(self, window_seconds=None, threshold=None, wait_seconds=None):
+        self.window_seconds = window_seconds if window_seconds is not None else float(
+            os.getenv("INCIDENT_DEDUP_WINDOW_SECONDS", "3600"))
+        self.threshold = threshold if threshold is not None else float(os.getenv("INCIDENT_DEDUP_THRESHOLD", "0.5"))
+        # Unset, duplicates wait as long as the caller says the first report's declaration can take
+        env_wait = os.getenv("INCIDENT_DEDUP_WAIT_SECONDS")
+        self.wait_seconds = wait_seconds if wait_seconds is not None else float(env_wait) if env_wait else None
+        self._buckets = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._pending_counter = 0
+        self._pruned_at = time.monotonic()
+        self.metrics = {"lookups": 0, "matches": 0, "claims": 0, "expired": 0}
+
+    def claim(self, segment, product, text):
+        """
+        Atomically matches the report against open incidents or reserves a new incident for it.
+
+        Returns:
+          A tuple `(incident, created)`. When `created` is True the caller must declare the incident and then call
+          `resolve` (or `release` if the declaration failed). Otherwise the report was attached to the returned
+          incident, whose `jira_id` and `links` are available once `ready` is set.
+        """
+        tokens = issue_tokens(text)
+        bucket_key = incident_bucket(segment, product)
+        with self._lock:
+            self.metrics["lookups"] += 1
+            self._prune()
+            incident = self._best_match(bucket_key, tokens) if "na" not in bucket_key else None
+            if incident is not None:
+                incident.last_seen_at = time.monotonic()
+                incident.reports.append(text)
+                self.metrics["matches"] += 1
+                return incident, False
+
+            self._pending_counter += 1
+            now = time.monotonic()
+            incident = OpenIncident(jira_id=f"pending-{self._pending_counter}", segment=segment, product=product,
+                                    tokens=tokens, opened_at=now, last_seen_at=now, reports=[text])
+            self._add(bucket_key, incident)
+            self.metrics["claims"] += 1
+            return incident, True
+
+    def wait_until_ready(self, incident, timeout=None):
+        """
+        Blocks until the incident that a report was attached to has been declared; returns False on timeout or
+        when its declaration failed. `wait_seconds`, when configured, overrides the caller's `timeout`.
+        """
+        timeout = self.wait_seconds if self.wait_seconds is not None else timeout
+        return incident.ready.wait(timeout) and not incident.jira_id.startswith("pending-")
+
+    def resolve(self, incident, jira_id, links):
+        with self._lock:
+            bucket_key = incident_bucket(incident.segment, incident.product)
+            self._remove(bucket_key, incident)
+            incident.jira_id = jira_id
+            incident.links = dict(links)
+            self._add(bucket_key, incident)
+        incident.ready.set()
+
+    def release(self, incident):
+        with self._lock:
+            self._remove(incident_bucket(incident.segment, incident.product), incident)
+        incident.ready.set()
+
+    def close(self, jira_id):
+        with self._lock:
+            for bucket_key, incidents in self._buckets.items():
+                incident = incidents.get(jira_id)
+                if incident is not None:
+                    self._remove(bucket_key, incident)
+                    return incident
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "open_incidents": sum(len(incidents) for incidents in self._buckets.values())}
+
+    def _best_match(self, bucket_key, tokens):
+        incidents = self._buckets.get(bucket_key)
+        if not incidents or not tokens:
+            return None
+        postings = self._postings[bucket_key]
+        # Tokens shared by most open incidents of the bucket do not discriminate and would make lookups linear;
+        # they are skipped when picking candidates, unless the report has no other token in the bucket
+        common_limit = max(64, len(incidents) // 5)
+        posted = [postings[token] for token in tokens if token in postings]
+        candidates = set().union(*(jira_ids for jira_ids in posted if len(jira_ids) <= common_limit))
+        if not candidates and posted:
+            candidates = min(posted, key=len)
+
+        deadline = time.monotonic() - self.window_seconds
+        best, best_score = None, self.threshold
+        for jira_id in candidates:
+            incident = incidents[jira_id]
+            if incident.last_seen_at < deadline:
+                continue
+            score = len(tokens & incident.tokens) / len(tokens | incident.tokens)
+            if score >= best_score:
+                best, best_score = incident, score
+        return best
+
+    def _add(self, bucket_key, incident):
+        self._buckets.setdefault(bucket_key, {})[incident.jira_id] = incident
+        postings = self._postings.setdefault(bucket_key, {})
+        for token in incident.tokens:
+            postings.setdefault(token, set()).add(incident.jira_id)
+
+    def _remove(self, bucket_key, incident):
+        incidents = self._buckets.get(bucket_key, {})
+        if incidents.get(incident.jira_id) is not incident:
+            return
+        del incidents[incident.jira_id]
+        postings = self._postings[bucket_key]
+        for token in incident.tokens:
+            jira_ids = postings.get(token)
+            if jira_ids is not None:
+                jira_ids.discard(incident.jira_id)
+                if not jira_ids:
+                    del postings[token]
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < min(60.0, self.window_seconds):
+            return
+        self._pruned_at = now
+        deadline = now - self.window_seconds
+        for bucket_key, incidents in list(self._buckets.items()):
+            for incident in [incident for incident in incidents.values() if incident.last_seen_at < deadline]:
+                self._remove(bucket_key, incident)
+                self.metrics["expired"] += 1
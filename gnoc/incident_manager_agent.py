@@ -1,16 +1,53 @@
 import json
 import os
+import threading
+import time
 import requests
 from autogen import ConversableAgent, AssistantAgent, config_list_from_json
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 from jira import JIRA
 from google.oauth2.service_account import Credentials as ServiceCredential
+from managed_client import ManagedClient
+from google_services import GoogleServiceCache
+from whiteboard_pool import WhiteboardPool
+from tracing import span, traced
+from llm_usage import chat_usage
+from model_router import ModelRouter, usage_ledger
+from llm_cache import llm_cache
 
 load_dotenv()
 
+
+def extract_tool_responses(chat_result):
+    """
+    Extracts tool_responses from a given ChatResult object.
+
+    Args:
+      chat_result: A ChatResult object containing chat history.
+
+    Returns:
+      A list of tool_responses.
+    """
+    tool_responses = []
+    for message in chat_result.chat_history:
+        if 'tool_responses' in message:
+            tool_responses.extend(message['tool_responses'])
+    return tool_responses
+
+
+def parse_tool_result(content, tool_name):
+    """
+    Parses the JSON payload returned by one of the IncidentManager tools.
+    """
+    if not content:
+        raise ValueError(f"{tool_name} did not return a result")
+    return json.loads(content)
+
+
 class IncidentManager:
-    def __init__(self, model_config_file: str=None):
+    def __init__(self, model_config_file: str=None, execution_mode: str=None):
+        # "direct" calls the tools with the arguments we already have, "agentic" lets the LLM call them
+        self.execution_mode = execution_mode or os.getenv("INCIDENT_EXECUTION_MODE", "direct")
         self.status_page_user_proxy = None
         self.status_page_creation_assistant = None
         self.white_board_user_proxy = None
@@ -24,11 +61,9 @@ class IncidentManager:
             self.config_list = config_list_from_json(env_or_file=model_config_file)
 
         # self.config_list = config_list_from_json(env_or_file=os.path.join(os.getcwd(), "MODEL_CONFIG_LIST"))
-        self.llm_config = {
-            "config_list": self.config_list,
-            "temperature": 0.9,
-            "cache_seed": None
-        }
+        # The assistants only turn known values into tool arguments, the small model tier is enough
+        self.router = ModelRouter(self.config_list)
+        self.llm_config = self.router.llm_config("tool_arguments", temperature=0.9, cache_seed=None)
         self.scopes = [
             "https://www.googleapis.com/auth/documents.readonly",
             "https://www.googleapis.com/auth/documents",
@@ -38,13 +73,62 @@ class IncidentManager:
         self.status_page_url = os.getenv("STATUS_PAGE_URL")
         self.url = f"{self.status_page_url}/pages/cgdn7cbyygwm/incidents"
         self.template_doc_id = os.getenv("WHITEBOARD_TEMPLATE_DOC_ID")
-        self.jira = JIRA(options=self.jira_options, basic_auth=(os.getenv("FROM_EMAIL"), os.getenv("JIRA_API_TOKEN")))
         self.status_page_headers = {
             "Authorization": f"OAuth {os.getenv("STATUS_API_TOKEN")}",
             "Content-Type": "application/json"
         }
+        self.status_page_timeout = float(os.getenv("STATUS_PAGE_TIMEOUT_SECONDS", "10"))
+        # Authenticated clients are kept alive across incidents and recycled by their lifetime policy
+        self.jira_client = ManagedClient("jira", self.connect_jira, health_check=lambda jira: jira.myself(),
+                                         close=lambda jira: jira.close())
+        self.status_page_session = ManagedClient("status_page", self.create_status_page_session,
+                                                 close=lambda session: session.close())
+        # Docs and Drive share one service account token; services are memoized per thread
+        self.google_services = GoogleServiceCache("google_workspace", self.authenticate_google_api)
+        # Spare copies of the whiteboard template (WHITEBOARD_POOL_SIZE), cloned and shared in the background once
+        # a long-lived owner calls `start()`; until then white boards are cloned on demand
+        self.whiteboard_pool = WhiteboardPool(
+            self.google_services, self.template_doc_id,
+            lambda document_name, app_properties: self.clone_google_doc(self.template_doc_id, document_name,
+                                                                        app_properties)[0])
+        # The autogen agents keep chat history, so each agent pair runs one chat at a time
+        self.chat_locks = {"jira": threading.Lock(), "white_board": threading.Lock(), "status_page": threading.Lock()}
         self.setup_agents()
 
+    def start(self):
+        """
+        Starts keeping spare whiteboards ready. Only long-lived owners should call it: the pool clones documents in
+        the background and leaves its spares on Drive for the next process to adopt.
+        """
+        self.whiteboard_pool.start()
+        return self
+
+    def stop(self):
+        self.whiteboard_pool.stop()
+
+    @property
+    def jira(self):
+        return self.jira_client.get()
+
+    def connect_jira(self):
+        return JIRA(options=self.jira_options, basic_auth=(os.getenv("FROM_EMAIL"), os.getenv("JIRA_API_TOKEN")))
+
+    def create_status_page_session(self):
+        session = requests.Session()
+        session.headers.update(self.status_page_headers)
+        return session
+
+    def client_stats(self):
+        return [self.jira_client.stats(), self.status_page_session.stats(), self.google_services.stats(),
+                self.whiteboard_pool.stats()]
+
+    def assistant_llm_config(self, name):
+        """
+        Returns the `llm_config` of the assistant `name`: the tool argument config with the assistant's view of the
+        shared LLM cache, so a replayed incident reuses the tool call instead of asking the model again.
+        """
+        return {**self.llm_config, **llm_cache.cache_config(name)}
+
     def setup_agents(self):
         self.jira_ticket_creation_assistant = AssistantAgent(
             name="JiraTicketCreationAssistant",
@@ -52,7 +136,7 @@ class IncidentManager:
                 "You are a helpful AI Jira ticket creator. Use the function `create_jira_ticket` "
                 "with the parameters `priority`, `summary`, and `description`. Return 'TERMINATE' when done."
             ),
-            llm_config=self.llm_config,
+            llm_config=self.assistant_llm_config("JiraTicketCreationAssistant"),
             max_consecutive_auto_reply=1
         )
         self.jira_user_proxy = ConversableAgent(
@@ -69,7 +153,7 @@ class IncidentManager:
                 "with the parameters `jira_id`, `summary`, `segment`, and `product`. "
                 "Return 'TERMINATE' when done."
             ),
-            llm_config=self.llm_config,
+            llm_config=self.assistant_llm_config("WhiteBoardCreationAssistant"),
             max_consecutive_auto_reply=1
         )
         self.white_board_user_proxy = ConversableAgent(
@@ -85,7 +169,7 @@ class IncidentManager:
                 "You are a helpful AI status page creator. Use the function `create_status_page` "
                 "with the parameters `jira_id`, `priority`, `summary`, and `description`."
             ),
-            llm_config=self.llm_config,
+            llm_config=self.assistant_llm_config("StatusPageCreationAssistant"),
             max_consecutive_auto_reply=1
         )
         self.status_page_user_proxy = ConversableAgent(
@@ -103,6 +187,7 @@ class IncidentManager:
         self.white_board_user_proxy.register_for_execution(name="create_white_board")(self.create_white_board)
         self.status_page_user_proxy.register_for_execution(name="create_status_page")(self.create_status_page)
 
+    @traced("tool.create_jira_ticket")
     def create_jira_ticket(self, priority: str, summary: str, description: str) -> str:
         issue_data = {
             'project': {'id': '10000'},
@@ -111,7 +196,9 @@ class IncidentManager:
             'issuetype': {'name': self.issue_type}
         }
         try:
-            jira_response = self.jira.create_issue(fields=issue_data)
+            with span("http.jira.create_issue", payload_bytes=len(json.dumps(issue_data).encode())), \
+                    self.jira_client.lease() as jira:
+                jira_response = jira.create_issue(fields=issue_data)
             return json.dumps(
                 {"jira_id": jira_response.key, "priority": priority, "summary": summary, "description": description},
                 indent=4)
@@ -119,39 +206,72 @@ class IncidentManager:
             print(f"Failed to create Jira ticket: {e}")
             return ""
 
+    @traced("tool.create_white_board")
     def create_white_board(self, jira_id: str, summary: str, segment: str, product: str) -> str:
         replacements = {"ICD_NUMER": jira_id, "ISSUE_DESCRIPTION": summary, "IMPACTED_SEGMENT": segment,
                         "IM_IMPACTED_SERVICE": product}
         document_name = f"{jira_id} - {summary}"
-        new_document_id, document_link = self.fetch_clone_and_replace(self.template_doc_id, replacements, document_name)
+        started = time.perf_counter()
+        spare_document_id = self.whiteboard_pool.take()
+        if spare_document_id:
+            # A pre-cloned, already shared copy only needs its name and placeholders
+            try:
+                if self.whiteboard_pool.claim(spare_document_id, document_name):
+                    self.replace_placeholders(spare_document_id, replacements)
+                else:
+                    print(f"Spare whiteboard {spare_document_id} was claimed by another process, cloning the "
+                          f"template instead")
+                    spare_document_id = None
+            except Exception as e:
+                print(f"Failed to use spare whiteboard {spare_document_id}, cloning the template instead: {e}")
+                spare_document_id = None
+        if spare_document_id:
+            new_document_id, document_link = spare_document_id, self.document_link(spare_document_id)
+        else:
+            new_document_id, document_link = self.fetch_clone_and_replace(self.template_doc_id, replacements,
+                                                                          document_name)
         white_board_result_payload = {
             "white_board_id": new_document_id,
             "white_board_link": document_link
         }
-        print(f"white_board_result_payload:- {white_board_result_payload}")
+        print(f"white_board_result_payload:- {white_board_result_payload} in {time.perf_counter() - started:.2f}s "
+              f"({'pooled' if spare_document_id else 'cloned'}), google services:- {self.google_services.stats()}")
         return json.dumps(white_board_result_payload)
 
     def fetch_clone_and_replace(self, original_document_id, replacements, document_name):
-        credentials = self.authenticate_google_api()
-        docs_service = build('docs', 'v1', credentials=credentials)
         new_doc_id, document_link = self.clone_google_doc(original_document_id, document_name)
+        self.replace_placeholders(new_doc_id, replacements)
+        return new_doc_id, document_link
+
+    def replace_placeholders(self, document_id, replacements):
         replace_requests = [{'replaceAllText': {'containsText': {'text': key, 'matchCase': True}, 'replaceText': val}}
                             for key, val in replacements.items()]
-        docs_service.documents().batchUpdate(documentId=new_doc_id, body={'requests': replace_requests}).execute()
-        return new_doc_id, document_link
+        with span("http.docs.batch_update", payload_bytes=len(json.dumps(replace_requests).encode())), \
+                self.google_services.lease('docs', 'v1') as docs_service:
+            docs_service.documents().batchUpdate(documentId=document_id, body={'requests': replace_requests}).execute()
 
-    def clone_google_doc(self, source_doc_id, document_name):
-        credentials = self.authenticate_google_api()
-        drive_service = build('drive', 'v3', credentials=credentials)
-        copied_file = drive_service.files().copy(fileId=source_doc_id, body={'name': document_name}).execute()
-        cloned_doc_id = copied_file.get('id')
-        permissions = {'role': 'writer', 'type': 'anyone'}
-        drive_service.permissions().create(fileId=cloned_doc_id, body=permissions).execute()
-        file_link = f"https://drive.google.com/file/d/{cloned_doc_id}/view?usp=sharing"
-        return cloned_doc_id, file_link
+    @staticmethod
+    def document_link(document_id):
+        return f"https://drive.google.com/file/d/{document_id}/view?usp=sharing"
 
-    def create_status_page(self, jira_id: str, priority: str, summary: str, description: str) -> str:
-        incident_data = {
+    def clone_google_doc(self, source_doc_id, document_name, app_properties=None):
+        body = {'name': document_name}
+        if app_properties:
+            body['appProperties'] = app_properties
+        with self.google_services.lease('drive', 'v3') as drive_service:
+            with span("http.drive.copy"):
+                copied_file = drive_service.files().copy(fileId=source_doc_id, body=body).execute()
+            cloned_doc_id = copied_file.get('id')
+            permissions = {'role': 'writer', 'type': 'anyone'}
+            with span("http.drive.share"):
+                drive_service.permissions().create(fileId=cloned_doc_id, body=permissions).execute()
+        return cloned_doc_id, self.document_link(cloned_doc_id)
+
+    def status_page_incident(self, jira_id, priority, summary, description):
+        """
+        Returns the Statuspage API payload of the incident.
+        """
+        return {
             "incident": {
                 "name": f"{jira_id} - {priority} - {summary}",
                 "status": "investigating",
@@ -176,16 +296,27 @@ class IncidentManager:
             }
         }
 
+    @staticmethod
+    def status_page_result(response_json):
+        print(f"Response received while creating status page:-\n{response_json}")
+        status_page_result_payload = {
+            "status_io_id": response_json["id"],
+            "status_io_page_link": "https://manage.statuspage.io/pages/cgdn7cbyygwm/incidents/" + response_json["id"]
+        }
+        print(f"status_page_result_payload:- {status_page_result_payload}")
+        return status_page_result_payload
+
+    @traced("tool.create_status_page")
+    def create_status_page(self, jira_id: str, priority: str, summary: str, description: str) -> str:
+        incident_data = self.status_page_incident(jira_id, priority, summary, description)
         try:
-            response = requests.post(self.url, json=incident_data, headers=self.status_page_headers)
-            response.raise_for_status()  # Raise an error for HTTP errors
-            print(f"Response received while creating status page:-\n{response.json()}")
-            status_page_result_payload = {
-                "status_io_id": response.json()["id"],
-                "status_io_page_link": "https://manage.statuspage.io/pages/cgdn7cbyygwm/incidents/" + response.json()["id"]
-            }
-            print(f"status_page_result_payload:- {status_page_result_payload}")
-            return json.dumps(status_page_result_payload)
+            with span("http.status_page.create_incident",
+                      payload_bytes=len(json.dumps(incident_data).encode())) as http_span, \
+                    self.status_page_session.lease() as session:
+                response = session.post(self.url, json=incident_data, timeout=self.status_page_timeout)
+                http_span.set(status_code=response.status_code)
+                response.raise_for_status()  # Raise an error for HTTP errors
+            return json.dumps(self.status_page_result(response.json()))
 
         except requests.exceptions.RequestException as e:
             print(f"Failed to create status page: {e}")
@@ -197,17 +328,79 @@ class IncidentManager:
     def authenticate_google_api(self):
         return ServiceCredential.from_service_account_file(os.getenv("SERVICE_ACCOUNT_JSON"), scopes=self.scopes)
 
+    def run_jira_ticket_creation(self, priority, summary, description, execution_mode=None):
+        """
+        Creates the Jira ticket and returns the `create_jira_ticket` payload as a dict.
+        """
+        if self.use_agents(execution_mode):
+            chat_result = self.initiate_jira_ticket_creation(priority, summary, description)
+            return self.extract_tool_result(chat_result, "create_jira_ticket")
+        return parse_tool_result(self.create_jira_ticket(priority, summary, description), "create_jira_ticket")
+
+    def run_white_board_creation(self, jira_id, summary, segment, product, execution_mode=None):
+        """
+        Creates the white board and returns the `create_white_board` payload as a dict.
+        """
+        if self.use_agents(execution_mode):
+            chat_result = self.initiate_white_board_creation(jira_id, summary, segment, product)
+            return self.extract_tool_result(chat_result, "create_white_board")
+        return parse_tool_result(self.create_white_board(jira_id, summary, segment, product), "create_white_board")
+
+    def run_status_page_creation(self, jira_id, priority, summary, description, execution_mode=None):
+        """
+        Creates the status page incident and returns the `create_status_page` payload as a dict.
+        """
+        if self.use_agents(execution_mode):
+            chat_result = self.initiate_status_page_creation(jira_id, priority, summary, description)
+            return self.extract_tool_result(chat_result, "create_status_page")
+        return parse_tool_result(self.create_status_page(jira_id, priority, summary, description), "create_status_page")
+
+    @staticmethod
+    def extract_tool_result(chat_result, tool_name):
+        tool_responses = extract_tool_responses(chat_result)
+        if not tool_responses:
+            raise ValueError(f"{tool_name} was not called during the chat")
+        return parse_tool_result(tool_responses[0].get("content"), tool_name)
+
+    def use_agents(self, execution_mode=None):
+        """
+        Whether the tools are called through their LLM chat; an incident whose LLM budget is used up falls back
+        to calling them directly.
+        """
+        if (execution_mode or self.execution_mode) != "agentic":
+            return False
+        if not usage_ledger.within_budget():
+            print("Incident LLM budget exceeded, calling the incident tools directly")
+            return False
+        return True
+
+    def initiate_chat(self, name, user_proxy, assistant, message):
+        """
+        Runs one tool chat, recording its tokens and latency for the assistant.
+        """
+        usage_ledger.check_budget(assistant.name)
+        with self.chat_locks[name], span(f"agent.{name}_chat", agent=assistant.name) as chat_span:
+            # The assistants are long-lived; start from zero so the chat's cost is this chat's usage only
+            assistant.client.clear_usage_summary()
+            started = time.perf_counter()
+            chat_result = user_proxy.initiate_chat(assistant, message=message)
+            usage = chat_usage(chat_result)
+            usage_ledger.record(assistant.name, usage, time.perf_counter() - started)
+            chat_span.set(model=usage["model"], prompt_tokens=usage["prompt_tokens"],
+                          completion_tokens=usage["completion_tokens"])
+        return chat_result
+
     def initiate_jira_ticket_creation(self, priority, summary, description):
-        return self.jira_user_proxy.initiate_chat(self.jira_ticket_creation_assistant,
-                                           message=f"Please create the Jira ticket with priority `{priority}`, summary `{summary}` and description `{description}`")
+        return self.initiate_chat("jira", self.jira_user_proxy, self.jira_ticket_creation_assistant,
+                                  f"Please create the Jira ticket with priority `{priority}`, summary `{summary}` and description `{description}`")
 
     def initiate_white_board_creation(self, jira_id, summary, segment, product):
-        return self.white_board_user_proxy.initiate_chat(self.white_board_creation_assistant,
-                                                  message=f"Please create the white board link with jira_id `{jira_id}`, summary `{summary}`, segment `{segment}`, and product `{product}`")
+        return self.initiate_chat("white_board", self.white_board_user_proxy, self.white_board_creation_assistant,
+                                  f"Please create the white board link with jira_id `{jira_id}`, summary `{summary}`, segment `{segment}`, and product `{product}`")
 
     def initiate_status_page_creation(self, jira_id, priority, summary, description):
-        return self.status_page_user_proxy.initiate_chat(self.status_page_creation_assistant,
-                                                         message=f"Please create the status page with jira_id `{jira_id}`, priority `{priority}`, summary `{summary}`, description `{description}`")
+        return self.initiate_chat("status_page", self.status_page_user_proxy, self.status_page_creation_assistant,
+                                  f"Please create the status page with jira_id `{jira_id}`, priority `{priority}`, summary `{summary}`, description `{description}`")
 
 
 # Example Usage
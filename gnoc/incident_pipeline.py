@@ -0,0 +1,265 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from model_router import usage_ledger
+from tracing import span
+
+JIRA_BROWSE_URL = "https://rahuluraneai.atlassian.net/browse/"
+
+DEFAULT_STAGE_TIMEOUTS = {
+    "jira": 60.0,
+    "white_board": 60.0,
+    "status_page": 30.0,
+    "emails": 300.0,
+    "insensitive_email": 60.0,
+    "sensitive_email": 60.0,
+}
+# Time between the last link stage finishing and the claim of the incident being resolved
+CLAIM_RESOLVE_MARGIN_SECONDS = 5.0
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[dict], Any]
+    depends_on: tuple = ()
+    timeout: Optional[float] = None
+
+
+@dataclass
+class StageOutcome:
+    name: str
+    status: str
+    result: Any = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class PipelineReport:
+    outcomes: dict = field(default_factory=dict)
+    total_seconds: float = 0.0
+    duplicate_of: Optional[str] = None
+    trace_id: Optional[str] = None
+
+    @property
+    def succeeded(self):
+        return all(outcome.status == "succeeded" for outcome in self.outcomes.values())
+
+    @property
+    def failed_stages(self):
+        return {name: outcome for name, outcome in self.outcomes.items() if outcome.status != "succeeded"}
+
+    def result(self, name, default=None):
+        outcome = self.outcomes.get(name)
+        return outcome.result if outcome is not None and outcome.status == "succeeded" else default
+
+
+class StagePipeline:
+    """
+    Runs a DAG of stages on a thread pool. A stage starts as soon as all of its dependencies have succeeded and
+    receives their results as a dict keyed by stage name. A stage that raises or exceeds its timeout is reported
+    as failed/timed_out and every stage depending on it is skipped; independent branches keep running.
+
+    Every stage runs in a `stage.<name>` span, a child of the span active when `run` was called.
+    """
+
+    def __init__(self, stages, max_workers=None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage `{stage.name}` depends on unknown stage `{dependency}`")
+        self.max_workers = max_workers or len(stages)
+
+    def run(self):
+        started = time.perf_counter()
+        report = PipelineReport()
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="incident-stage")
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dependency_outcomes = [report.outcomes.get(dependency) for dependency in stage.depends_on]
+                    if any(outcome is not None and outcome.status != "succeeded" for outcome in dependency_outcomes):
+                        failed = [dependency for dependency, outcome in zip(stage.depends_on, dependency_outcomes)
+                                  if outcome is not None and outcome.status != "succeeded"]
+                        report.outcomes[name] = StageOutcome(name, "skipped", error=f"Upstream stage(s) failed: {failed}")
+                        del pending[name]
+                    elif all(outcome is not None for outcome in dependency_outcomes):
+                        inputs = {dependency: results[dependency] for dependency in stage.depends_on}
+                        # In a copy of the caller's context, so the stage span joins the caller's trace
+                        future = executor.submit(contextvars.copy_context().run, self._run_stage, stage, inputs)
+                        deadline = time.perf_counter() + stage.timeout if stage.timeout else None
+                        running[future] = (stage, time.perf_counter(), deadline)
+                        del pending[name]
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Stages {list(pending)} have cyclic dependencies")
+                    break
+
+                deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+                wait_timeout = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+                done, _ = wait(list(running), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, stage_started, _ = running.pop(future)
+                    seconds = time.perf_counter() - stage_started
+                    try:
+                        results[stage.name] = future.result()
+                        report.outcomes[stage.name] = StageOutcome(stage.name, "succeeded", results[stage.name],
+                                                                   seconds=seconds)
+                    except Exception as e:
+                        print(f"Incident stage `{stage.name}` failed: {e}")
+                        report.outcomes[stage.name] = StageOutcome(stage.name, "failed", error=str(e), seconds=seconds)
+
+                now = time.perf_counter()
+                for future, (stage, stage_started, deadline) in list(running.items()):
+                    if deadline is not None and now >= deadline:
+                        # The worker thread cannot be interrupted; its result is simply ignored
+                        running.pop(future)
+                        print(f"Incident stage `{stage.name}` timed out after {stage.timeout} seconds")
+                        report.outcomes[stage.name] = StageOutcome(stage.name, "timed_out",
+                                                                   error=f"Timed out after {stage.timeout} seconds",
+                                                                   seconds=now - stage_started)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        report.total_seconds = time.perf_counter() - started
+        return report
+
+    @staticmethod
+    def _run_stage(stage, inputs):
+        with span(f"stage.{stage.name}"):
+            return stage.func(inputs)
+
+
+class IncidentPipeline:
+    """
+    Declares an incident from a `PrioritizationResult`: the Jira ticket first, then the white board and status page
+    in parallel, then both notification emails from one generation pass, queued (or sent) in parallel.
+
+    With an `IncidentIndex`, a report matching an incident that is already open is attached to it and gets that
+    incident's links back instead of fanning out again.
+
+    Each run is traced as an `incident.pipeline` span; `tracing.tracer.breakdown(report.trace_id)` shows where its
+    time went. Its LLM calls share one incident budget (see `UsageLedger.incident_budget`), unless the caller
+    already opened one.
+    """
+
+    def __init__(self, incident_manager, notification_service, stage_timeouts=None, incident_index=None):
+        self.incident_manager = incident_manager
+        self.notification_service = notification_service
+        self.incident_index = incident_index
+        self.stage_timeouts = {**DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {})}
+        for name in self.stage_timeouts:
+            env_timeout = os.getenv(f"INCIDENT_{name.upper()}_TIMEOUT_SECONDS")
+            if env_timeout:
+                self.stage_timeouts[name] = float(env_timeout)
+
+    def claim_wait_seconds(self):
+        """
+        Returns how long a duplicate report waits for the incident it was attached to: the longest the first
+        report's Jira ticket, white board and status page may take before its claim is resolved or released.
+        """
+        timeouts = self.stage_timeouts
+        return timeouts["jira"] + max(timeouts["white_board"], timeouts["status_page"]) + CLAIM_RESOLVE_MARGIN_SECONDS
+
+    def build_stages(self, result):
+        summary, description, priority = result.summary, result.description, result.priority
+        segment, product, impact = result.segment, result.product, result.impact
+
+        def create_jira(_):
+            jira_result = self.incident_manager.run_jira_ticket_creation(priority, summary, description)
+            jira_id = jira_result.get("jira_id")
+            return {**jira_result, "jira_link": f"{JIRA_BROWSE_URL}{jira_id}"}
+
+        def create_white_board(inputs):
+            return self.incident_manager.run_white_board_creation(inputs["jira"]["jira_id"], summary, segment, product)
+
+        def create_status_page(inputs):
+            return self.incident_manager.run_status_page_creation(inputs["jira"]["jira_id"], priority, summary,
+                                                                  description)
+
+        def generate_emails(inputs):
+            emails = self.notification_service.generate_emails(
+                description, segment, product, priority, impact, inputs["jira"]["jira_id"],
+                inputs["jira"]["jira_link"], inputs["status_page"]["status_io_page_link"],
+                inputs["white_board"]["white_board_link"])
+            print(f"Email generation usage:- {emails['usage']}")
+            return emails
+
+        def notify(variant, send):
+            def stage(inputs):
+                email_content = inputs["emails"].get(variant)
+                if not email_content:
+                    raise ValueError(f"The {variant} email could not be generated")
+                # Keyed by incident, so a retried stage cannot notify twice
+                return send(email_content.get("subject"), email_content.get("body"),
+                            dedupe_key=f"{inputs['jira']['jira_id']}:{variant}")
+            return stage
+
+        return [
+            Stage("jira", create_jira, timeout=self.stage_timeouts["jira"]),
+            Stage("white_board", create_white_board, ("jira",), self.stage_timeouts["white_board"]),
+            Stage("status_page", create_status_page, ("jira",), self.stage_timeouts["status_page"]),
+            Stage("emails", generate_emails, ("jira", "white_board", "status_page"), self.stage_timeouts["emails"]),
+            Stage("insensitive_email", notify("insensitive", self.notification_service.insensitive_notification_tool),
+                  ("jira", "emails"), self.stage_timeouts["insensitive_email"]),
+            Stage("sensitive_email", notify("sensitive", self.notification_service.sensitive_notification_tool),
+                  ("jira", "emails"), self.stage_timeouts["sensitive_email"]),
+        ]
+
+    def run(self, result):
+        with usage_ledger.incident_budget() as budget, span(
+                "incident.pipeline", priority=result.priority, segment=result.segment,
+                product=result.product) as pipeline_span:
+            report = self.declare(result)
+            pipeline_span.set(duplicate_of=report.duplicate_of,
+                              failed_stages=",".join(report.failed_stages) or None, llm_tokens=budget.tokens)
+        report.trace_id = pipeline_span.trace_id
+        return report
+
+    def declare(self, result):
+        incident = None
+        if self.incident_index is not None:
+            started = time.perf_counter()
+            incident, created = self.incident_index.claim(result.segment, result.product,
+                                                          f"{result.summary}\n{result.description}")
+            if not created:
+                if self.incident_index.wait_until_ready(incident, self.claim_wait_seconds()):
+                    print(f"Issue attached to open incident {incident.jira_id}")
+                    return self.duplicate_report(incident, time.perf_counter() - started)
+                print(f"Open incident {incident.jira_id} was not declared in time, declaring a new one")
+                incident = None
+
+        stages = self.build_stages(result)
+        if incident is not None:
+            stages.append(Stage("incident_index", lambda inputs: self.incident_index.resolve(
+                incident, inputs["jira"]["jira_id"], inputs), ("jira", "white_board", "status_page")))
+        report = StagePipeline(stages).run()
+        if incident is not None and not incident.ready.is_set():
+            # Some link is missing; keep the incident matchable as long as its Jira ticket exists
+            jira = report.result("jira")
+            if jira:
+                links = {name: report.result(name) for name in ("jira", "white_board", "status_page")
+                         if report.result(name) is not None}
+                self.incident_index.resolve(incident, jira["jira_id"], links)
+            else:
+                self.incident_index.release(incident)
+        print(f"Incident pipeline finished in {report.total_seconds:.2f}s: "
+              f"{ {name: outcome.status for name, outcome in report.outcomes.items()} }")
+        return report
+
+    @staticmethod
+    def duplicate_report(incident, seconds):
+        report = PipelineReport(total_seconds=seconds, duplicate_of=incident.jira_id)
+        for name, result in incident.links.items():
+            report.outcomes[name] = StageOutcome(name, "succeeded", result)
+        return report
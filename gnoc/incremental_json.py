@@ -0,0 +1,138 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONObjectParser:
+    """
+    Parses a JSON object while its text is still streaming in.
+
+    `feed` accepts arbitrary chunks of the LLM output (leading prose or a ```json fence is skipped) and returns the
+    top-level fields whose values became complete with that chunk, so they can be rendered before the object is
+    closed. Nested objects, arrays, numbers and literals are returned once they are complete as well.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._state = "seek_object"
+        self._key = None
+        self._token = []
+        self._escaped = False
+        self._depth = 0
+        self._in_nested_string = False
+
+    def feed(self, chunk):
+        completed = {}
+        for char in chunk:
+            if self.done:
+                break
+            self._consume(char, completed)
+        return completed
+
+    def in_progress(self):
+        """
+        Returns the key and the text received so far of a string value that is still streaming, or None.
+        """
+        if self._state != "string_value":
+            return None
+        return self._key, "".join(self._token)
+
+    def _consume(self, char, completed):
+        state = self._state
+        if state == "seek_object":
+            if char == "{":
+                self._state = "expect_key"
+        elif state == "expect_key":
+            if char == '"':
+                self._state, self._token = "key", []
+            elif char == "}":
+                self.done = True
+        elif state == "key":
+            if self._read_string_char(char):
+                self._key = self._decode_string()
+                self._state = "expect_colon"
+        elif state == "expect_colon":
+            if char == ":":
+                self._state = "expect_value"
+        elif state == "expect_value":
+            if char in _WHITESPACE:
+                return
+            self._token = [char]
+            if char == '"':
+                self._token, self._state = [], "string_value"
+            elif char in "{[":
+                self._depth, self._in_nested_string, self._state = 1, False, "nested_value"
+            else:
+                self._state = "scalar_value"
+        elif state == "string_value":
+            if self._read_string_char(char):
+                self._complete(self._decode_string(), completed)
+        elif state == "nested_value":
+            self._token.append(char)
+            if self._in_nested_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_nested_string = False
+            elif char == '"':
+                self._in_nested_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(self._decode_token(), completed)
+        elif state == "scalar_value":
+            if char in ",}" or char in _WHITESPACE:
+                self._complete(self._decode_token(), completed)
+                self._after_value(char)
+            else:
+                self._token.append(char)
+        elif state == "after_value":
+            self._after_value(char)
+
+    def _read_string_char(self, char):
+        """
+        Appends a character of a string literal; returns True when the closing quote is reached.
+        """
+        if self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            return True
+        elif char == "\n":
+            # LLMs often forget to escape newlines inside strings
+            char = "\\n"
+        self._token.append(char)
+        return False
+
+    def _decode_string(self):
+        raw = "".join(self._token)
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+
+    def _decode_token(self):
+        raw = "".join(self._token)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return raw
+
+    def _complete(self, value, completed):
+        self.fields[self._key] = value
+        completed[self._key] = value
+        self._token, self._state = [], "after_value"
+
+    def _after_value(self, char):
+        if char == ",":
+            self._state = "expect_key"
+        elif char == "}":
+            self.done = True
+        else:
+            self._state = "after_value"
@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Request parameters that do not change the completion, left out of the cache key
+VOLATILE_PARAMS = {"stream", "stream_options", "timeout", "max_retries", "user"}
+MESSAGE_FIELDS = ("role", "name", "content", "tool_calls", "tool_call_id", "function_call")
+
+
+def _normalize_content(content):
+    if isinstance(content, str):
+        return " ".join(content.split())
+    if isinstance(content, list):
+        return [{**part, "text": " ".join(part["text"].split())}
+                if isinstance(part, dict) and isinstance(part.get("text"), str) else part for part in content]
+    return content
+
+
+def canonical_key(key):
+    """
+    Returns the cache key of an autogen request key (the JSON of the request parameters): a hash of the model, the
+    messages with their whitespace collapsed and the parameters that shape the answer, so the streamed and the
+    plain call of the same prompt, or prompts that only differ in indentation, share an entry.
+    """
+    try:
+        params = json.loads(key)
+    except (TypeError, ValueError):
+        params = None
+    if isinstance(params, dict):
+        messages = [{field: _normalize_content(message[field]) if field == "content" else message[field]
+                     for field in MESSAGE_FIELDS if message.get(field) is not None}
+                    if isinstance(message, dict) else message for message in params.get("messages") or []]
+        params = {name: value for name, value in params.items() if name not in VOLATILE_PARAMS}
+        params["messages"] = messages
+        key = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return "llm:" + hashlib.sha256(str(key).encode()).hexdigest()
+
+
+class MemoryTier:
+    """
+    The in-process tier: the most recently used `max_entries` responses with the time they were stored and expire.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, created_at, expires_at, value):
+        with self._lock:
+            self._entries[key] = (created_at, expires_at, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteTier:
+    """
+    The host tier: pickled responses in a SQLite database in WAL mode, so every process on the host (Streamlit
+    replicas, batch jobs, benchmarks) reads and writes the same entries. Each thread has its own connection.
+    """
+
+    def __init__(self, path, busy_timeout=5.0, prune_every=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._sets = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, agent TEXT, "
+                           "created_at REAL NOT NULL, expires_at REAL NOT NULL, value BLOB NOT NULL)")
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute("SELECT created_at, expires_at, value FROM llm_responses WHERE key = ?",
+                                         (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], pickle.loads(row[2])
+
+    def set(self, key, agent_name, created_at, expires_at, value):
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO llm_responses (key, agent, created_at, expires_at, value) "
+                               "VALUES (?, ?, ?, ?, ?)", (key, agent_name, created_at, expires_at,
+                                                          pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        with self._lock:
+            self._sets += 1
+            prune = self._sets % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Deletes the expired entries, returning how many there were.
+        """
+        connection = self._connection()
+        with connection:
+            return connection.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+
+class LLMResponseCache:
+    """
+    The LLM response cache shared by every agent of the process: a `MemoryTier` of LLM_CACHE_MEMORY_ENTRIES
+    responses in front of a `SQLiteTier` at LLM_CACHE_PATH that the processes of the host share. A response found
+    on disk is promoted to memory.
+
+    Agents use it through `cache_config(agent_name)`, which returns the `llm_config` settings of the agent: an
+    `AgentLLMCache` with the agent's TTL (LLM_CACHE_TTL_<AGENT_NAME> seconds, LLM_CACHE_TTL_SECONDS by default),
+    or autogen's cache disabled when the agent opts out, its TTL is 0 or LLM_CACHE_ENABLED is false. An entry is
+    served to an agent while it is younger than that agent's TTL and the TTL of the agent that stored it.
+
+    The cache never fails a call: a database error is counted and treated as a miss.
+    """
+
+    def __init__(self, path=None, memory_entries=None, ttl_seconds=None, enabled=None):
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.path = path or os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "gnoc_llm_cache.sqlite3"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+        self.memory = MemoryTier(memory_entries if memory_entries is not None else int(
+            os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")))
+        self._disk = None
+        self._lock = threading.Lock()
+        self.metrics = {"lookups": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "stores": 0,
+                        "evictions": 0, "errors": 0, "tokens_saved": 0, "cost_saved": 0.0}
+        self._agents = {}
+
+    def disk(self):
+        with self._lock:
+            if self._disk is None:
+                self._disk = SQLiteTier(self.path)
+            return self._disk
+
+    def ttl(self, agent_name):
+        return float(os.getenv(f"LLM_CACHE_TTL_{agent_name.upper()}", str(self.ttl_seconds)))
+
+    def for_agent(self, agent_name, ttl_seconds=None):
+        """
+        Returns the view of the cache `agent_name` passes to autogen, or None when it must not cache.
+        """
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl(agent_name)
+        if not self.enabled or ttl_seconds <= 0:
+            return None
+        return AgentLLMCache(self, agent_name, ttl_seconds)
+
+    def cache_config(self, agent_name, ttl_seconds=None, enabled=True):
+        """
+        Returns the cache settings of an agent's `llm_config`; `enabled=False` opts the agent out.
+        """
+        cache = self.for_agent(agent_name, ttl_seconds) if enabled else None
+        # cache_seed=None keeps autogen from falling back to its per-process disk cache
+        return {"cache": cache} if cache is not None else {"cache_seed": None}
+
+    def _count(self, agent_name, outcome, **metrics):
+        with self._lock:
+            agent = self._agents.setdefault(agent_name, {"lookups": 0, "hits": 0, "misses": 0, "stores": 0})
+            agent[outcome] += 1
+            if outcome != "stores":
+                agent["lookups"] += 1
+            for name, value in metrics.items():
+                self.metrics[name] += value
+
+    def get(self, agent_name, ttl_seconds, key, default=None):
+        key = canonical_key(key)
+        now = time.time()
+        tier, entry, evictions = "memory_hits", self.memory.get(key), 0
+        if entry is not None and now >= entry[1]:
+            self.memory.discard(key)
+            entry = None
+        if entry is not None and not self._fresh(entry, now, ttl_seconds):
+            # Still valid for other agents, only too old for this one
+            self._count(agent_name, "misses", lookups=1, misses=1, expired=1)
+            return default
+        if entry is None:
+            tier = "disk_hits"
+            try:
+                entry = self.disk().get(key)
+            except (sqlite3.Error, OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+                print(f"LLM cache read failed: {e}")
+                self._count(agent_name, "misses", lookups=1, misses=1, errors=1)
+                return default
+            if entry is not None and not self._fresh(entry, now, ttl_seconds):
+                self._count(agent_name, "misses", lookups=1, misses=1, expired=1)
+                return default
+            if entry is not None:
+                evictions = self.memory.set(key, *entry)
+        if entry is None:
+            self._count(agent_name, "misses", lookups=1, misses=1)
+            return default
+        value = entry[2]
+        self._count(agent_name, "hits", lookups=1, evictions=evictions, **{tier: 1},
+                    tokens_saved=getattr(getattr(value, "usage", None), "total_tokens", 0) or 0,
+                    cost_saved=getattr(value, "cost", 0.0) or 0.0)
+        return value
+
+    @staticmethod
+    def _fresh(entry, now, ttl_seconds):
+        created_at, expires_at, _ = entry
+        return now < expires_at and now - created_at < ttl_seconds
+
+    def set(self, agent_name, ttl_seconds, key, value):
+        key = canonical_key(key)
+        created_at = time.time()
+        expires_at = created_at + ttl_seconds
+        evictions = self.memory.set(key, created_at, expires_at, value)
+        try:
+            self.disk().set(key, agent_name, created_at, expires_at, value)
+        except (sqlite3.Error, OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"LLM cache write failed: {e}")
+            self._count(agent_name, "stores", stores=1, evictions=evictions, errors=1)
+            return
+        self._count(agent_name, "stores", stores=1, evictions=evictions)
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            agents = {}
+            for name, agent in self._agents.items():
+                agents[name] = {**agent, "hit_ratio": agent["hits"] / agent["lookups"] if agent["lookups"] else 0.0}
+        hits = metrics["memory_hits"] + metrics["disk_hits"]
+        return {**metrics, "enabled": self.enabled, "path": self.path, "memory_entries": len(self.memory),
+                "hit_ratio": hits / metrics["lookups"] if metrics["lookups"] else 0.0,
+                "llm_calls_saved": hits, "agents": agents}
+
+
+class AgentLLMCache:
+    """
+    An agent's view of the `LLMResponseCache`, implementing autogen's `AbstractCache` so it can be passed as the
+    `cache` of an `llm_config`. autogen deep-copies `llm_config`, so copies share the view.
+    """
+
+    def __init__(self, cache, agent_name, ttl_seconds):
+        self.cache = cache
+        self.agent_name = agent_name
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key, default=None):
+        return self.cache.get(self.agent_name, self.ttl_seconds, key, default)
+
+    def set(self, key, value):
+        self.cache.set(self.agent_name, self.ttl_seconds, key, value)
+
+    def close(self):
+        # The tiers outlive every call, autogen closes the cache after each one
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+# Shared by every agent of the process
+llm_cache = LLMResponseCache()
@@ -0,0 +1,178 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+_VALID_ESCAPES = '"\\/bfnrtu'
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+_VALUE_STARTS = '"{[-0123456789tfnTFN'
+
+
+class JSONSchemaError(ValueError):
+    """
+    Raised when a parsed LLM answer does not have the expected shape.
+    """
+
+
+def _next_significant(text, index):
+    while index < len(text) and text[index] in _WHITESPACE:
+        index += 1
+    return index
+
+
+def _closes_string(text, index, container):
+    """
+    Decides whether the quote at `index` ends the current string or is an unescaped quote inside it, such as the
+    ones around an href, by looking at what follows it.
+    """
+    following = _next_significant(text, index + 1)
+    if following >= len(text):
+        return True
+    char = text[following]
+    if char in "}]:":
+        return True
+    if char != ",":
+        return False
+    after_comma = _next_significant(text, following + 1)
+    if after_comma >= len(text):
+        return True
+    if container == "{":
+        if text[after_comma] in '"}':
+            return True
+        # A bare key
+        end = after_comma
+        while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+            end += 1
+        return end > after_comma and text[_next_significant(text, end):_next_significant(text, end) + 1] == ":"
+    return text[after_comma] in _VALUE_STARTS or text[after_comma] == "]"
+
+
+def repair_json(text):
+    """
+    Extracts the first JSON object or array from an LLM answer and repairs it in one pass over the text.
+
+    Leading prose and ```json fences are skipped and anything after the closing bracket is dropped. Inside
+    strings, raw newlines and tabs are escaped, quotes that do not end the string are escaped and stray
+    backslashes are doubled. Outside strings, trailing commas are removed and Python literals become JSON ones.
+    A truncated answer has its open string and brackets closed.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        raise ValueError("No JSON object or array found")
+    index = min(starts)
+    out = []
+    stack = []
+    in_string = False
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if in_string:
+            if char == "\\":
+                if index + 1 < length and text[index + 1] in _VALID_ESCAPES:
+                    out.append(text[index:index + 2])
+                    index += 2
+                    continue
+                out.append("\\\\")
+            elif char == '"':
+                if _closes_string(text, index, stack[-1]):
+                    in_string = False
+                    out.append(char)
+                else:
+                    out.append('\\"')
+            elif char in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[char])
+            else:
+                out.append(char)
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            while out and out[-1] in _WHITESPACE:
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if not stack:
+                break
+            stack.pop()
+            out.append("}" if char == "}" else "]")
+            if not stack:
+                break
+        elif char.isalpha() or char == "_":
+            end = index
+            while end < length and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            if word in _LITERALS:
+                out.append(_LITERALS[word])
+            elif stack[-1] == "{" and text[_next_significant(text, end):_next_significant(text, end) + 1] == ":":
+                # A bare key
+                out.append(f'"{word}"')
+            else:
+                out.append(word)
+            index = end
+            continue
+        else:
+            out.append(char)
+        index += 1
+
+    if in_string:
+        out.append('"')
+    while stack:
+        while out and out[-1] in _WHITESPACE:
+            out.pop()
+        if out and out[-1] in ",:":
+            out.pop()
+        out.append("}" if stack.pop() == "{" else "]")
+    return "".join(out)
+
+
+def parse_llm_json(text, schema=None):
+    """
+    Parses the JSON in an LLM answer, repairing it with `repair_json` when it is not valid as it stands, and
+    checks it against `schema` (see `validate`).
+    """
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        # Only the opening fence line and the closing fence, unlike str.strip which also eats "json" off the ends
+        stripped = stripped.partition("\n")[2].removesuffix("```").strip()
+    try:
+        value = json.loads(stripped)
+    except ValueError:
+        value = json.loads(repair_json(text))
+    if schema is not None:
+        validate(value, schema)
+    return value
+
+
+def validate(value, schema, path="$"):
+    """
+    Checks `value` against a small schema: a type, a tuple of allowed values, a dict of required keys to schemas,
+    or a one-item list holding the schema of every element.
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise JSONSchemaError(f"{path} should be an object")
+        for key, key_schema in schema.items():
+            if key not in value:
+                raise JSONSchemaError(f"{path}.{key} is missing")
+            validate(value[key], key_schema, f"{path}.{key}")
+    elif isinstance(schema, list):
+        if not isinstance(value, list):
+            raise JSONSchemaError(f"{path} should be an array")
+        for index, item in enumerate(value):
+            validate(item, schema[0], f"{path}[{index}]")
+    elif isinstance(schema, tuple):
+        if value not in schema:
+            raise JSONSchemaError(f"{path} should be one of {', '.join(map(str, schema))}, not {value!r}")
+    elif not isinstance(value, schema):
+        raise JSONSchemaError(f"{path} should be of type {schema.__name__}")
+    return value
+
+
+EMAIL_SCHEMA = {"subject": str, "body": str}
+EMAILS_SCHEMA = {"insensitive": EMAIL_SCHEMA, "sensitive": EMAIL_SCHEMA}
+NARRATIVES_SCHEMA = {"insensitive": str, "sensitive": str}
+PRIORITY_SCHEMA = {"priority": ("P1", "P2", "P3", "P4", "NA"), "impact": str, "urgency": str, "description": str,
+                   "summary": str, "segment": str, "product": str}
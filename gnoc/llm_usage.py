@@ -0,0 +1,80 @@
+import time
+
+from hedging import CacheHitRecorder
+from model_router import usage_ledger
+from tracing import span
+
+
+def response_usage(response):
+    """
+    Returns the token usage of a single completion as a plain dict.
+    """
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    return {
+        "model": getattr(response, "model", None),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cost": getattr(response, "cost", 0.0) or 0.0,
+    }
+
+
+def generate_with_usage(agent, content):
+    """
+    Sends `content` as a single user message to the agent's LLM, using the agent's system message, and returns
+    the reply text together with the token usage of that call.
+
+    Unlike `generate_reply`, the usage is read from the completion itself, so concurrent callers sharing the
+    agent get accurate per-call numbers. The call is recorded in the usage ledger and charged to the active
+    incident budget; `BudgetExceededError` is raised instead of calling when that budget is used up. A reply
+    served from the agent's cache costs nothing: its usage is zero and it is neither recorded nor charged.
+    """
+    usage_ledger.check_budget(agent.name)
+    messages = [{"role": "system", "content": agent.system_message}, {"role": "user", "content": content}]
+    started = time.perf_counter()
+    with span("llm.generate", agent=agent.name, payload_bytes=len(content.encode())) as llm_span:
+        recorder = CacheHitRecorder(agent.client_cache) if agent.client_cache is not None else None
+        response = agent.client.create(messages=messages, cache=recorder)
+        cached = recorder is not None and recorder.hit
+        usage = response_usage(response)
+        if cached:
+            usage.update(prompt_tokens=0, completion_tokens=0, total_tokens=0, cost=0.0)
+        llm_span.set(model=usage["model"], prompt_tokens=usage["prompt_tokens"],
+                     completion_tokens=usage["completion_tokens"], cached=cached)
+    usage["seconds"] = time.perf_counter() - started
+    if not cached:
+        usage_ledger.record(agent.name, usage)
+    text = agent.client.extract_text_or_completion_object(response)[0]
+    return text if isinstance(text, str) else getattr(text, "content", "") or "", usage
+
+
+def add_usage(*usages):
+    """
+    Sums several usage dicts into one.
+    """
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0, "seconds": 0.0}
+    for usage in usages:
+        for key in total:
+            total[key] += usage.get(key, 0) or 0
+    return total
+
+
+def chat_usage(chat_result):
+    """
+    Sums the token usage of every completion of an autogen chat that was sent to the LLM, as reported by its
+    `ChatResult.cost`; completions served from a cache cost nothing and are left out.
+    """
+    total = {"model": None, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+    cost = getattr(chat_result, "cost", None) or {}
+    # The model is named even when every completion came from the cache
+    for model, usage in (cost.get("usage_including_cached_inference") or {}).items():
+        if isinstance(usage, dict):
+            total["model"] = model
+    for usage in (cost.get("usage_excluding_cached_inference") or {}).values():
+        if not isinstance(usage, dict):
+            continue
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cost"):
+            total[key] += usage.get(key, 0) or 0
+    return total
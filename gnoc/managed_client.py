@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_AGE_SECONDS = float(os.getenv("CLIENT_MAX_AGE_SECONDS", "1800"))
+DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("CLIENT_HEALTH_CHECK_INTERVAL_SECONDS", "300"))
+
+
+class ManagedClient:
+    """
+    Holds a long-lived, authenticated API client and recycles it instead of rebuilding it per request.
+
+    The client is created lazily by `factory`. It is replaced when it is older than `max_age` seconds, when
+    `health_check` fails (checked at most every `health_check_interval` seconds) or when a call made through
+    `lease()` raises. Clients that are not safe to share between threads can be leased with `exclusive=True`.
+    """
+
+    def __init__(self, name, factory, max_age=DEFAULT_MAX_AGE_SECONDS, health_check=None,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS, close=None, exclusive=False):
+        self.name = name
+        self.factory = factory
+        self.max_age = max_age
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+        self.close = close
+        self.exclusive = exclusive
+        self._client = None
+        self._created_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._usage_lock = threading.Lock()
+        self.connects = 0
+        self.recycles = {"expired": 0, "unhealthy": 0, "error": 0}
+
+    def get(self):
+        """
+        Returns the current client, creating or recycling it according to the lifetime policy.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._client is not None and self.max_age and now - self._created_at > self.max_age:
+                self._recycle("expired")
+            elif (self._client is not None and self.health_check is not None
+                  and now - self._checked_at > self.health_check_interval):
+                self._checked_at = now
+                if not self._is_healthy():
+                    self._recycle("unhealthy")
+            if self._client is None:
+                self._client = self.factory()
+                self._created_at = self._checked_at = time.monotonic()
+                self.connects += 1
+            return self._client
+
+    @contextmanager
+    def lease(self):
+        """
+        Yields the client for one unit of work; the client is recycled if that work raises.
+        """
+        client = self.get()
+        if self.exclusive:
+            self._usage_lock.acquire()
+        try:
+            yield client
+        except Exception:
+            with self._lock:
+                if self._client is client:
+                    self._recycle("error")
+            raise
+        finally:
+            if self.exclusive:
+                self._usage_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            if self._client is not None:
+                self._recycle("error")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "connected": self._client is not None,
+                "age_seconds": time.monotonic() - self._created_at if self._client is not None else 0.0,
+                "connects": self.connects,
+                "recycles": dict(self.recycles),
+            }
+
+    def _is_healthy(self):
+        try:
+            return self.health_check(self._client) is not False
+        except Exception as e:
+            print(f"Health check failed for {self.name}: {e}")
+            return False
+
+    def _recycle(self, reason):
+        client, self._client = self._client, None
+        self.recycles[reason] += 1
+        if self.close is not None:
+            try:
+                self.close(client)
+            except Exception as e:
+                print(f"Failed to close {self.name} client: {e}")
@@ -0,0 +1,196 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+# The tier each kind of LLM task runs on; MODEL_ROUTE_<TASK> (e.g. MODEL_ROUTE_EMAIL_NARRATIVE=large) overrides it
+TASK_TIERS = {
+    "prioritization": "large",
+    "tool_arguments": "small",
+    "email_narrative": "small",
+}
+DEFAULT_TIER_TIMEOUTS = {"small": 20.0, "large": 60.0}
+
+_current_budget = contextvars.ContextVar("gnoc_incident_budget", default=None)
+
+
+class BudgetExceededError(RuntimeError):
+    """
+    Raised when an LLM call is attempted after the incident it belongs to used up its budget.
+    """
+
+
+class ModelRouter:
+    """
+    Builds the `llm_config` of every agent from one `config_list`, routing each task to a model tier.
+
+    Entries tagged `small` (e.g. `"tags": ["small"]`) serve cheap, deterministic tasks such as formatting tool
+    arguments and writing email narratives; the other entries are `large` and serve prioritization. Untagged config
+    lists behave as before: every task uses the first entry.
+
+    The entries of the task's tier come first and every other entry follows as a failover: autogen moves on to the
+    next entry when a call times out, so each entry gets the short timeout of its tier
+    (MODEL_SMALL_TIMEOUT_SECONDS / MODEL_LARGE_TIMEOUT_SECONDS) and MODEL_MAX_RETRIES retries instead of waiting out
+    a single 600 second timeout. A `timeout` or `max_retries` set on an entry itself wins.
+    """
+
+    def __init__(self, config_list, task_tiers=None, timeouts=None, max_retries=None):
+        self.config_list = list(config_list)
+        self.task_tiers = {**TASK_TIERS, **(task_tiers or {})}
+        for task in self.task_tiers:
+            env_tier = os.getenv(f"MODEL_ROUTE_{task.upper()}")
+            if env_tier:
+                self.task_tiers[task] = env_tier.lower()
+        self.timeouts = {tier: float(os.getenv(f"MODEL_{tier.upper()}_TIMEOUT_SECONDS", str(timeout)))
+                         for tier, timeout in DEFAULT_TIER_TIMEOUTS.items()}
+        self.timeouts.update(timeouts or {})
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("MODEL_MAX_RETRIES", "1"))
+
+    @staticmethod
+    def entry_tier(entry):
+        return "small" if "small" in (entry.get("tags") or ()) else "large"
+
+    def tier(self, task):
+        return self.task_tiers.get(task, "large")
+
+    def config_list_for(self, task):
+        """
+        Returns the config list of `task`: the entries of its tier, then the others as failover.
+        """
+        tier = self.tier(task)
+        ordered = ([entry for entry in self.config_list if self.entry_tier(entry) == tier] +
+                   [entry for entry in self.config_list if self.entry_tier(entry) != tier])
+        return [{"timeout": self.timeouts[self.entry_tier(entry)], "max_retries": self.max_retries, **entry}
+                for entry in ordered]
+
+    def model(self, task):
+        return self.config_list_for(task)[0]["model"]
+
+    def llm_config(self, task, **settings):
+        """
+        Returns an autogen `llm_config` for `task` with the other `settings` (temperature, cache_seed, ...).
+        """
+        return {**settings, "config_list": self.config_list_for(task)}
+
+
+class IncidentBudget:
+    """
+    The LLM tokens (and optionally cost) one incident may spend across all agents.
+    """
+
+    def __init__(self, max_tokens, max_cost=0.0):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.calls = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, usage):
+        with self._lock:
+            self.calls += 1
+            self.tokens += usage.get("total_tokens", 0) or 0
+            self.cost += usage.get("cost", 0.0) or 0.0
+
+    def exceeded(self):
+        """
+        Returns why the budget is used up, or None.
+        """
+        with self._lock:
+            if self.max_tokens and self.tokens >= self.max_tokens:
+                return f"{self.tokens} of {self.max_tokens} tokens used"
+            if self.max_cost and self.cost >= self.max_cost:
+                return f"${self.cost:.4f} of ${self.max_cost:.4f} spent"
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "tokens": self.tokens, "cost": self.cost, "max_tokens": self.max_tokens,
+                    "max_cost": self.max_cost}
+
+
+class UsageLedger:
+    """
+    Process-wide accounting of LLM calls, tokens, cost and latency per agent and model, and enforcement of
+    per-incident budgets.
+
+    `incident_budget()` opens a budget (INCIDENT_TOKEN_BUDGET tokens, INCIDENT_COST_BUDGET dollars, 0 meaning
+    unlimited) for the calls made in its context, including the incident pipeline's stage threads. Callers check
+    `within_budget` to skip optional LLM work, and `check_budget` raises `BudgetExceededError` before a call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+        self.budget_metrics = {"opened": 0, "exceeded": 0, "rejected_calls": 0}
+        self.max_tokens = int(os.getenv("INCIDENT_TOKEN_BUDGET", "60000"))
+        self.max_cost = float(os.getenv("INCIDENT_COST_BUDGET", "0"))
+
+    def record(self, agent_name, usage, seconds=None):
+        """
+        Records one LLM call (or chat) of `agent_name` and charges it to the active incident budget.
+        """
+        if seconds is None:
+            seconds = usage.get("seconds", 0.0) or 0.0
+        with self._lock:
+            agent = self._agents.setdefault(agent_name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                         "cost": 0.0, "seconds": 0.0, "max_seconds": 0.0,
+                                                         "models": {}})
+            agent["calls"] += 1
+            agent["prompt_tokens"] += usage.get("prompt_tokens", 0) or 0
+            agent["completion_tokens"] += usage.get("completion_tokens", 0) or 0
+            agent["cost"] += usage.get("cost", 0.0) or 0.0
+            agent["seconds"] += seconds
+            agent["max_seconds"] = max(agent["max_seconds"], seconds)
+            model = usage.get("model") or "unknown"
+            agent["models"][model] = agent["models"].get(model, 0) + 1
+        budget = _current_budget.get()
+        if budget is not None:
+            budget.charge(usage)
+
+    def within_budget(self):
+        budget = _current_budget.get()
+        return budget is None or budget.exceeded() is None
+
+    def check_budget(self, agent_name):
+        budget = _current_budget.get()
+        reason = budget.exceeded() if budget is not None else None
+        if reason is not None:
+            with self._lock:
+                self.budget_metrics["rejected_calls"] += 1
+            raise BudgetExceededError(f"Incident LLM budget exceeded ({reason}), not calling {agent_name}")
+
+    @contextmanager
+    def incident_budget(self, max_tokens=None, max_cost=None):
+        """
+        Yields the budget of the incident handled in this context. Nested calls share the outermost budget, so
+        callers that prioritize and declare an incident can open it around both.
+        """
+        active = _current_budget.get()
+        if active is not None:
+            yield active
+            return
+        budget = IncidentBudget(max_tokens if max_tokens is not None else self.max_tokens,
+                                max_cost if max_cost is not None else self.max_cost)
+        token = _current_budget.set(budget)
+        with self._lock:
+            self.budget_metrics["opened"] += 1
+        try:
+            yield budget
+        finally:
+            _current_budget.reset(token)
+            if budget.exceeded() is not None:
+                with self._lock:
+                    self.budget_metrics["exceeded"] += 1
+
+    def stats(self):
+        with self._lock:
+            agents = {}
+            for name, agent in self._agents.items():
+                agents[name] = {**agent, "models": dict(agent["models"]),
+                                "mean_seconds": agent["seconds"] / agent["calls"] if agent["calls"] else 0.0}
+            return {"agents": agents, "budgets": dict(self.budget_metrics)}
+
+
+# Shared by every agent of the process
+usage_ledger = UsageLedger()
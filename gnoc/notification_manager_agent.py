@@ -1,84 +1,30 @@
-import json
 import os
 import base64
-import re
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import json5
 import pytz
 from dotenv import load_dotenv
 from google.oauth2.credentials import Credentials
 from autogen import AssistantAgent, config_list_from_json
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from google_services import GoogleServiceCache
+from notification_outbox import NotificationOutbox
+from email_templates import fallback_narrative, render_email
+from llm_json import NARRATIVES_SCHEMA, parse_llm_json
+from llm_usage import add_usage, generate_with_usage
+from model_router import ModelRouter, usage_ledger
+from llm_cache import llm_cache
+from tracing import span
 
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+CALENDAR_SCOPES = ["https://www.googleapis.com/auth/gmail.send", 'https://www.googleapis.com/auth/calendar']
 
-def extract_json_object(text):
-    """
-    Extracts the JSON object portion from text.
-    It looks for the first '{' and the last '}' and returns that substring.
-    """
-    start = text.find('{')
-    end = text.rfind('}')
-    if start != -1 and end != -1 and end > start:
-        return text[start:end+1]
-    return text
-
-def escape_json_string_literals(json_text):
-    """
-    Finds JSON string literals and escapes literal newline characters inside them.
-    This regex matches strings and replaces unescaped newlines with \\n.
-    """
-    pattern = re.compile(r'"((?:\\.|[^"\\])*)"')
-
-    def repl(match):
-        content = match.group(1)
-        # Replace any literal newline with the escaped newline.
-        fixed_content = content.replace("\n", "\\n")
-        return f'"{fixed_content}"'
-
-    return pattern.sub(repl, json_text)
-
-def parse_generated_json(response_text):
-    """
-    Attempts to parse a JSON string.
-    First, it extracts the JSON portion from the response.
-    Then it tries to parse it as-is.
-    If parsing fails, it fixes unescaped newlines inside string literals and tries again.
-    """
-    # Remove markdown fences if present
-    if response_text.strip().startswith("```json"):
-        response_text = response_text.strip().strip("```json").strip("```")
-
-    # Extract JSON object portion in case there is extra text
-    extracted = extract_json_object(response_text)
-    try:
-        return json5.loads(extracted)
-    except Exception as e:
-        print("Initial JSON parse failed:", e)
-        fixed_text = escape_json_string_literals(extracted)
-        try:
-            return json5.loads(fixed_text)
-        except Exception as e2:
-            try:
-                pattern = r'(href=")([^"]*)(")'
-                escaped_json_str = re.sub(pattern, r'href=\\"\2\\"', fixed_text)
-                return json5.loads(escaped_json_str)
-            except Exception as e3:
-                print("Parsing after fixing newlines also failed:", e3)
-                raise
-
-def fix_json_string(json_str):
-    """
-    Attempt to fix common formatting issues in the JSON string.
-    This function performs a simple replacement to escape literal newline characters
-    that are not already escaped. Adjust or extend the regex as needed.
-    """
-    # This regex looks for newline characters that are not preceded by a backslash.
-    fixed = re.sub(r'(?<!\\)\n', r'\\n', json_str)
-    return fixed
 
 class NotificationService:
     def __init__(self, model_config_file: str=None):
@@ -88,213 +34,211 @@ class NotificationService:
         else:
             self.config_list = config_list_from_json(env_or_file=model_config_file)
         # self.config_list = config_list_from_json(env_or_file=os.path.join(os.getcwd(), "MODEL_CONFIG_LIST"))
-        self.llm_config = {
-            "config_list": self.config_list,
-            "temperature": 0.9,
-            "cache_seed": None
-        }
-        self.analysis_agent, self.email_agent = self.create_agents()
+        # Narratives are short and formulaic, they run on the small model tier
+        self.router = ModelRouter(self.config_list)
+        # Narratives are creative and already reused per issue below, they opt out of the shared LLM cache
+        self.llm_config = self.router.llm_config("email_narrative", temperature=0.9,
+                                                 **llm_cache.cache_config("EmailAgent", enabled=False))
+        self.email_agent = self.create_agents()
+        # `llm` asks for the narrative paragraph of the emails, `none` renders them from the templates alone
+        self.narrative_mode = os.getenv("EMAIL_NARRATIVE_MODE", "llm").lower()
+        self.narrative_cache_size = int(os.getenv("EMAIL_NARRATIVE_CACHE_SIZE", "256"))
+        self._narratives = OrderedDict()
+        self._narratives_lock = threading.Lock()
+        # Tokens are loaded once and refreshed near expiry; services are memoized per thread
+        self.gmail_services = GoogleServiceCache(
+            "gmail", lambda: self.load_credentials("gmail_token.json", GMAIL_SCOPES),
+            on_refresh=lambda creds: self.save_credentials("gmail_token.json", creds))
+        self.calendar_services = GoogleServiceCache(
+            "calendar", lambda: self.load_credentials("calendar_token.json", CALENDAR_SCOPES),
+            on_refresh=lambda creds: self.save_credentials("calendar_token.json", creds))
+        # Emails and invites are queued durably and sent in batches by a background worker
+        self.outbox = None
+        if os.getenv("NOTIFICATION_OUTBOX_ENABLED", "true").lower() == "true":
+            self.outbox = NotificationOutbox({"email": self.send_email_batch,
+                                              "meet_invite": self.send_meet_invite_batch}).start()
+
+    def load_credentials(self, token_file, scopes):
+        creds = None
+        if os.path.exists(token_file):
+            creds = Credentials.from_authorized_user_file(token_file, scopes)
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file("credentials.json", scopes)
+                creds = flow.run_local_server(port=0)
+            self.save_credentials(token_file, creds)
+        return creds
+
+    @staticmethod
+    def save_credentials(token_file, creds):
+        with open(token_file, 'w') as token:
+            token.write(creds.to_json())
+
+    def client_stats(self):
+        stats = [self.gmail_services.stats(), self.calendar_services.stats()]
+        if self.outbox is not None:
+            stats.append({"name": "notification_outbox", **self.outbox.stats()})
+        return stats
 
     def create_agents(self):
-        analysis_agent = AssistantAgent(
-            name="AnalysisAgent",
-            system_message="You analyze the given description and generate a detailed report.",
-            llm_config={
-                "timeout": 600,
-                "cache_seed": None,
-                "config_list": self.config_list,
-            },
-        )
-
         email_agent = AssistantAgent(
             name="EmailAgent",
-            system_message="You take the analysis and generate a professional email with the details.",
-            llm_config={
-                "timeout": 600,
-                "cache_seed": None,
-                "config_list": self.config_list,
-            },
+            system_message="You write short, plain-text incident narratives for notification emails.",
+            llm_config=self.llm_config,
         )
 
-        return analysis_agent, email_agent
+        return email_agent
 
     def generate_insensitive_email(self, description, segment, product, priority, impact, jira_id, jira_link, status_io_link,
                        white_board_link):
-        analysis_response = self.analysis_agent.generate_reply(
-            messages=[{"role": "user", "content": f"""
-                Analyze the following description and provide a detailed breakdown:
-                {description}
-                {segment}
-                {product}
-                {priority}
-                {impact}
-                {jira_id}
-                {jira_link}
-                {status_io_link}
-                {white_board_link}
-            """}]
-        )
-
-        analysis = analysis_response.get("content", "Analysis not available.")
-
-        email_response = self.email_agent.generate_reply(
-            messages=[{"role": "user", "content": f"""
-                Compose a professional email with the following analysis:
-                {analysis}.
-                You must return your response strictly in the following JSON format. Please add the escape characters as well if needed:
-                {{
-                    "subject": "<email_subject_value>",
-                    "body": "<email_body_value>"
-                }}
-                Follow these rules:
-                1. Compose an email in a thoughtful and helpful way.
-                2. The email should be polite and it should show the urgency based on the priority of the issue.
-                3. Email body should be support HTML tags.
-                4. Email body should contain the Segment, Product, Priority and Impact information.
-                5. Email body should contain jira_link, status_io_link and white_board_link.
-                6. jira_link should be displayed as <a href="{jira_link}">{jira_id}</a>
-                7. status_io_link should be displayed as <a href="{status_io_link}">Status IO Page</a>
-                8. white_board_link should be displayed as <a href="{white_board_link}">White Board</a>
-                9. Email body and subject should not include any quantitative data such as amount, number of transactions, number customers of etc.
-                10. Email signature should be.
-                ```
-                Best Regards,
-                AI Team,
-                GNOC Project
-                ```
-            """}]
-        )
-
-        email_content = email_response.get("content", "Email generation failed.")
-        print(f"email_content:: generate_insensitive_email:- {email_content}")
-        # Try parsing the JSON, with a fallback that fixes missing escape characters.
-        try:
-            return parse_generated_json(email_content)
-        except Exception as parse_error:
-            print("Failed to parse email content:", parse_error)
-            return None
+        return self.generate_emails(description, segment, product, priority, impact, jira_id, jira_link,
+                                    status_io_link, white_board_link)["insensitive"]
 
     def generate_sensitive_email(self, description, segment, product, priority, impact, jira_id, jira_link, status_io_link,
                        white_board_link):
-        analysis_response = self.analysis_agent.generate_reply(
-            messages=[{"role": "user", "content": f"""
-                Analyze the following description and provide a detailed breakdown:
+        return self.generate_emails(description, segment, product, priority, impact, jira_id, jira_link,
+                                    status_io_link, white_board_link)["sensitive"]
+
+    def generate_narratives(self, description, segment, product, priority, impact):
+        """
+        Asks the LLM for the narrative paragraph of both emails in one call. Narratives do not depend on the
+        incident's links, so they are cached by issue.
+
+        Returns:
+          The narratives as a dict keyed by variant (None if they could not be generated) and the token usage.
+        """
+        key = (description, segment, product, priority, impact)
+        with self._narratives_lock:
+            if key in self._narratives:
+                self._narratives.move_to_end(key)
+                return self._narratives[key], add_usage()
+        if not usage_ledger.within_budget():
+            print("Incident LLM budget exceeded, using the templated narratives")
+            return None, add_usage()
+
+        narrative_content, usage = generate_with_usage(self.email_agent, f"""
+                Write the narrative paragraph of two incident notification emails about the following issue:
                 {description}
-                {segment}
-                {product}
-                {priority}
-                {impact}
-                {jira_id}
-                {jira_link}
-                {status_io_link}
-                {white_board_link}
-            """}]
-        )
-
-        analysis = analysis_response.get("content", "Analysis not available.")
-
-        email_response = self.email_agent.generate_reply(
-            messages=[{"role": "user", "content": f"""
-                Compose a professional email with the following analysis:
-                {analysis}.
-                You must return your response strictly in the following JSON format. Please add the escape characters as well if needed:
+                Segment: {segment}, Product: {product}, Priority: {priority}, Impact: {impact}.
+                The "insensitive" email goes to a wide audience and the "sensitive" email goes to a restricted audience.
+                You must return your response strictly in the following JSON format:
                 {{
-                    "subject": "<email_subject_value>",
-                    "body": "<email_body_value>"
+                    "insensitive": "<narrative>",
+                    "sensitive": "<narrative>"
                 }}
                 Follow these rules:
-                1. Compose an email in a thoughtful and helpful way.
-                2. The email should be polite and it should show the urgency based on the priority of the issue.
-                3. Email body should be support HTML tags.
-                4. Email body should contain the Segment, Product, Priority and Impact information.
-                5. Email body should contain jira_link, status_io_link and white_board_link.
-                6. jira_link should be displayed as <a href="{jira_link}">{jira_id}</a>
-                7. status_io_link should be displayed as <a href="{status_io_link}">Status IO Page</a>
-                8. white_board_link should be displayed as <a href="{white_board_link}">White Board</a>
-                9. Email body and subject should include any quantitative data such as amount, number of transactions, number customers of etc.
-                10. Email signature should be.
-                ```
-                Best Regards,
-                AI Team,
-                GNOC Project
-                ```
-            """}]
-        )
-
-        email_content = email_response.get("content", "Email generation failed.")
-        print(f"email_content:: generate_sensitive_email:- {email_content}")
-        # Try parsing the JSON, with a fallback that fixes missing escape characters.
+                1. Each narrative is plain text of at most 80 words, without HTML, greeting, links or signature.
+                2. It should be polite and show the urgency based on the priority of the issue.
+                3. The insensitive narrative should not include any quantitative data such as amount, number of transactions, number customers of etc.
+                4. The sensitive narrative should include any quantitative data such as amount, number of transactions, number customers of etc.
+            """)
+        print(f"narrative_content:: generate_narratives:- {narrative_content}")
         try:
-            return parse_generated_json(email_content)
+            narratives = parse_llm_json(narrative_content, NARRATIVES_SCHEMA)
         except Exception as parse_error:
-            print("Failed to parse email content:", parse_error)
-            return None
+            print("Failed to parse narrative content:", parse_error)
+            return None, usage
+
+        with self._narratives_lock:
+            self._narratives[key] = narratives
+            while len(self._narratives) > self.narrative_cache_size:
+                self._narratives.popitem(last=False)
+        return narratives, usage
+
+    def generate_emails(self, description, segment, product, priority, impact, jira_id, jira_link, status_io_link,
+                        white_board_link):
+        """
+        Renders the insensitive and sensitive emails from the local templates in `email_templates`. The LLM only
+        writes their narrative paragraphs, in one call (skipped when EMAIL_NARRATIVE_MODE is `none`); without a
+        narrative the emails fall back to a templated one.
+
+        Returns:
+          A dict with the `insensitive` and `sensitive` emails (each a dict with `subject` and `body`) and the
+          token `usage` of the `narrative` call and its `total`.
+        """
+        fields = {"description": description, "segment": segment, "product": product, "priority": priority,
+                  "impact": impact, "jira_id": jira_id, "jira_link": jira_link, "status_io_link": status_io_link,
+                  "white_board_link": white_board_link}
+        with span("agent.generate_emails", narrative_mode=self.narrative_mode) as emails_span:
+            narratives, usage = None, add_usage()
+            if self.narrative_mode == "llm":
+                narratives, usage = self.generate_narratives(description, segment, product, priority, impact)
+            emails_span.set(fallback_narrative=narratives is None)
+
+            emails = {}
+            for variant in ("insensitive", "sensitive"):
+                narrative = (narratives or {}).get(variant) or fallback_narrative(variant, **fields)
+                emails[variant] = render_email(variant, narrative, **fields)
+        emails["usage"] = {"narrative": usage, "total": add_usage(usage)}
+        return emails
+
+    @staticmethod
+    def meet_invite_event(email_to, email_subject, email_body, event_id=None):
+        timezone = pytz.timezone("Asia/Kolkata")
+        current_time = datetime.now(timezone)
+        future_time = current_time + timedelta(hours=2)
+        formatted_time = current_time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        start = f"{formatted_time[:-2]}:{formatted_time[-2:]}"
+        formatted_time = future_time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        end = f"{formatted_time[:-2]}:{formatted_time[-2:]}"
+
+        attendees = [{"email": emailId} for emailId in email_to.split(";")]
+        event = {
+            "summary": email_subject,
+            "location": "Virtual",
+            "description": email_body,
+            "start": {
+                "dateTime": start,  # Start time in ISO 8601
+                "timeZone": "Asia/Kolkata",
+            },
+            "end": {
+                "dateTime": end,  # End time in ISO 8601
+                "timeZone": "Asia/Kolkata",
+            },
+            "attendees": attendees,
+            "conferenceData": {
+                "createRequest": {
+                    "requestId": event_id or uuid.uuid4().hex,
+                    "conferenceSolutionKey": {"type": "hangoutsMeet"},
+                },
+            },
+            "reminders": {
+                "useDefault": False,
+                "overrides": [
+                    {"method": "email", "minutes": 24 * 60},
+                    {"method": "popup", "minutes": 10},
+                ],
+            },
+        }
+        if event_id:
+            # A client-chosen id makes a repeated insert fail with 409 instead of creating a second event
+            event["id"] = event_id
+        return event
+
+    @staticmethod
+    def email_message(email_to, email_from, email_subject, email_body):
+        message = MIMEMultipart()
+        message.attach(MIMEText(email_body, 'html'))
+        message['to'] = email_to
+        message['from'] = email_from
+        message['subject'] = email_subject
+        return base64.urlsafe_b64encode(message.as_bytes()).decode()
 
     def send_meet_invite(self, email_to, email_subject, email_body):
         try:
-            timezone = pytz.timezone("Asia/Kolkata")
-            current_time = datetime.now(timezone)
-            future_time = current_time + timedelta(hours=2)
-            formatted_time = current_time.strftime("%Y-%m-%dT%H:%M:%S%z")
-            start = f"{formatted_time[:-2]}:{formatted_time[-2:]}"
-            formatted_time = future_time.strftime("%Y-%m-%dT%H:%M:%S%z")
-            end = f"{formatted_time[:-2]}:{formatted_time[-2:]}"
-
-            creds = None
-            if os.path.exists("calendar_token.json"):
-                creds = Credentials.from_authorized_user_file("calendar_token.json",
-                                                              ["https://www.googleapis.com/auth/gmail.send",
-                                                               'https://www.googleapis.com/auth/calendar'])
-
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        "credentials.json",
-                        ["https://www.googleapis.com/auth/gmail.send", 'https://www.googleapis.com/auth/calendar'])
-                    creds = flow.run_local_server(port=0)
-                with open('calendar_token.json', 'w') as token:
-                    token.write(creds.to_json())
-
-            calendar_service = build('calendar', 'v3', credentials=creds)
-
-            attendees = [{"email": emailId} for emailId in email_to.split(";")]
-            print(f'Sending Calender Invite to :-  {attendees}')
-            event = {
-                "summary": email_subject,
-                "location": "Virtual",
-                "description": email_body,
-                "start": {
-                    "dateTime": start,  # Start time in ISO 8601
-                    "timeZone": "Asia/Kolkata",
-                },
-                "end": {
-                    "dateTime": end,  # End time in ISO 8601
-                    "timeZone": "Asia/Kolkata",
-                },
-                "attendees": attendees,
-                "conferenceData": {
-                    "createRequest": {
-                        "requestId": "randomString123",
-                        "conferenceSolutionKey": {"type": "hangoutsMeet"},
-                    },
-                },
-                "reminders": {
-                    "useDefault": False,
-                    "overrides": [
-                        {"method": "email", "minutes": 24 * 60},
-                        {"method": "popup", "minutes": 10},
-                    ],
-                },
-            }
+            event = self.meet_invite_event(email_to, email_subject, email_body)
+            print(f'Sending Calender Invite to :-  {event["attendees"]}')
 
             # Create the event
-            event_calendar = calendar_service.events().insert(
-                calendarId="primary",
-                body=event,
-                conferenceDataVersion=1
-            ).execute()
+            with self.calendar_services.lease('calendar', 'v3') as calendar_service:
+                event_calendar = calendar_service.events().insert(
+                    calendarId="primary",
+                    body=event,
+                    conferenceDataVersion=1
+                ).execute()
 
             print(f"Event created: {event_calendar.get('htmlLink')}")
         except Exception as e:
@@ -302,55 +246,109 @@ class NotificationService:
 
     def send_email(self, email_to, email_from, email_subject, email_body):
         try:
-            creds = None
-            if os.path.exists("gmail_token.json"):
-                creds = Credentials.from_authorized_user_file("gmail_token.json",
-                                                              ["https://www.googleapis.com/auth/gmail.send"])
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file("credentials.json",
-                                                                     ["https://www.googleapis.com/auth/gmail.send"])
-                    creds = flow.run_local_server(port=0)
-                with open('gmail_token.json', 'w') as token:
-                    token.write(creds.to_json())
-
-            gmail_service = build("gmail", "v1", credentials=creds)
-
-            message = MIMEMultipart()
-            message.attach(MIMEText(email_body, 'html'))
-            message['to'] = email_to
-            message['from'] = email_from
-            message['subject'] = email_subject
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-
-            result = gmail_service.users().messages().send(userId="me", body={"raw": raw_message}).execute()
+            raw_message = self.email_message(email_to, email_from, email_subject, email_body)
+            with self.gmail_services.lease('gmail', 'v1') as gmail_service:
+                result = gmail_service.users().messages().send(userId="me", body={"raw": raw_message}).execute()
             print(f"Email sent successfully! Message ID: {result['id']}")
         except Exception as e:
             print(f"Failed to send email: {e}")
 
-    def sensitive_notification_tool(self, subject, body):
+    @staticmethod
+    def execute_batch(service, requests):
+        """
+        Sends `requests` ({outbox id: API request}) as one batch HTTP request; returns {outbox id: (ok, detail)}.
+        """
+        outcomes = {}
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                outcomes[int(request_id)] = (True, response)
+            elif getattr(getattr(exception, "resp", None), "status", None) == 409:
+                # The event was created by an earlier attempt
+                outcomes[int(request_id)] = (True, {"duplicate": True})
+            else:
+                outcomes[int(request_id)] = (False, str(exception))
+
+        batch = service.new_batch_http_request(callback=callback)
+        for outbox_id, request in requests.items():
+            batch.add(request, request_id=str(outbox_id))
+        with span("http.google.batch", requests=len(requests),
+                  payload_bytes=sum(len(request.body or "") for request in requests.values())):
+            batch.execute()
+        return outcomes
+
+    def send_email_batch(self, items):
+        with self.gmail_services.lease('gmail', 'v1') as gmail_service:
+            messages = gmail_service.users().messages()
+            outcomes = self.execute_batch(gmail_service, {
+                outbox_id: messages.send(userId="me", body={"raw": payload["raw"]}) for outbox_id, payload in items})
+        for outbox_id, (ok, detail) in outcomes.items():
+            if ok:
+                print(f"Email sent successfully! Message ID: {detail.get('id')}")
+            else:
+                print(f"Failed to send email: {detail}")
+        return {outbox_id: (ok, {"id": detail.get("id")} if ok else detail)
+                for outbox_id, (ok, detail) in outcomes.items()}
+
+    def send_meet_invite_batch(self, items):
+        with self.calendar_services.lease('calendar', 'v3') as calendar_service:
+            events = calendar_service.events()
+            outcomes = self.execute_batch(calendar_service, {
+                outbox_id: events.insert(calendarId="primary", body=payload["event"], conferenceDataVersion=1)
+                for outbox_id, payload in items})
+        for outbox_id, (ok, detail) in outcomes.items():
+            if ok:
+                print(f"Event created: {detail.get('htmlLink')}")
+            else:
+                print(f"Failed to send meet invite: {detail}")
+        return {outbox_id: (ok, {"htmlLink": detail.get("htmlLink")} if ok else detail)
+                for outbox_id, (ok, detail) in outcomes.items()}
+
+    def notify(self, email_to, email_from, email_subject, email_body, meet_invite, dedupe_key):
+        """
+        Queues the email (and meet invite) in the outbox, or sends them right away when the outbox is disabled.
+        Returns False if a notification with the same dedupe key was already queued.
+        """
+        if self.outbox is None:
+            self.send_email(email_to, email_from, email_subject, email_body)
+            if meet_invite:
+                self.send_meet_invite(email_to, email_subject, email_body)
+            return True
+        if dedupe_key is None:
+            dedupe_key = hashlib.sha256("\0".join([email_to, email_subject, email_body]).encode()).hexdigest()
+        queued = self.outbox.enqueue(
+            "email", {"raw": self.email_message(email_to, email_from, email_subject, email_body)},
+            f"{dedupe_key}:email")
+        if meet_invite:
+            event_id = hashlib.sha256(f"{dedupe_key}:meet_invite".encode()).hexdigest()
+            queued = self.outbox.enqueue(
+                "meet_invite", {"event": self.meet_invite_event(email_to, email_subject, email_body, event_id)},
+                f"{dedupe_key}:meet_invite") or queued
+        return queued
+
+    def sensitive_notification_tool(self, subject, body, dedupe_key=None):
         try:
             to = os.getenv("MERCHANT_SENSITIVE_TO_EMAIL")
             if "issuing" in body.lower():
                 to = os.getenv("ISSUING_SENSITIVE_TO_EMAIL")
             from_email = os.getenv("FROM_EMAIL")
-            self.send_email(to, from_email, subject, body)
-            self.send_meet_invite(to, subject, body)
-            return f"Sensitive notification sent successfully to {to}"
+            queued = self.notify(to, from_email, subject, body, True, dedupe_key)
+            if self.outbox is None:
+                return f"Sensitive notification sent successfully to {to}"
+            return f"Sensitive notification {'queued' if queued else 'already queued'} for {to}"
         except Exception as e:
             print(f"Failed to send sensitive notification: {e}")
 
-    def insensitive_notification_tool(self, subject, body):
+    def insensitive_notification_tool(self, subject, body, dedupe_key=None):
         try:
             to = os.getenv("MERCHANT_INSENSITIVE_TO_EMAIL")
             if "issuing" in body.lower():
                 to = os.getenv("ISSUING_INSENSITIVE_TO_EMAIL")
             from_email = os.getenv("FROM_EMAIL")
-            self.send_email(to, from_email, subject, body)
-            # self.send_meet_invite(to, subject, body)
-            return f"Insensitive notification sent successfully to {to}"
+            queued = self.notify(to, from_email, subject, body, False, dedupe_key)
+            if self.outbox is None:
+                return f"Insensitive notification sent successfully to {to}"
+            return f"Insensitive notification {'queued' if queued else 'already queued'} for {to}"
         except Exception as e:
             print(f"Failed to send insensitive notification: {e}")
 
@@ -386,3 +384,5 @@ if __name__ == "__main__":
     print("===========================")
 
     service.sensitive_notification_tool(email.get("subject"), email.get("body"))
+    if service.outbox is not None:
+        service.outbox.drain()
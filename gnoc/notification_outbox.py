@@ -0,0 +1,194 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from tracing import span
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT,
+    result TEXT,
+    owner TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class NotificationOutbox:
+    """
+    A durable SQLite outbox for notifications, drained by a background worker.
+
+    `enqueue` stores a notification under a dedupe key and returns immediately; enqueueing the same key again is a
+    no-op, so retried pipeline stages never notify twice. The worker claims due notifications in batches of
+    `batch_size` per kind and hands each batch to the sender registered for that kind, which returns the outcome
+    of every notification. Failures are retried with exponential backoff up to `max_attempts` times.
+
+    Several processes may share one outbox file (e.g. Streamlit replicas started in the same directory). A claimed
+    batch is leased to the claiming outbox for `lease_seconds`; other outboxes only take it over once the lease
+    has expired, i.e. when its owner died mid-batch. Those notifications are sent again, so delivery is
+    at-least-once for that window; senders that can, make their requests idempotent.
+    """
+
+    def __init__(self, senders, path=None, batch_size=None, max_attempts=None, backoff_seconds=None,
+                 poll_interval=None, lease_seconds=None):
+        # senders: {kind: sender(list of (id, payload)) -> {id: (ok, result_or_error)}}
+        self.senders = senders
+        self.path = path or os.getenv("NOTIFICATION_OUTBOX_PATH", "notification_outbox.sqlite3")
+        self.batch_size = batch_size or int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", "50"))
+        self.max_attempts = max_attempts or int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", "5"))
+        self.backoff_seconds = backoff_seconds or float(os.getenv("NOTIFICATION_OUTBOX_BACKOFF_SECONDS", "2"))
+        self.poll_interval = poll_interval or float(os.getenv("NOTIFICATION_OUTBOX_POLL_SECONDS", "5"))
+        # Must exceed the time a sender takes for a whole batch, or a live owner's batch is sent twice
+        self.lease_seconds = lease_seconds or float(os.getenv("NOTIFICATION_OUTBOX_LEASE_SECONDS", "300"))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Held for a whole drain, so a caller's drain also waits for the batch the worker has in flight
+        self._drain_lock = threading.Lock()
+        self._stopped = False
+        self.metrics = {"enqueued": 0, "duplicates": 0, "batches": 0, "sent": 0, "retries": 0, "failed": 0,
+                        "reclaimed": 0, "lost_leases": 0}
+        with closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def enqueue(self, kind, payload, dedupe_key):
+        """
+        Stores a notification for delivery; returns False if one with the same dedupe key already exists.
+        """
+        if kind not in self.senders:
+            raise ValueError(f"No sender registered for {kind} notifications")
+        now = time.time()
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO outbox (dedupe_key, kind, payload, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", (dedupe_key, kind, json.dumps(payload), now, now))
+        created = cursor.rowcount == 1
+        with self._lock:
+            self.metrics["enqueued" if created else "duplicates"] += 1
+        self._wake.set()
+        return created
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                # Batches left in flight by a dead process are claimed again once their lease expires
+                self._thread = threading.Thread(target=self._run, name="notification-outbox", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def drain(self):
+        """
+        Sends every due notification in the calling thread; returns the number of notifications handled.
+        """
+        handled = 0
+        with self._drain_lock:
+            for kind in self.senders:
+                while True:
+                    batch = self._claim(kind)
+                    if not batch:
+                        break
+                    self._deliver(kind, batch)
+                    handled += len(batch)
+        return handled
+
+    def stats(self):
+        with closing(self._connect()) as connection:
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            latency = connection.execute(
+                "SELECT AVG(sent_at - created_at) FROM outbox WHERE status = 'sent'").fetchone()[0]
+        with self._lock:
+            return {**self.metrics, "statuses": counts, "mean_delivery_seconds": latency or 0.0}
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Notification outbox worker failed: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self, kind):
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, payload, attempts, status FROM outbox WHERE kind = ? AND ("
+                "(status = 'pending' AND next_attempt_at <= ?) OR "
+                "(status = 'sending' AND (lease_expires_at IS NULL OR lease_expires_at <= ?))) "
+                "ORDER BY id LIMIT ?", (kind, now, now, self.batch_size)).fetchall()
+            connection.executemany("UPDATE outbox SET status = 'sending', owner = ?, lease_expires_at = ? WHERE id = ?",
+                                   [(self.owner, now + self.lease_seconds, row[0]) for row in rows])
+            connection.execute("COMMIT")
+        reclaimed = sum(row[3] == "sending" for row in rows)
+        if reclaimed:
+            print(f"Reclaimed {reclaimed} {kind} notifications whose sender's lease expired")
+            with self._lock:
+                self.metrics["reclaimed"] += reclaimed
+        return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts, _ in rows]
+
+    def _deliver(self, kind, batch):
+        # `retries` counts the earlier attempts of the notifications in the batch
+        with span(f"notification.deliver.{kind}", notifications=len(batch),
+                  retries=sum(attempts for _, _, attempts in batch)) as deliver_span:
+            try:
+                outcomes = self.senders[kind]([(row_id, payload) for row_id, payload, _ in batch])
+            except Exception as e:
+                outcomes = {row_id: (False, str(e)) for row_id, _, _ in batch}
+            deliver_span.set(failed=sum(not outcome[0] for outcome in outcomes.values()))
+        now = time.time()
+        updates = []
+        for row_id, _, attempts in batch:
+            ok, detail = outcomes.get(row_id, (False, "No outcome reported by the sender"))
+            if ok:
+                updates.append(("sent", attempts + 1, now, now, None, json.dumps(detail), row_id, self.owner))
+                key = "sent"
+            elif attempts + 1 >= self.max_attempts:
+                updates.append(("failed", attempts + 1, now, None, str(detail), None, row_id, self.owner))
+                key = "failed"
+                print(f"Giving up on {kind} notification {row_id} after {attempts + 1} attempts: {detail}")
+            else:
+                retry_at = now + self.backoff_seconds * 2 ** attempts
+                updates.append(("pending", attempts + 1, retry_at, None, str(detail), None, row_id, self.owner))
+                key = "retries"
+            with self._lock:
+                self.metrics[key] += 1
+        with closing(self._connect()) as connection:
+            # Rows whose lease another outbox took over are left to it
+            lost = 0
+            connection.execute("BEGIN IMMEDIATE")
+            for update in updates:
+                lost += connection.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, sent_at = ?, last_error = ?, "
+                    "result = ?, owner = NULL, lease_expires_at = NULL WHERE id = ? AND owner = ?",
+                    update).rowcount == 0
+            connection.execute("COMMIT")
+        with self._lock:
+            self.metrics["batches"] += 1
+            self.metrics["lost_leases"] += lost
@@ -0,0 +1,32 @@
+from dataclasses import asdict, dataclass, fields
+
+NOT_APPLICABLE = "NA"
+
+
+@dataclass(frozen=True, slots=True)
+class PrioritizationResult:
+    """
+    The prioritization of one reported issue, as handed from the prioritization agents to the incident pipeline.
+    """
+
+    priority: str
+    impact: str
+    urgency: str
+    description: str
+    summary: str
+    segment: str
+    product: str
+
+    @classmethod
+    def from_dict(cls, result):
+        return cls(**{field.name: str(result.get(field.name) or NOT_APPLICABLE) for field in fields(cls)})
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def actionable(self):
+        """
+        False when the issue is unrelated to GP products and no incident can be declared for it.
+        """
+        return self.priority != NOT_APPLICABLE
@@ -0,0 +1,217 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from priority_identification_agent import PriorityIdentificationAgent
+from hedging import hedger_stats
+from semantic_cache import SemanticCache
+from tracing import span
+
+
+class PriorityAgentPool:
+    """
+    A process-wide pool of warm `PriorityIdentificationAgent` instances.
+
+    Building an agent loads the model config, opens the Chroma client, syncs the priority document and creates
+    two autogen agents. The pool pays that cost once per slot and hands out idle agents to concurrent callers,
+    resetting their conversation state when they are returned.
+
+    Issues the rules compiled from the priority document classify confidently are answered without an agent.
+    Other results are served from a semantic cache when a near-duplicate issue was prioritized recently. The cache
+    is invalidated (and the document re-ingested) when the priority document changes.
+    """
+
+    def __init__(self, size=None, agent_factory=None, warm=True, use_cache=None, use_rules=None):
+        self.size = size or int(os.getenv("PRIORITY_AGENT_POOL_SIZE", "4"))
+        self.agent_factory = agent_factory or self._default_agent_factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._shared_agent = None
+        # Held while the first agent is built, so concurrent callers wait for it instead of building their own
+        self._shared_agent_lock = threading.Lock()
+        self.created = 0
+        self.acquisitions = 0
+        self.waits = 0
+        self.construction_seconds = 0.0
+        if use_cache is None:
+            use_cache = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+        self.use_cache = use_cache
+        self.cache = None
+        if use_rules is None:
+            use_rules = os.getenv("PRIORITY_RULES_ENABLED", "true").lower() == "true"
+        self.use_rules = use_rules
+        self.rules_min_confidence = float(os.getenv("PRIORITY_RULES_MIN_CONFIDENCE", "0.8"))
+        self.rule_hits = 0
+        self.document_check_interval = float(os.getenv("PRIORITY_DOCUMENT_CHECK_INTERVAL_SECONDS", "30"))
+        self._ingestion = None
+        self._document_checked_at = 0.0
+        if warm:
+            self.warm_up()
+
+    def _default_agent_factory(self):
+        # Later agents reuse the config list, Chroma client and ingestion manager (with its embedding model and
+        # cache) loaded by the first one
+        with self._shared_agent_lock:
+            if self._shared_agent is None:
+                self._shared_agent = PriorityIdentificationAgent()
+                return self._shared_agent
+            shared_agent = self._shared_agent
+        return PriorityIdentificationAgent(config_list=shared_agent.config_list,
+                                           chroma_client=shared_agent.chroma_client,
+                                           ingestion_manager=shared_agent.ingestion_manager)
+
+    def _create_agent(self):
+        """
+        Builds the agent of a slot reserved with `_reserve_slot`, giving the slot back if that fails.
+        """
+        started = time.perf_counter()
+        try:
+            agent = self.agent_factory()
+        except Exception:
+            with self._lock:
+                self.created -= 1
+            raise
+        with self._lock:
+            self.construction_seconds += time.perf_counter() - started
+            if self._ingestion is None:
+                self._ingestion = (agent.ingestion_manager, agent.pdf_file)
+                if self.use_cache:
+                    self.cache = SemanticCache(agent.ingestion_manager.embedding_function)
+                    self.cache.set_namespace(agent.ingestion_stats.fingerprint)
+                self._document_checked_at = time.monotonic()
+        return agent
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self.created >= self.size:
+                return False
+            self.created += 1
+            return True
+
+    def warm_up(self):
+        """
+        Creates agents until every slot of the pool is filled.
+        """
+        while self._reserve_slot():
+            self._idle.put(self._create_agent())
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """
+        Yields an idle agent, creating one if the pool is not full yet and waiting otherwise.
+        """
+        try:
+            agent = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                with span("priority.create_agent"):
+                    agent = self._create_agent()
+            else:
+                with self._lock:
+                    self.waits += 1
+                with span("priority.wait_for_agent"):
+                    agent = self._idle.get(timeout=timeout)
+        with self._lock:
+            self.acquisitions += 1
+        try:
+            yield agent
+        finally:
+            agent.reset()
+            self._idle.put(agent)
+
+    def check_document(self):
+        """
+        Re-ingests the priority document and invalidates the cache if the document changed since the last check.
+        """
+        with self._lock:
+            if self._ingestion is None or time.monotonic() - self._document_checked_at < self.document_check_interval:
+                return
+            self._document_checked_at = time.monotonic()
+        ingestion_manager, pdf_file = self._ingestion
+        stats = ingestion_manager.ingest(pdf_file)
+        if not stats.skipped:
+            print(f"Priority document changed, re-ingested:- {stats}")
+        if self.cache is not None:
+            self.cache.set_namespace(stats.fingerprint)
+
+    def classify_with_rules(self, issue_description, follow_up=False):
+        """
+        Returns the rule-based prioritization of the issue, or None when the rules are disabled or not confident.
+
+        Follow-up input (the previous issue with the user's correction appended) is never classified: the rules
+        only match keywords and would ignore an explicit change of priority or product, which the agent applies.
+        """
+        if follow_up or not self.use_rules or self._ingestion is None or self._ingestion[0].rules is None:
+            return None
+        result = self._ingestion[0].rules.prioritize(issue_description, self.rules_min_confidence)
+        if result is not None:
+            with self._lock:
+                self.rule_hits += 1
+        return result
+
+    def prioritize_issue(self, issue_description, follow_up=False):
+        """
+        Prioritizes the issue. `follow_up` marks a correction of an earlier answer, which only the agent handles:
+        neither the rules nor the cache are used, since a similar earlier issue would bring back the rejected answer.
+        """
+        with span("priority.prioritize") as priority_span:
+            self.check_document()
+            result = self.classify_with_rules(issue_description, follow_up)
+            if result is not None:
+                priority_span.set(source="rules", priority=result.get("priority"))
+                return result
+            if self.cache is not None and not follow_up:
+                cached_result = self.cache.lookup(issue_description)
+                if cached_result is not None:
+                    priority_span.set(source="cache", priority=cached_result.get("priority"))
+                    return dict(cached_result)
+
+            with self.acquire() as agent:
+                result = agent.prioritize_issue(issue_description)
+            priority_span.set(source="agent", priority=(result or {}).get("priority"))
+
+        # Unrelated issues are not cached so that a rephrased report still gets a fresh look
+        if self.cache is not None and not follow_up and result is not None and result.get("priority") != "NA":
+            self.cache.store(issue_description, dict(result))
+        return result
+
+    def prioritize_issue_stream(self, issue_description, on_field, follow_up=False):
+        """
+        Streaming variant of `prioritize_issue`; rule-based and cached results are emitted field by field
+        immediately.
+        """
+        with span("priority.prioritize_stream") as priority_span:
+            self.check_document()
+            result = self.classify_with_rules(issue_description, follow_up)
+            if result is None and self.cache is not None and not follow_up:
+                result = self.cache.lookup(issue_description)
+            if result is not None:
+                priority_span.set(source="rules_or_cache", priority=result.get("priority"))
+                for name, value in result.items():
+                    on_field(name, value)
+                return dict(result)
+
+            with self.acquire() as agent:
+                result = agent.prioritize_issue_stream(issue_description, on_field)
+            priority_span.set(source="agent", priority=(result or {}).get("priority"))
+
+        if self.cache is not None and not follow_up and result is not None and result.get("priority") != "NA":
+            self.cache.store(issue_description, dict(result))
+        return result
+
+    def stats(self):
+        cache_stats = self.cache.stats() if self.cache is not None else None
+        with self._lock:
+            return {
+                "cache": cache_stats,
+                "hedging": hedger_stats(),
+                "rule_hits": self.rule_hits,
+                "size": self.size,
+                "created": self.created,
+                "idle": self._idle.qsize(),
+                "acquisitions": self.acquisitions,
+                "waits": self.waits,
+                "construction_seconds": self.construction_seconds,
+            }
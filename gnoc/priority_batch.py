@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tiktoken
+
+from priority_agent_pool import PriorityAgentPool
+
+DEFAULT_PACK_SIZE = 5
+DEFAULT_PACK_TOKENS = 3000
+
+
+def issue_text(issue):
+    if isinstance(issue, str):
+        return issue
+    return issue.get("issue") or issue.get("description") or issue.get("text") or ""
+
+
+def make_packs(issues, pack_size=DEFAULT_PACK_SIZE, pack_tokens=DEFAULT_PACK_TOKENS):
+    """
+    Groups `(issue_id, text)` pairs into packs of at most `pack_size` issues and `pack_tokens` issue tokens.
+    An issue larger than the token budget gets a pack of its own.
+    """
+    encoding = tiktoken.get_encoding("cl100k_base")
+    packs, pack, tokens = [], [], 0
+    for issue_id, text in issues:
+        issue_tokens = len(encoding.encode(text))
+        if pack and (len(pack) >= pack_size or tokens + issue_tokens > pack_tokens):
+            packs.append(pack)
+            pack, tokens = [], 0
+        pack.append((issue_id, text))
+        tokens += issue_tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def prioritize_pack(pool, pack, context_tokens=None):
+    """
+    Prioritizes one pack with a single retrieval and LLM call, falling back to one RAG chat per issue for the
+    issues the packed call did not answer.
+    """
+    with pool.acquire() as agent:
+        if len(pack) > 1:
+            results = agent.prioritize_issues([text for _, text in pack], context_tokens=context_tokens)
+        else:
+            results = [None]
+    for index, (issue_id, text) in enumerate(pack):
+        if results[index] is None:
+            results[index] = pool.prioritize_issue(text)
+    return [(issue_id, result) for (issue_id, _), result in zip(pack, results)]
+
+
+def prioritize_batch(issues, concurrency=4, pack_size=DEFAULT_PACK_SIZE, pack_tokens=DEFAULT_PACK_TOKENS, pool=None,
+                     context_tokens=None):
+    """
+    Prioritizes many issues, yielding `(issue_id, result)` pairs as packs complete. Issues the priority rules
+    classify confidently are yielded first, without an LLM call.
+
+    Args:
+      issues: Issue descriptions, or dicts with an `id` and an `issue` (or `description`/`text`) field.
+      concurrency: Maximum number of packs in flight; also the size of the agent pool created when `pool` is None.
+      pack_size: Maximum number of issues sent in one LLM call.
+      pack_tokens: Maximum number of issue tokens sent in one LLM call.
+      pool: An optional `PriorityAgentPool` to borrow agents from.
+      context_tokens: Token budget of the retrieved context of a pack (default: the per-issue budget times the
+        number of issues of the pack).
+    """
+    pool = pool or PriorityAgentPool(size=concurrency, use_cache=False)
+    numbered = []
+    for index, issue in enumerate(issues):
+        issue_id = issue.get("id", index) if isinstance(issue, dict) else index
+        text = issue_text(issue)
+        result = pool.classify_with_rules(text)
+        if result is not None:
+            yield issue_id, result
+        else:
+            numbered.append((issue_id, text))
+    packs = make_packs(numbered, pack_size, pack_tokens)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="priority-batch") as executor:
+        futures = [executor.submit(prioritize_pack, pool, pack, context_tokens) for pack in packs]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def read_checkpoint(checkpoint_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as checkpoint:
+        return {json.loads(line)["id"] for line in checkpoint if line.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prioritize a JSONL file of issues, streaming JSONL results.")
+    parser.add_argument("--input", required=True, help="JSONL file with one {\"id\": ..., \"issue\": ...} per line.")
+    parser.add_argument("--output", help="JSONL file to append results to (default: stdout).")
+    parser.add_argument("--checkpoint", help="File recording completed issue ids (default: <output>.checkpoint).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pack-size", type=int, default=DEFAULT_PACK_SIZE)
+    parser.add_argument("--pack-tokens", type=int, default=DEFAULT_PACK_TOKENS)
+    parser.add_argument("--context-tokens", type=int, help="Token budget of the retrieved context of a pack.")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or (f"{args.output}.checkpoint" if args.output else None)
+    completed = read_checkpoint(checkpoint_path)
+
+    issues = []
+    with open(args.input, "r") as input_file:
+        for line_number, line in enumerate(input_file):
+            if not line.strip():
+                continue
+            issue = json.loads(line)
+            issue = issue if isinstance(issue, dict) else {"issue": issue}
+            issue.setdefault("id", line_number)
+            if issue["id"] not in completed:
+                issues.append(issue)
+    print(f"Prioritizing {len(issues)} issues ({len(completed)} already completed)", file=sys.stderr)
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+    try:
+        for issue_id, result in prioritize_batch(issues, args.concurrency, args.pack_size, args.pack_tokens,
+                                                 context_tokens=args.context_tokens):
+            output.write(json.dumps({"id": issue_id, "result": result}) + "\n")
+            output.flush()
+            # Failed issues are not checkpointed, so the next run retries them
+            if checkpoint is not None and result is not None:
+                # Results are persisted before their ids are checkpointed, so a crash never loses a result
+                if output is not sys.stdout:
+                    os.fsync(output.fileno())
+                checkpoint.write(json.dumps({"id": issue_id}) + "\n")
+                checkpoint.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+
+if __name__ == "__main__":
+    main()
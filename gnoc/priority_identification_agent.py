@@ -1,13 +1,56 @@
 import os
-import json
+import re
+import time
 import chromadb
 from autogen import AssistantAgent, config_list_from_json
-from autogen.agentchat.contrib.retrieve_user_proxy_agent import RetrieveUserProxyAgent
+from autogen.io import IOStream
+from autogen.agentchat.contrib.vectordb.chromadb import ChromaVectorDB
 from dotenv import load_dotenv
+from priority_ingestion import PriorityIngestionManager
+from priority_retrieval import RerankingRetriever, RerankingRetrieveUserProxyAgent
+from llm_usage import chat_usage, generate_with_usage
+from model_router import ModelRouter, usage_ledger
+from hedging import HedgingOpenAIWrapper, get_hedger
+from llm_cache import llm_cache
+from incremental_json import IncrementalJSONObjectParser
+from llm_json import PRIORITY_SCHEMA, parse_llm_json, validate
+from tracing import span
 # from autogen.retrieve_utils import TEXT_FORMATS
 
+PRIORITY_FIELDS = ("priority", "impact", "urgency", "description", "summary", "segment", "product")
+
+
+def priority_result(final_result):
+    return {field: final_result.get(field) for field in PRIORITY_FIELDS}
+
+
+class TokenStream:
+    """
+    An autogen IOStream that forwards streamed completion chunks to `on_chunk` and drops everything else
+    (the printed chat transcript).
+    """
+
+    ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+    def __init__(self, on_chunk):
+        self.on_chunk = on_chunk
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        # Streamed chunks are the only output printed without a line ending
+        if end == "":
+            self.on_chunk(self.ANSI_ESCAPE.sub("", sep.join(str(obj) for obj in objects)))
+
+    def send(self, message):
+        if type(message).__name__ == "StreamMessage":
+            self.on_chunk(self.ANSI_ESCAPE.sub("", str(getattr(message, "content", ""))))
+
+    def input(self, prompt="", *, password=False):
+        return ""
+
+
 class PriorityIdentificationAgent:
-    def __init__(self, pdf_file_path=None, model_config_file=None, chromadb_file_path=None):
+    def __init__(self, pdf_file_path=None, model_config_file=None, chromadb_file_path=None, config_list=None,
+                 chroma_client=None, ingestion_manager=None):
         # Load environment variables
         load_dotenv()
 
@@ -21,7 +64,9 @@ class PriorityIdentificationAgent:
 
         self.pdf_file = pdf_file_path or os.getenv("PRIORITY_FILE")
         print(f"self.pdf_file:- {self.pdf_file}")
-        if model_config_file is None:
+        if config_list is not None:
+            self.config_list = config_list
+        elif model_config_file is None:
             self.config_list = config_list_from_json(env_or_file=os.getenv("MODEL_CONFIG_FILE"))
         else:
             self.config_list = config_list_from_json(env_or_file=model_config_file)
@@ -33,6 +78,27 @@ class PriorityIdentificationAgent:
             self.chromadb_path = chromadb_file_path
 
         print(f"Loaded config_list: {self.config_list}")
+        # Prioritization runs on the large model tier, failing over to the other entries on timeout
+        self.router = ModelRouter(self.config_list)
+
+        # Sync the priority document into the collection; unchanged documents are not re-embedded
+        self.chroma_client = chroma_client or chromadb.PersistentClient(path=self.chromadb_path)
+        if ingestion_manager is not None:
+            # Shared with the agent that ingested the document, along with its embedding function
+            self.ingestion_manager = ingestion_manager
+            self.ingestion_stats = ingestion_manager.last_stats
+        else:
+            self.ingestion_manager = PriorityIngestionManager(
+                self.chroma_client,
+                collection_name="gnoc-priority-pdf",
+                chunk_token_size=2000,
+                chunk_mode="one_line",
+                embedding_model="text-embedding-004",
+                must_break_at_empty_line=False,
+                manifest_dir=self.chromadb_path,
+            )
+            self.ingestion_stats = self.ingestion_manager.ingest(self.pdf_file)
+            print(f"Priority document ingestion:- {self.ingestion_stats}")
 
         # Initialize AssistantAgent
         self.assistant = AssistantAgent(
@@ -70,29 +136,33 @@ class PriorityIdentificationAgent:
                 "product": "NA",
             }}
             """,
-            llm_config={
-                "timeout": 600,
-                "cache_seed": 42,
-                "config_list": self.config_list,
-            },
+            llm_config=self.router.llm_config("prioritization", **llm_cache.cache_config("assistant")),
         )
+        # Prioritization is the critical path of a P1: completions slower than the usual p95 are hedged
+        if os.getenv("PRIORITY_HEDGING_ENABLED", "true").lower() == "true":
+            self.assistant.client = HedgingOpenAIWrapper(get_hedger("prioritization"), **self.assistant.llm_config)
+
+        # Created on first use by prioritize_issue_stream
+        self.streaming_assistant = None
+
+        # Over-fetches and reranks the one-line chunks, keeping only what fits PRIORITY_CONTEXT_TOKEN_BUDGET
+        self.retriever = RerankingRetriever(self.ingestion_manager, model=self.router.model("prioritization"))
 
         # Initialize RetrieveUserProxyAgent
-        self.ragproxyagent = RetrieveUserProxyAgent(
+        self.ragproxyagent = RerankingRetrieveUserProxyAgent(
+            self.retriever,
             name="ragproxyagent",
             human_input_mode="NEVER",
             retrieve_config={
                 "task": "qa",
-                "docs_path": self.pdf_file,
-                "chunk_token_size": 2000,
-                "model": self.config_list[0]["model"],
-                "client": chromadb.PersistentClient(path=self.chromadb_path),
-                "collection_name": "gnoc-priority-pdf",
-                "chunk_mode": "one_line",
-                "embedding_model": "text-embedding-004",
+                # Ingestion is owned by the ingestion manager, the agent only queries the collection
+                "docs_path": None,
+                "model": self.router.model("prioritization"),
+                "vector_db": ChromaVectorDB(client=self.chroma_client,
+                                            embedding_function=self.ingestion_manager.embedding_function),
+                "collection_name": self.ingestion_manager.collection_name,
                 "get_or_create": True,
-                "must_break_at_empty_line": False,
-                "overwrite": True,
+                "overwrite": False,
             },
             code_execution_config={
                 "work_dir": "auto-gen",
@@ -100,32 +170,139 @@ class PriorityIdentificationAgent:
             },
         )
 
+    def reset(self):
+        """
+        Clears the conversation state of both agents so that the instance can be reused for the next issue.
+        """
+        self.assistant.reset()
+        self.ragproxyagent.reset()
+
     def prioritize_issue(self, issue_description):
         initial_task = f"""Please prioritize the below issue reported by user.
         Issue:- {issue_description}
         """
 
         try:
-            chat_result = self.ragproxyagent.initiate_chat(
-                self.assistant, message=self.ragproxyagent.message_generator, problem=initial_task, n_results=30
+            # Retrieval and embedding spans nest under this one; the rest of its time is the LLM
+            usage_ledger.check_budget(self.assistant.name)
+            with span("agent.prioritize", agent=self.assistant.name) as agent_span:
+                started = time.perf_counter()
+                chat_result = self.ragproxyagent.initiate_chat(
+                    self.assistant, message=self.ragproxyagent.message_generator, problem=initial_task
+                )
+                usage = chat_usage(chat_result)
+                usage_ledger.record(self.assistant.name, usage, time.perf_counter() - started)
+                agent_span.set(model=usage["model"], prompt_tokens=usage["prompt_tokens"],
+                               completion_tokens=usage["completion_tokens"])
+
+            final_result = parse_llm_json(chat_result.summary, PRIORITY_SCHEMA)
+
+            return priority_result(final_result)
+
+        except Exception as e:
+            print(f"Error during prioritization: {e}")
+            return None
+
+    def prioritize_issue_stream(self, issue_description, on_field):
+        """
+        Prioritizes the issue like `prioritize_issue`, calling `on_field(name, value)` for every field of the
+        answer as soon as it has been streamed, so the UI can render the summary and priority before the whole
+        JSON is complete.
+        """
+        if self.streaming_assistant is None:
+            self.streaming_assistant = AssistantAgent(
+                name="assistant",
+                system_message=self.assistant.system_message,
+                llm_config={**self.assistant.llm_config, "stream": True},
             )
+            # Hedged on the first chunk, which is what the user waits for
+            if isinstance(self.assistant.client, HedgingOpenAIWrapper):
+                self.streaming_assistant.client = HedgingOpenAIWrapper(get_hedger("prioritization_stream"),
+                                                                       **self.streaming_assistant.llm_config)
+        initial_task = f"""Please prioritize the below issue reported by user.
+        Issue:- {issue_description}
+        """
 
-            summary = chat_result.summary.strip("```json\n").strip("\n```")
-            final_result = json.loads(summary)
+        parser = IncrementalJSONObjectParser()
 
-            return {
-                "priority": final_result.get("priority"),
-                "impact": final_result.get("impact"),
-                "urgency": final_result.get("urgency"),
-                "description": final_result.get("description"),
-                "summary": final_result.get("summary"),
-                "segment": final_result.get("segment"),
-                "product": final_result.get("product"),
-            }
+        def on_chunk(text):
+            for name, value in parser.feed(text).items():
+                if name in PRIORITY_FIELDS:
+                    on_field(name, value)
 
+        try:
+            usage_ledger.check_budget(self.streaming_assistant.name)
+            with IOStream.set_default(TokenStream(on_chunk)), span("agent.prioritize_stream",
+                                                                  agent=self.streaming_assistant.name) as agent_span:
+                started = time.perf_counter()
+                chat_result = self.ragproxyagent.initiate_chat(
+                    self.streaming_assistant, message=self.ragproxyagent.message_generator, problem=initial_task
+                )
+                usage = chat_usage(chat_result)
+                usage_ledger.record(self.streaming_assistant.name, usage, time.perf_counter() - started)
+                agent_span.set(model=usage["model"], prompt_tokens=usage["prompt_tokens"],
+                               completion_tokens=usage["completion_tokens"])
+            final_result = priority_result(parse_llm_json(chat_result.summary, PRIORITY_SCHEMA))
         except Exception as e:
             print(f"Error during prioritization: {e}")
             return None
+        finally:
+            self.streaming_assistant.reset()
+
+        # Models that do not stream deliver every field at the end
+        for name, value in final_result.items():
+            if name not in parser.fields:
+                on_field(name, value)
+        return final_result
+
+    def retrieve_context(self, queries, token_budget=None):
+        """
+        Queries the priority collection once for all `queries` and returns the reranked chunks of every query,
+        interleaved by rank so every query contributes its best matches first. The context is limited to
+        `token_budget` tokens, by default the per-issue budget times the number of queries.
+        """
+        queries = list(queries)
+        retrieval = self.retriever.retrieve(queries, token_budget or self.retriever.token_budget * len(queries))
+        print(f"Retrieved {retrieval}")
+        return [document["content"] for document in retrieval.documents]
+
+    def prioritize_issues(self, issue_descriptions, context_tokens=None):
+        """
+        Prioritizes several issues with a single retrieval and a single LLM call.
+
+        Returns:
+          A list aligned with `issue_descriptions` holding the prioritization dict of each issue, or None for the
+          issues the model did not answer.
+        """
+        with span("agent.prioritize_batch", issues=len(issue_descriptions)):
+            return self._prioritize_issues(issue_descriptions, context_tokens)
+
+    def _prioritize_issues(self, issue_descriptions, context_tokens):
+        context = "\n".join(self.retrieve_context(issue_descriptions, context_tokens))
+        numbered_issues = "\n".join(f"{index}. {issue}" for index, issue in enumerate(issue_descriptions, 1))
+        task = f"""Please prioritize each of the below issues reported by users independently, based on the context.
+        Return a JSON array with one object per issue, in the same order. Each object must contain an "id" field with
+        the issue number and all the fields of the JSON format you were given.
+        Context:- {context}
+        Issues:-
+        {numbered_issues}
+        """
+
+        reply, usage = generate_with_usage(self.assistant, task)
+        print(f"Packed prioritization of {len(issue_descriptions)} issues used {usage}")
+        try:
+            answers = parse_llm_json(reply, [dict])
+        except Exception as e:
+            print(f"Error during packed prioritization: {e}")
+            return [None] * len(issue_descriptions)
+
+        by_id = {}
+        for answer in answers:
+            try:
+                by_id[int(answer.get("id"))] = priority_result(validate(answer, PRIORITY_SCHEMA))
+            except (TypeError, ValueError):
+                continue
+        return [by_id.get(index) for index in range(1, len(issue_descriptions) + 1)]
 
 
 # Example usage
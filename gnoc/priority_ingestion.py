@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+
+from autogen.retrieve_utils import get_files_from_dir, split_files_to_chunks
+
+from embedding_backend import build_embedding_function
+from priority_rules import PriorityRules, compile_priority_rules, document_text
+
+
+@dataclass
+class IngestionStats:
+    fingerprint: str
+    skipped: bool
+    chunks_total: int = 0
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    fingerprint_seconds: float = 0.0
+    chunking_seconds: float = 0.0
+    embedding_seconds: float = 0.0
+    rules_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+
+class PriorityIngestionManager:
+    """
+    Keeps the priority document collection in sync with its source files.
+
+    The source files and the chunking parameters are fingerprinted. When the fingerprint matches the one
+    recorded by the previous ingestion the collection is used as-is and nothing is chunked or embedded.
+    Otherwise the documents are re-chunked and only the chunks whose content changed are embedded and
+    upserted; chunks that no longer exist are deleted.
+    """
+
+    def __init__(self, client, collection_name="gnoc-priority-pdf", chunk_token_size=2000, chunk_mode="one_line",
+                 embedding_model="text-embedding-004", must_break_at_empty_line=False, embedding_function=None,
+                 manifest_dir=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.chunk_token_size = chunk_token_size
+        self.chunk_mode = chunk_mode
+        self.must_break_at_empty_line = must_break_at_empty_line
+        self.embedding_function = embedding_function or build_embedding_function(embedding_model)
+        # The backend may substitute its own model (e.g. a local model for a Google one)
+        self.embedding_model = getattr(self.embedding_function, "model_id", embedding_model)
+        self.manifest_dir = manifest_dir or os.getcwd()
+        self.last_stats = None
+        self.rules = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.manifest_dir, f"{self.collection_name}.manifest.json")
+
+    @property
+    def rules_path(self):
+        return os.path.join(self.manifest_dir, f"{self.collection_name}.rules.json")
+
+    def chunking_params(self):
+        return {
+            "chunk_token_size": self.chunk_token_size,
+            "chunk_mode": self.chunk_mode,
+            "embedding_model": self.embedding_model,
+            "must_break_at_empty_line": self.must_break_at_empty_line,
+        }
+
+    def fingerprint(self, docs_path):
+        """
+        Hashes the content of every source file together with the chunking parameters.
+        """
+        digest = hashlib.sha256(json.dumps(self.chunking_params(), sort_keys=True).encode("utf-8"))
+        for file_path in sorted(get_files_from_dir(docs_path)):
+            digest.update(os.path.basename(file_path).encode("utf-8"))
+            with open(file_path, "rb") as source:
+                for block in iter(lambda: source.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def chunk_id(self, chunk):
+        # The embedding model is part of the id so that switching models re-embeds every chunk.
+        return hashlib.sha256(f"{self.embedding_model}\0{chunk}".encode("utf-8")).hexdigest()[:32]
+
+    def get_collection(self):
+        return self.client.get_or_create_collection(name=self.collection_name,
+                                                    embedding_function=self.embedding_function)
+
+    def ingest(self, docs_path):
+        """
+        Brings the collection up to date with `docs_path` and returns the `IngestionStats` of the run.
+        """
+        started = time.perf_counter()
+        fingerprint = self.fingerprint(docs_path)
+        fingerprint_seconds = time.perf_counter() - started
+
+        collection = self.get_collection()
+        manifest = self._read_manifest()
+        if manifest.get("fingerprint") == fingerprint and manifest.get("chunks_total") == collection.count():
+            rules_seconds = self._load_rules(docs_path)
+            stats = IngestionStats(fingerprint=fingerprint, skipped=True, chunks_total=manifest["chunks_total"],
+                                   fingerprint_seconds=fingerprint_seconds, rules_seconds=rules_seconds,
+                                   total_seconds=time.perf_counter() - started)
+            self.last_stats = stats
+            return stats
+
+        chunking_started = time.perf_counter()
+        chunks, sources = split_files_to_chunks(get_files_from_dir(docs_path), self.chunk_token_size,
+                                                self.chunk_mode, self.must_break_at_empty_line)
+        documents = {}
+        for chunk, source in zip(chunks, sources):
+            documents.setdefault(self.chunk_id(chunk), (chunk, source))
+        chunking_seconds = time.perf_counter() - chunking_started
+
+        existing_ids = set(collection.get(include=[])["ids"])
+        added_ids = [chunk_id for chunk_id in documents if chunk_id not in existing_ids]
+        deleted_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in documents]
+
+        if deleted_ids and len(deleted_ids) == len(existing_ids):
+            # Nothing can be kept (e.g. the embedding model changed), start over in case the dimension changed too
+            self.client.delete_collection(name=self.collection_name)
+            collection = self.get_collection()
+        elif deleted_ids:
+            collection.delete(ids=deleted_ids)
+
+        embedding_seconds = 0.0
+        if added_ids:
+            texts = [documents[chunk_id][0] for chunk_id in added_ids]
+            embedding_started = time.perf_counter()
+            embeddings = self.embedding_function(texts)
+            embedding_seconds = time.perf_counter() - embedding_started
+            collection.upsert(ids=added_ids, documents=texts, embeddings=embeddings,
+                              metadatas=[documents[chunk_id][1] for chunk_id in added_ids])
+
+        rules_seconds = self._compile_rules(docs_path)
+        stats = IngestionStats(fingerprint=fingerprint, skipped=False, chunks_total=len(documents),
+                               chunks_added=len(added_ids), chunks_deleted=len(deleted_ids),
+                               fingerprint_seconds=fingerprint_seconds, chunking_seconds=chunking_seconds,
+                               embedding_seconds=embedding_seconds, rules_seconds=rules_seconds,
+                               total_seconds=time.perf_counter() - started)
+        self._write_manifest(stats)
+        self.last_stats = stats
+        return stats
+
+    def _compile_rules(self, docs_path):
+        """
+        Compiles the priority matrix of the source files into `rules` and persists it next to the manifest.
+        """
+        started = time.perf_counter()
+        text = "\n".join(document_text(file_path) for file_path in sorted(get_files_from_dir(docs_path)))
+        self.rules = compile_priority_rules(text)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.rules.save(self.rules_path)
+        return time.perf_counter() - started
+
+    def _load_rules(self, docs_path):
+        started = time.perf_counter()
+        try:
+            self.rules = PriorityRules.load(self.rules_path)
+        except (OSError, ValueError, KeyError):
+            return self._compile_rules(docs_path)
+        return time.perf_counter() - started
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, stats):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        manifest = {"collection_name": self.collection_name, **self.chunking_params(), **asdict(stats)}
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(temp_path, self.manifest_path)
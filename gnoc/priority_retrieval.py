@@ -0,0 +1,170 @@
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+import tiktoken
+from autogen.agentchat.contrib.retrieve_user_proxy_agent import RetrieveUserProxyAgent
+
+from tracing import span
+
+
+def token_encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except (KeyError, TypeError):
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def lexical_terms(text):
+    return re.findall(r"[a-z0-9$%]+", text.lower())
+
+
+class LexicalReranker:
+    """
+    Scores candidates with BM25 over the candidate set and fuses that ranking with the vector ranking using
+    reciprocal rank fusion, so chunks that are both semantically and lexically close to the issue rank first.
+    """
+
+    def __init__(self, k1=1.5, b=0.75, fusion_k=60):
+        self.k1 = k1
+        self.b = b
+        self.fusion_k = fusion_k
+
+    def rerank(self, query, documents):
+        terms = set(lexical_terms(query))
+        tokenized = [lexical_terms(document) for document in documents]
+        average_length = sum(len(tokens) for tokens in tokenized) / max(len(tokenized), 1) or 1.0
+        document_frequency = Counter(term for tokens in tokenized for term in set(tokens) if term in terms)
+
+        bm25 = []
+        for tokens in tokenized:
+            frequencies = Counter(tokens)
+            score = 0.0
+            for term in terms:
+                if frequencies[term]:
+                    idf = math.log(1 + (len(tokenized) - document_frequency[term] + 0.5) /
+                                   (document_frequency[term] + 0.5))
+                    score += idf * frequencies[term] * (self.k1 + 1) / (
+                        frequencies[term] + self.k1 * (1 - self.b + self.b * len(tokens) / average_length))
+            bm25.append(score)
+
+        lexical_rank = {index: rank for rank, index in
+                        enumerate(sorted(range(len(documents)), key=lambda index: -bm25[index]))}
+        return [1 / (self.fusion_k + vector_rank) + 1 / (self.fusion_k + lexical_rank[vector_rank])
+                for vector_rank in range(len(documents))]
+
+
+class CrossEncoderReranker:
+    """
+    Scores (issue, chunk) pairs with a local sentence_transformers cross-encoder.
+    """
+
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, documents):
+        return [float(score) for score in self.model.predict([(query, document) for document in documents])]
+
+
+def build_reranker(name):
+    if not name or name == "lexical":
+        return LexicalReranker()
+    return CrossEncoderReranker(name)
+
+
+@dataclass
+class RetrievalResult:
+    documents: list = field(default_factory=list)
+    candidate_count: int = 0
+    baseline_tokens: int = 0
+    prompt_tokens: int = 0
+
+    def __str__(self):
+        return (f"{len(self.documents)} of {self.candidate_count} candidate chunks, {self.prompt_tokens} context tokens "
+                f"instead of {self.baseline_tokens}")
+
+
+class RerankingRetriever:
+    """
+    Over-fetches `candidate_k` chunks from the priority collection, reranks them and keeps the best ones that fit
+    in `token_budget` tokens, plus the best chunk of every query whatever its size. `baseline_tokens` of the result
+    is the size of the context the agent used to build from the top `baseline_n` vector hits, so the savings can be
+    measured per query.
+    """
+
+    def __init__(self, ingestion_manager, model, candidate_k=None, token_budget=None, reranker=None, baseline_n=30):
+        self.ingestion_manager = ingestion_manager
+        self.encoding = token_encoding(model)
+        self.candidate_k = candidate_k or int(os.getenv("PRIORITY_RETRIEVAL_CANDIDATES", "60"))
+        self.token_budget = token_budget or int(os.getenv("PRIORITY_CONTEXT_TOKEN_BUDGET", "1500"))
+        self.reranker = reranker or build_reranker(os.getenv("PRIORITY_RERANKER", "lexical"))
+        self.baseline_n = baseline_n
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text))
+
+    def retrieve(self, queries, token_budget=None):
+        """
+        Retrieves the context for one or several queries with a single collection query. The reranked candidates
+        of every query are interleaved before the token budget is applied.
+        """
+        queries = [queries] if isinstance(queries, str) else list(queries)
+        with span("retrieval", queries=len(queries), reranker=type(self.reranker).__name__) as retrieval_span:
+            token_budget = token_budget or self.token_budget
+            results = self.ingestion_manager.get_collection().query(
+                query_texts=queries, n_results=self.candidate_k, include=["documents", "metadatas", "distances"])
+
+            ranked_lists, baseline, candidate_ids = [], {}, set()
+            for query, ids, documents, metadatas, distances in zip(queries, results["ids"], results["documents"],
+                                                                   results["metadatas"], results["distances"]):
+                candidate_ids.update(ids)
+                for chunk_id, document in list(zip(ids, documents))[:self.baseline_n]:
+                    baseline[chunk_id] = document
+                scores = self.reranker.rerank(query, documents) if documents else []
+                order = sorted(range(len(ids)), key=lambda index: -scores[index])
+                ranked_lists.append([{"id": ids[index], "content": documents[index], "metadata": metadatas[index],
+                                      "distance": distances[index], "score": scores[index]} for index in order])
+
+            retrieval = RetrievalResult(candidate_count=len(candidate_ids), baseline_tokens=sum(
+                self.count_tokens(document) for document in baseline.values()))
+            selected = set()
+            for rank in range(max((len(ranked) for ranked in ranked_lists), default=0)):
+                for ranked in ranked_lists:
+                    if rank >= len(ranked) or ranked[rank]["id"] in selected:
+                        continue
+                    document_tokens = self.count_tokens(ranked[rank]["content"])
+                    # The best chunk of every query is kept even when it alone exceeds the budget
+                    if rank > 0 and retrieval.prompt_tokens + document_tokens > token_budget:
+                        continue
+                    selected.add(ranked[rank]["id"])
+                    retrieval.documents.append(ranked[rank])
+                    retrieval.prompt_tokens += document_tokens
+            retrieval_span.set(candidates=retrieval.candidate_count, documents=len(retrieval.documents),
+                               context_tokens=retrieval.prompt_tokens)
+        return retrieval
+
+
+class RerankingRetrieveUserProxyAgent(RetrieveUserProxyAgent):
+    """
+    A RetrieveUserProxyAgent whose context comes from a `RerankingRetriever` instead of the top `n_results`
+    vector hits.
+    """
+
+    def __init__(self, retriever, **kwargs):
+        super().__init__(**kwargs)
+        self.retriever = retriever
+        self.last_retrieval = None
+
+    def retrieve_docs(self, problem, n_results=20, search_string=""):
+        retrieval = self.retriever.retrieve(problem)
+        if search_string:
+            retrieval.documents = [document for document in retrieval.documents
+                                   if search_string in document["content"]]
+        self.last_retrieval = retrieval
+        print(f"Retrieved {retrieval}")
+        self._search_string = search_string
+        self._results = [[(document, document["distance"]) for document in retrieval.documents]]
@@ -0,0 +1,308 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+SEGMENT_NAMES = {"consumer": "Consumer", "corporate": "Corporate", "issuing": "Issuing", "issuer": "Issuing",
+                 "merchant": "Merchant"}
+PRIORITY_LEVELS = ("P1", "P2", "P3", "P4")
+DEFAULT_IMPACT = {"P1": "High", "P2": "Medium", "P3": "Low", "P4": "Low"}
+UNITS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6, "b": 1e9, "billion": 1e9}
+
+_NUMBER = r"\d[\d,.]*"
+# A threshold of the priority definitions, e.g. "$185-365M funding" or ">/= 185,000 - 365,000 stand-in"
+THRESHOLD_PATTERN = re.compile(
+    rf"(?P<bound>(?:<|>)\s*(?:/\s*)?=?|up to|less than)?\s*\$?(?P<low>{_NUMBER})\s*(?P<low_unit>[KM]\b)?"
+    rf"(?:\s*(?:-|to|up to)\s*(?:<\s*/?\s*=?\s*)?\$?(?P<high>{_NUMBER})\s*(?P<high_unit>[KM]\b)?)?"
+    r"\s*(?:in\s+)?(?P<metric>cardholders|internal users|transactions|merchants|stand-in|funding)",
+    re.IGNORECASE)
+PERCENT_THRESHOLD_PATTERN = re.compile(
+    r"(?P<bound>>|less than)\s*(?P<low>\d+)%(?:\s*(?:up to|to)\s*(?P<high>\d+)%)?\s*impact", re.IGNORECASE)
+IMPACT_FUNDING_PATTERN = re.compile(rf"exceed \$(?P<value>{_NUMBER})\s*(?P<unit>[KM]\b)?", re.IGNORECASE)
+IMPACT_STAFF_PATTERN = re.compile(rf"staff \(>\s*(?P<value>{_NUMBER})\)", re.IGNORECASE)
+
+ISSUE_METRIC_PATTERN = re.compile(
+    rf"(?P<value>{_NUMBER})\s*(?P<unit>k|m|thousand|million)?\s+(?:[a-z]+\s+){{0,2}}?"
+    r"(?P<metric>card ?holders|customers|internal users|users|employees|staff|transactions|merchants|stand-in|stip)",
+    re.IGNORECASE)
+ISSUE_MONEY_PATTERN = re.compile(rf"\$\s?(?P<value>{_NUMBER})\s*(?P<unit>k|m|b|thousand|million|billion)?\b",
+                                 re.IGNORECASE)
+ISSUE_PERCENT_PATTERN = re.compile(r"(?P<value>\d+(?:\.\d+)?)\s*%")
+ISSUE_METRICS = {"cardholders": "cardholders", "card holders": "cardholders", "customers": "cardholders",
+                 "internal users": "internal_users", "users": "internal_users", "employees": "internal_users",
+                 "staff": "internal_users", "transactions": "transactions", "merchants": "merchants",
+                 "stand-in": "stand_in", "stip": "stand_in"}
+EXPLICIT_SEGMENT_PATTERN = re.compile(r"\b(consumer|corporate|issuing|issuer|merchant)s?\s+segment\b", re.IGNORECASE)
+SEGMENT_MENTION_PATTERN = re.compile(r"\b(consumer|corporate|issuing|issuer|merchant)s?\b", re.IGNORECASE)
+PRODUCT_PATTERN = re.compile(r"\b(?:our|the)\s+([A-Z][\w-]*(?:\s+[A-Z][\w-]*)?)\s+product\b")
+
+
+def parse_amount(value, unit=None):
+    try:
+        amount = float(value.rstrip(",.").replace(",", ""))
+    except ValueError:
+        return None
+    return amount * UNITS.get((unit or "").lower(), 1)
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def document_text(file_path):
+    if file_path.lower().endswith(".pdf"):
+        from autogen.retrieve_utils import extract_text_from_pdf
+
+        return extract_text_from_pdf(file_path)
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as source:
+        return source.read()
+
+
+def parse_thresholds(definition):
+    """
+    Returns `{metric: [lower, upper]}` for the thresholds of one priority definition. Bounds stated only as
+    "<N" or "up to N" have a lower bound of 0.
+    """
+    thresholds = {}
+    for match in THRESHOLD_PATTERN.finditer(definition):
+        metric = match.group("metric").lower().replace(" ", "_").replace("-", "_")
+        low = parse_amount(match.group("low"), match.group("low_unit") or match.group("high_unit"))
+        high = parse_amount(match.group("high"), match.group("high_unit")) if match.group("high") else None
+        bound = (match.group("bound") or "").replace(" ", "").lower()
+        if bound.startswith("<") or bound in ("upto", "lessthan"):
+            low, high = 0.0, low
+        thresholds.setdefault(metric, [low, high])
+    for match in PERCENT_THRESHOLD_PATTERN.finditer(definition):
+        if match.group("bound").lower() == "less than":
+            thresholds.setdefault("percent", [0.0, float(match.group("low"))])
+        else:
+            high = float(match.group("high")) if match.group("high") else None
+            thresholds.setdefault("percent", [float(match.group("low")), high])
+    return thresholds
+
+
+def parse_keywords(definition):
+    """
+    Returns the lower-cased descriptive phrases of a priority definition, e.g. "critical component failure".
+    """
+    keywords = []
+    for fragment in re.split(r",|●|\bor\b", definition):
+        words = fragment.strip(" .").lower().split()
+        if 2 <= len(words) <= 8 and not any(char.isdigit() or char in "$%<>" for char in "".join(words)):
+            keywords.append(" ".join(words))
+    return keywords
+
+
+def repair_lower_bounds(levels):
+    """
+    Lower bounds must decrease from P1 to P4. A bound breaking that order (a typo such as "$190,0000") is replaced
+    by the upper bound of the next level when there is one, and dropped otherwise.
+    """
+    metrics = {metric for level in levels.values() for metric in level["thresholds"]}
+    for metric in metrics:
+        previous_lower = None
+        for index, priority in enumerate(PRIORITY_LEVELS):
+            bounds = levels.get(priority, {}).get("thresholds", {}).get(metric)
+            if bounds is None:
+                continue
+            if previous_lower is not None and bounds[0] >= previous_lower:
+                next_level = levels.get(PRIORITY_LEVELS[index + 1], {}) if index + 1 < len(PRIORITY_LEVELS) else {}
+                next_bounds = next_level.get("thresholds", {}).get(metric)
+                if next_bounds and next_bounds[1] is not None and next_bounds[1] < previous_lower:
+                    bounds[0] = next_bounds[1]
+                else:
+                    del levels[priority]["thresholds"][metric]
+                    continue
+            previous_lower = bounds[0]
+
+
+def compile_priority_rules(text):
+    """
+    Compiles the impact and priority definitions of the priority document into a `PriorityRules` lookup.
+    """
+    text = normalize_text(text)
+    priority_start = text.rfind("Priority Definitions")
+    impact_start = text.rfind("Impact Definitions", 0, priority_start)
+    segments = {}
+
+    section_pattern = re.compile(r"\d\.\d\.\s+(Consumer|Corporate|Issuing|Issuer|Merchant)\b")
+    impact_text = text[impact_start:priority_start]
+    for section, body in _split_sections(section_pattern, impact_text):
+        impact = {}
+        for match in re.finditer(r"\b(High|Medium|Low)\s+●(.*?)(?=\b(?:High|Medium|Low)\s+●|$)", body):
+            category, description = match.groups()
+            funding = IMPACT_FUNDING_PATTERN.search(description)
+            staff = IMPACT_STAFF_PATTERN.search(description)
+            impact[category] = {
+                "funding": parse_amount(funding.group("value"), funding.group("unit")) if funding else None,
+                "internal_users": parse_amount(staff.group("value")) if staff else None,
+            }
+        segments.setdefault(SEGMENT_NAMES[section.lower()], {})["impact"] = impact
+
+    level_pattern = re.compile(r"\b(P[1-4])\s+(High\s*/\s*Medium|Medium\s*/\s*Low|High|Low)\b")
+    for section, body in _split_sections(section_pattern, text[priority_start:]):
+        levels = {}
+        matches = list(level_pattern.finditer(body))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(body)
+            definition = body[match.end():end]
+            levels[match.group(1)] = {
+                "urgency": re.sub(r"\s+", "", match.group(2)),
+                "thresholds": parse_thresholds(definition),
+                "keywords": parse_keywords(definition),
+            }
+        repair_lower_bounds(levels)
+        # Phrases used by several levels do not tell them apart
+        counts = {}
+        for level in levels.values():
+            for keyword in set(level["keywords"]):
+                counts[keyword] = counts.get(keyword, 0) + 1
+        for level in levels.values():
+            level["keywords"] = sorted({keyword for keyword in level["keywords"] if counts[keyword] == 1})
+        segments.setdefault(SEGMENT_NAMES[section.lower()], {})["levels"] = levels
+    return PriorityRules(segments)
+
+
+def _split_sections(section_pattern, text):
+    matches = list(section_pattern.finditer(text))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        yield match.group(1), text[match.end():end]
+
+
+@dataclass
+class RuleDecision:
+    result: dict = None
+    confidence: float = 0.0
+    signals: list = field(default_factory=list)
+
+
+class PriorityRules:
+    """
+    The priority matrix of the priority document as a lookup table.
+
+    `classify` extracts the segment, product, counts (cardholders, internal users, transactions, merchants,
+    stand-in transactions), amounts and percentages of an issue and maps every one of them to the first priority
+    level whose threshold it reaches; descriptive phrases of the definitions ("critical component failure") vote
+    too. As in the document any criterion is sufficient, so the most severe level wins. The confidence drops when
+    the segment is only implied, the product is missing, the evidence is thin or the signals disagree.
+    """
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    def to_dict(self):
+        return {"segments": self.segments}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["segments"])
+
+    def save(self, path):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as rules_file:
+            json.dump(self.to_dict(), rules_file, indent=4)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as rules_file:
+            return cls.from_dict(json.load(rules_file))
+
+    def classify(self, issue_description):
+        segment, segment_confidence = self._segment(issue_description)
+        rules = self.segments.get(segment) if segment else None
+        if not rules or not rules.get("levels"):
+            return RuleDecision()
+        levels = rules["levels"]
+
+        signals = []
+        observed = {}
+        for metric, value in self._observations(issue_description):
+            observed[metric] = max(value, observed.get(metric, 0.0))
+            priority = self._level_for(levels, metric, value)
+            if priority is not None:
+                signals.append((metric, value, priority, 1.0))
+        lowered = normalize_text(issue_description).lower()
+        for priority, level in levels.items():
+            for keyword in level["keywords"]:
+                if keyword in lowered:
+                    signals.append(("keyword", keyword, priority, 0.5))
+        if not signals:
+            return RuleDecision()
+
+        priority = min(signal[2] for signal in signals)
+        weight = sum(signal[3] for signal in signals)
+        agreement = sum(signal[3] for signal in signals if signal[2] == priority) / weight
+        product_match = PRODUCT_PATTERN.search(issue_description)
+        confidence = (segment_confidence * (1.0 if product_match else 0.7) * min(1.0, 0.5 + 0.25 * weight) *
+                      (0.5 + 0.5 * agreement))
+
+        sentences = re.split(r"(?<=[.!?])\s+", issue_description.strip(), maxsplit=1)
+        result = {
+            "priority": priority,
+            "impact": self._impact(rules.get("impact", {}), observed) or DEFAULT_IMPACT[priority],
+            "urgency": levels[priority]["urgency"],
+            "description": issue_description.strip(),
+            "summary": " ".join(sentences[0].rstrip(".!?").split()[:10]),
+            "segment": segment,
+            "product": product_match.group(1) if product_match else "NA",
+        }
+        return RuleDecision(result=result, confidence=round(confidence, 3), signals=signals)
+
+    def prioritize(self, issue_description, min_confidence):
+        """
+        Returns the rule-based prioritization of the issue, or None when it is not confident enough.
+        """
+        decision = self.classify(issue_description)
+        if decision.result is None or decision.confidence < min_confidence:
+            return None
+        return decision.result
+
+    @staticmethod
+    def _segment(issue_description):
+        explicit = {SEGMENT_NAMES[match.lower()] for match in EXPLICIT_SEGMENT_PATTERN.findall(issue_description)}
+        if len(explicit) == 1:
+            return explicit.pop(), 1.0
+        mentioned = {SEGMENT_NAMES[match.lower()] for match in SEGMENT_MENTION_PATTERN.findall(issue_description)}
+        if not explicit and len(mentioned) == 1:
+            return mentioned.pop(), 0.6
+        return None, 0.0
+
+    @staticmethod
+    def _observations(issue_description):
+        for match in ISSUE_METRIC_PATTERN.finditer(issue_description):
+            value = parse_amount(match.group("value"), match.group("unit"))
+            if value is not None:
+                yield ISSUE_METRICS[match.group("metric").lower()], value
+        for match in ISSUE_MONEY_PATTERN.finditer(issue_description):
+            value = parse_amount(match.group("value"), match.group("unit"))
+            if value is not None:
+                yield "funding", value
+        for match in ISSUE_PERCENT_PATTERN.finditer(issue_description):
+            yield "percent", float(match.group("value"))
+
+    @staticmethod
+    def _level_for(levels, metric, value):
+        lowest = None
+        for priority in PRIORITY_LEVELS:
+            bounds = levels.get(priority, {}).get("thresholds", {}).get(metric)
+            if bounds is None:
+                continue
+            lowest = priority
+            if value >= bounds[0]:
+                return priority
+        # Below every stated threshold of the metric
+        return "P4" if lowest is not None and "P4" in levels else None
+
+    @staticmethod
+    def _impact(impact_rules, observed):
+        for category in ("High", "Medium"):
+            thresholds = impact_rules.get(category, {})
+            for metric in ("funding", "internal_users"):
+                if thresholds.get(metric) is not None and observed.get(metric, 0.0) > thresholds[metric]:
+                    return category
+        if any(impact_rules.get(category, {}).get(metric) is not None and metric in observed
+               for category in ("High", "Medium") for metric in ("funding", "internal_users")):
+            return "Low"
+        return None
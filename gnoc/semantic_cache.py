@@ -0,0 +1,119 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_issue_text(text):
+    """
+    Lower-cases the issue text and collapses punctuation and whitespace so trivially different reports share a key.
+    """
+    return " ".join(re.sub(r"[^\w$%.,]+", " ", text.lower()).split())
+
+
+class SemanticCache:
+    """
+    A local semantic cache for prioritization results.
+
+    Issues are normalized and embedded; a lookup returns the cached value of the most similar stored issue when its
+    cosine similarity reaches `threshold`. Byte-identical normalized issues are answered without embedding. Entries
+    expire after `ttl_seconds` and the least recently used entry is evicted beyond `max_entries`. The whole cache is
+    dropped when its `namespace` (the priority document fingerprint) changes.
+    """
+
+    def __init__(self, embedding_function, threshold=None, ttl_seconds=None, max_entries=None):
+        self.embedding_function = embedding_function
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "900"))
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+        self.namespace = None
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0,
+                        "invalidations": 0}
+
+    def set_namespace(self, namespace):
+        """
+        Switches the cache to `namespace`, dropping every entry if it differs from the current one.
+        """
+        with self._lock:
+            if namespace != self.namespace:
+                if self._entries:
+                    self.metrics["invalidations"] += 1
+                self._entries.clear()
+                self._matrix = None
+                self.namespace = namespace
+
+    def lookup(self, text):
+        key = normalize_issue_text(text)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+                self.metrics["exact_hits"] += 1
+                return entry["value"]
+            if not self._entries:
+                self.metrics["misses"] += 1
+                return None
+
+        vector = self._embed(key)
+        with self._lock:
+            if not self._entries:
+                self.metrics["misses"] += 1
+                return None
+            matrix, keys = self._similarity_matrix()
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold and keys[best] in self._entries:
+                self._entries.move_to_end(keys[best])
+                self.metrics["hits"] += 1
+                return self._entries[keys[best]]["value"]
+            self.metrics["misses"] += 1
+            return None
+
+    def store(self, text, value):
+        key = normalize_issue_text(text)
+        vector = self._embed(key)
+        with self._lock:
+            self._entries[key] = {"vector": vector, "value": value, "stored_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            self.metrics["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {**self.metrics, "entries": len(self._entries),
+                    "hit_ratio": self.metrics["hits"] / lookups if lookups else 0.0}
+
+    def _embed(self, text):
+        vector = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry["stored_at"] < deadline]
+        for key in expired:
+            del self._entries[key]
+            self.metrics["expirations"] += 1
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+        return self._matrix, self._matrix_keys
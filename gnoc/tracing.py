@@ -0,0 +1,313 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Numeric span attributes that are also summed into Prometheus counters, by metric name
+COUNTED_ATTRIBUTES = {
+    "prompt_tokens": "gnoc_llm_prompt_tokens_total",
+    "completion_tokens": "gnoc_llm_completion_tokens_total",
+    "retries": "gnoc_span_retries_total",
+    "payload_bytes": "gnoc_span_payload_bytes_total",
+}
+# Spans whose name starts with one of these leave the process (OTLP SPAN_KIND_CLIENT)
+CLIENT_SPAN_PREFIXES = ("http.", "llm.")
+
+_current_span = contextvars.ContextVar("gnoc_current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation. `attributes` describe it (model, prompt/completion tokens, retries, payload size, ...) and
+    can be added while it runs with `set`.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_time_ns", "seconds", "error",
+                 "_started")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.start_time_ns = time.time_ns()
+        self.seconds = None
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update((key, value) for key, value in attributes.items() if value is not None)
+        return self
+
+    def to_dict(self):
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start_time_ns": self.start_time_ns, "seconds": self.seconds, "error": self.error,
+                "attributes": dict(self.attributes)}
+
+
+class Tracer:
+    """
+    Times nested operations as spans and aggregates them for offline export.
+
+    A span opened while another one is active in the same context becomes its child and shares its trace id, so
+    everything done for one incident ends up in one trace. Work handed to other threads keeps its parent when it
+    runs in a copy of the submitting context (`contextvars.copy_context().run`).
+
+    Finished spans are
+    - kept per trace for the last `max_traces` traces, for `trace`/`breakdown`
+    - aggregated into duration histograms and token/retry/payload counters, rendered by `prometheus_text` and
+      rewritten to `prometheus_path` (TRACE_PROMETHEUS_FILE, node_exporter textfile format) at most every
+      `prometheus_interval` seconds
+    - appended to `otlp_path` (TRACE_OTLP_FILE) as OTLP/JSON, one ExportTraceServiceRequest per line, which the
+      OpenTelemetry collector's `otlpjsonfile` receiver can load later
+
+    A trace whose root span takes `slow_seconds` (TRACE_SLOW_SECONDS) or longer has its breakdown printed.
+    """
+
+    def __init__(self, enabled=None, otlp_path=None, prometheus_path=None, prometheus_interval=None,
+                 slow_seconds=None, max_traces=None, service_name=None):
+        if enabled is None:
+            enabled = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+        self.enabled = enabled
+        self.otlp_path = otlp_path or os.getenv("TRACE_OTLP_FILE")
+        self.prometheus_path = prometheus_path or os.getenv("TRACE_PROMETHEUS_FILE")
+        self.prometheus_interval = prometheus_interval if prometheus_interval is not None else float(
+            os.getenv("TRACE_PROMETHEUS_INTERVAL_SECONDS", "10"))
+        self.slow_seconds = slow_seconds if slow_seconds is not None else float(os.getenv("TRACE_SLOW_SECONDS", "30"))
+        self.max_traces = max_traces or int(os.getenv("TRACE_MAX_TRACES", "200"))
+        self.service_name = service_name or os.getenv("TRACE_SERVICE_NAME", "gnoc")
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._traces = OrderedDict()
+        self._durations = {}
+        self._errors = {}
+        self._counters = {}
+        self._prometheus_written_at = 0.0
+        if self.prometheus_path:
+            atexit.register(self.write_prometheus)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the enclosed block as a span named `name`; yields the `Span` so attributes known only at the end
+        (tokens, status codes, ...) can be added. An exception is recorded on the span and re-raised.
+        """
+        if not self.enabled:
+            yield Span(name, None, None, {})
+            return
+        parent = _current_span.get()
+        current = Span(name, parent.trace_id if parent is not None else os.urandom(16).hex(),
+                       parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            current.seconds = time.perf_counter() - current._started
+            self._finish(current)
+
+    def traced(self, name, **attributes):
+        """
+        Decorator running every call of the function in a span named `name`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **attributes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def current_span():
+        return _current_span.get()
+
+    def _finish(self, span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+
+            histogram = self._durations.get(span.name)
+            if histogram is None:
+                histogram = self._durations[span.name] = {"buckets": [0] * len(DURATION_BUCKETS), "count": 0,
+                                                          "sum": 0.0}
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if span.seconds <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += span.seconds
+            if span.error is not None:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+            for attribute, metric in COUNTED_ATTRIBUTES.items():
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)) and value:
+                    key = (metric, span.name, str(span.attributes.get("model", "")))
+                    self._counters[key] = self._counters.get(key, 0) + value
+
+        if self.otlp_path:
+            self.write_otlp([span])
+        if span.parent_id is None:
+            if self.prometheus_path and time.monotonic() - self._prometheus_written_at >= self.prometheus_interval:
+                self.write_prometheus()
+            if span.seconds >= self.slow_seconds:
+                print(f"Slow trace:-\n{self.breakdown(span.trace_id)}")
+
+    def trace(self, trace_id):
+        """
+        Returns the finished spans of a trace, oldest first.
+        """
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda span: span.start_time_ns)
+
+    def breakdown(self, trace_id):
+        """
+        Renders a trace as an indented tree: when every span started relative to the root, how long it took, which
+        share of the root that is, the time not covered by its children, and its attributes.
+        """
+        spans = self.trace(trace_id)
+        if not spans:
+            return f"No spans recorded for trace {trace_id}"
+        span_ids = {span.span_id for span in spans}
+        children = {}
+        for span in spans:
+            # Spans whose parent is not finished (or was evicted) are shown at the top level
+            parent_id = span.parent_id if span.parent_id in span_ids else None
+            children.setdefault(parent_id, []).append(span)
+        roots = children.get(None, [])
+        origin = min(span.start_time_ns for span in spans)
+        total = max(span.start_time_ns + span.seconds * 1e9 for span in spans) / 1e9 - origin / 1e9
+        lines = [f"trace {trace_id}: {total:.3f}s"]
+
+        def render(span, depth):
+            own = span.seconds - sum(child.seconds for child in children.get(span.span_id, []))
+            attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+            lines.append(f"{'  ' * depth}+{(span.start_time_ns - origin) / 1e9:7.3f}s {span.name:<32} "
+                         f"{span.seconds:8.3f}s {100 * span.seconds / total if total else 100.0:5.1f}% "
+                         f"self {max(own, 0.0):7.3f}s"
+                         f"{' ERROR ' + span.error if span.error else ''}{'  ' + attributes if attributes else ''}")
+            for child in children.get(span.span_id, []):
+                render(child, depth + 1)
+
+        for root in roots:
+            render(root, 0)
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            return {name: {"count": histogram["count"], "seconds": histogram["sum"],
+                           "errors": self._errors.get(name, 0)}
+                    for name, histogram in self._durations.items()}
+
+    def prometheus_text(self):
+        """
+        Renders the span histograms and counters in the Prometheus text exposition format.
+        """
+        with self._lock:
+            durations = {name: {**histogram, "buckets": list(histogram["buckets"])}
+                         for name, histogram in self._durations.items()}
+            errors = dict(self._errors)
+            counters = dict(self._counters)
+
+        lines = ["# HELP gnoc_span_duration_seconds Duration of traced operations.",
+                 "# TYPE gnoc_span_duration_seconds histogram"]
+        for name, histogram in sorted(durations.items()):
+            label = f'span="{escape_label(name)}"'
+            for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                lines.append(f'gnoc_span_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'gnoc_span_duration_seconds_bucket{{{label},le="+Inf"}} {histogram["count"]}')
+            lines.append(f"gnoc_span_duration_seconds_sum{{{label}}} {histogram['sum']}")
+            lines.append(f"gnoc_span_duration_seconds_count{{{label}}} {histogram['count']}")
+        lines += ["# HELP gnoc_span_errors_total Traced operations that raised.",
+                  "# TYPE gnoc_span_errors_total counter"]
+        for name, count in sorted(errors.items()):
+            lines.append(f'gnoc_span_errors_total{{span="{escape_label(name)}"}} {count}')
+        for metric in COUNTED_ATTRIBUTES.values():
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_metric, name, model), value in sorted(counters.items()):
+                if counter_metric == metric:
+                    lines.append(f'{metric}{{span="{escape_label(name)}",model="{escape_label(model)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        """
+        Atomically rewrites the Prometheus text file (`path` or TRACE_PROMETHEUS_FILE).
+        """
+        path = path or self.prometheus_path
+        if not path:
+            return
+        self._prometheus_written_at = time.monotonic()
+        text = self.prometheus_text()
+        with self._export_lock:
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temporary_path, "w") as metrics_file:
+                    metrics_file.write(text)
+                os.replace(temporary_path, path)
+            except OSError as e:
+                print(f"Failed to write trace metrics to {path}: {e}")
+
+    def write_otlp(self, spans, path=None):
+        """
+        Appends `spans` to the OTLP/JSON file (`path` or TRACE_OTLP_FILE) as one ExportTraceServiceRequest line.
+        """
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "gnoc.tracing"}, "spans": [otlp_span(span) for span in spans]}],
+        }]})
+        with self._export_lock:
+            try:
+                with open(path or self.otlp_path, "a") as otlp_file:
+                    otlp_file.write(line + "\n")
+            except OSError as e:
+                print(f"Failed to write spans to {path or self.otlp_path}: {e}")
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_span(span):
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 3 if span.name.startswith(CLIENT_SPAN_PREFIXES) else 1,
+        "startTimeUnixNano": str(span.start_time_ns),
+        "endTimeUnixNano": str(span.start_time_ns + int(span.seconds * 1e9)),
+        "attributes": [otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+# The process-wide tracer every gnoc module records into
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+current_span = tracer.current_span
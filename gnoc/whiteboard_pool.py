@@ -0,0 +1,158 @@
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+SPARE_PROPERTY = "gnocWhiteboardSpare"
+OWNER_PROPERTY = "gnocWhiteboardOwner"
+
+
+class WhiteboardPool:
+    """
+    Keeps `size` copies of the whiteboard template cloned and shared ahead of time, so declaring an incident only
+    has to rename a spare copy and fill in its placeholders.
+
+    Spares are tagged with a Drive app property naming their template, which lets a restarted process adopt the
+    spares left by the previous one instead of cloning new ones. Every running process adopts them, so a spare is
+    `claim`ed before use to keep two processes from handing out the same one. A background thread tops the pool up
+    after every `take()` and every `refill_interval` seconds; spares older than `max_age` are deleted so that edits
+    to the template reach new incidents. A cloning failure backs off for `refill_interval` seconds.
+    """
+
+    def __init__(self, google_services, template_doc_id, clone_document, size=None, refill_interval=None,
+                 max_age=None):
+        self.google_services = google_services
+        self.template_doc_id = template_doc_id
+        # clone_document(document_name, app_properties) copies and shares the template, returning the copy's id
+        self.clone_document = clone_document
+        self.size = size if size is not None else int(os.getenv("WHITEBOARD_POOL_SIZE", "2"))
+        self.refill_interval = refill_interval if refill_interval is not None else float(
+            os.getenv("WHITEBOARD_POOL_REFILL_INTERVAL_SECONDS", "60"))
+        self.max_age = max_age if max_age is not None else float(os.getenv("WHITEBOARD_POOL_MAX_AGE_SECONDS", "86400"))
+        self._spares = deque()
+        self._expired = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.metrics = {"hits": 0, "misses": 0, "clones": 0, "clone_failures": 0, "adopted": 0, "expired": 0,
+                        "lost_claims": 0, "clone_seconds": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.size > 0 and self.template_doc_id:
+                self._thread = threading.Thread(target=self._run, name="whiteboard-pool", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def take(self):
+        """
+        Returns the id of a ready spare copy, or None when the pool is empty. Either way a refill is scheduled.
+        """
+        now = time.time()
+        with self._lock:
+            document_id = None
+            while self._spares:
+                candidate_id, created_at = self._spares.popleft()
+                if now - created_at <= self.max_age:
+                    document_id = candidate_id
+                    break
+                self._expired.append((candidate_id, created_at))
+                self.metrics["expired"] += 1
+            self.metrics["hits" if document_id else "misses"] += 1
+        self._wake.set()
+        return document_id
+
+    def claim(self, document_id, document_name):
+        """
+        Claims a spare copy for this process, renaming it and removing its spare tag. Returns False, leaving the
+        copy alone, when another process claimed it first.
+
+        Drive has no compare-and-set, so the owner property is only written while the copy is an unowned spare
+        and then read back: of two processes claiming the same copy, the one whose write was overwritten sees the
+        other owner and backs off.
+        """
+        with self.google_services.lease("drive", "v3") as drive_service:
+            files = drive_service.files()
+            properties = files.get(fileId=document_id, fields="appProperties").execute().get("appProperties") or {}
+            if SPARE_PROPERTY in properties and properties.get(OWNER_PROPERTY) in (None, self.owner):
+                files.update(fileId=document_id, body={"appProperties": {OWNER_PROPERTY: self.owner}}).execute()
+                properties = files.get(fileId=document_id,
+                                       fields="appProperties").execute().get("appProperties") or {}
+            if properties.get(OWNER_PROPERTY) != self.owner:
+                with self._lock:
+                    self.metrics["lost_claims"] += 1
+                return False
+            files.update(fileId=document_id, body={
+                "name": document_name, "appProperties": {SPARE_PROPERTY: None}}).execute()
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {**self.metrics, "size": self.size, "available": len(self._spares),
+                    "hit_ratio": self.metrics["hits"] / lookups if lookups else 0.0}
+
+    def _run(self):
+        try:
+            self._adopt()
+        except Exception as e:
+            print(f"Failed to adopt spare whiteboards: {e}")
+        while not self._stopped:
+            self._refill()
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+    def _adopt(self):
+        query = (f"appProperties has {{ key='{SPARE_PROPERTY}' and value='{self.template_doc_id}' }} "
+                 f"and trashed = false")
+        with self.google_services.lease("drive", "v3") as drive_service:
+            files = drive_service.files().list(q=query, fields="files(id, createdTime)", pageSize=100).execute()
+        for spare in files.get("files", []):
+            created_at = datetime.datetime.fromisoformat(spare["createdTime"].replace("Z", "+00:00")).timestamp()
+            with self._lock:
+                self._spares.append((spare["id"], created_at))
+                self.metrics["adopted"] += 1
+
+    def _refill(self):
+        self._delete_expired()
+        while not self._stopped:
+            with self._lock:
+                if len(self._spares) >= self.size:
+                    return
+            started = time.perf_counter()
+            try:
+                document_id = self.clone_document(f"[spare] {self.template_doc_id}",
+                                                  {SPARE_PROPERTY: self.template_doc_id})
+            except Exception as e:
+                print(f"Failed to clone a spare whiteboard: {e}")
+                with self._lock:
+                    self.metrics["clone_failures"] += 1
+                return
+            with self._lock:
+                self._spares.append((document_id, time.time()))
+                self.metrics["clones"] += 1
+                self.metrics["clone_seconds"] += time.perf_counter() - started
+
+    def _delete_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [spare for spare in self._spares if now - spare[1] > self.max_age]
+            for spare in expired:
+                self._spares.remove(spare)
+                self.metrics["expired"] += 1
+            expired, self._expired = expired + self._expired, []
+        for document_id, _ in expired:
+            try:
+                with self.google_services.lease("drive", "v3") as drive_service:
+                    drive_service.files().delete(fileId=document_id).execute()
+            except Exception as e:
+                print(f"Failed to delete expired spare whiteboard {document_id}: {e}")
@@ -0,0 +1,40 @@
+import numpy as np
+
+from embedding_backend import CachedEmbeddingFunction, EmbeddingCache
+
+
+class FakeBackend:
+    model_id = "fake/letters"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return np.asarray([[float(ord(text[0])), float(len(text))] for text in texts], dtype=np.float32)
+
+
+def test_embedding_functions_sharing_a_cache_dir_do_not_overwrite_each_other(tmp_path):
+    cache_dir = str(tmp_path / "embeddings")
+    first = CachedEmbeddingFunction(FakeBackend(), cache_dir)
+    second = CachedEmbeddingFunction(FakeBackend(), cache_dir)
+
+    alpha = first(["alpha"])[0]
+    beta = second(["beta"])[0]
+    assert first.cache is second.cache
+
+    reloaded = EmbeddingCache(cache_dir, FakeBackend.model_id)
+    vectors = reloaded.get_many([reloaded.key("alpha"), reloaded.key("beta")])
+    assert len(reloaded) == 2
+    assert vectors[reloaded.key("alpha")].tolist() == alpha
+    assert vectors[reloaded.key("beta")].tolist() == beta
+
+
+def test_second_embedding_function_is_served_from_the_shared_cache(tmp_path):
+    cache_dir = str(tmp_path / "embeddings")
+    CachedEmbeddingFunction(FakeBackend(), cache_dir)(["alpha"])
+    backend = FakeBackend()
+
+    CachedEmbeddingFunction(backend, cache_dir)(["alpha"])
+
+    assert backend.embedded == []
@@ -0,0 +1,100 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("autogen")
+
+from autogen.io import IOStream
+
+from benchmark_servers import FakeBackends
+from hedging import HedgingOpenAIWrapper, RequestHedger
+from llm_cache import LLMResponseCache
+from priority_identification_agent import TokenStream
+
+
+@pytest.fixture
+def backends():
+    backends = FakeBackends(llm_latency=0.0, llm_tokens_per_second=1e6, service_latency=0.0).start()
+    yield backends
+    backends.stop()
+
+
+def test_cached_completion_is_not_counted_as_actual_usage(backends, tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite3"))
+    hedger = RequestHedger("test", min_samples=1, initial_delay=5)
+    wrapper = HedgingOpenAIWrapper(hedger, config_list=[{"model": "gpt-4o", "base_url": f"{backends.url}/v1",
+                                                         "api_key": "test"}],
+                                   cache=cache.for_agent("assistant", 60))
+    messages = [{"role": "user", "content": "Please prioritize the issue. Issue:- merchant checkout is down"}]
+
+    wrapper.create(messages=messages)
+    wrapper.create(messages=messages)
+
+    total, actual = wrapper.total_usage_summary["gpt-4o"], wrapper.actual_usage_summary["gpt-4o"]
+    assert backends.stats()["llm_calls"] == 1
+    assert total["total_tokens"] == 2 * actual["total_tokens"]
+    assert hedger.stats()["requests"] == 1
+    assert hedger.stats()["cached"] == 1
+
+
+def test_concurrent_slow_requests_share_the_hedge_budget():
+    hedger = RequestHedger("test", min_samples=1, initial_delay=0.05, budget_ratio=0.1, budget_burst=3,
+                           max_workers=64)
+
+    def slow():
+        time.sleep(0.3)
+        return "answer"
+
+    threads = [threading.Thread(target=hedger.call, args=(slow, slow)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = hedger.stats()
+    assert stats["hedged"] == 3
+    assert stats["budget_denied"] == 17
+    assert stats["hedges_in_flight"] == 0
+
+
+class StreamMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class StreamingWrapper:
+    """
+    Streams `chunks` into the current IOStream, `first_chunk_delay` seconds after being called.
+    """
+
+    def __init__(self, chunks, first_chunk_delay):
+        self.chunks = chunks
+        self.first_chunk_delay = first_chunk_delay
+
+    def create(self, cache=None, **config):
+        time.sleep(self.first_chunk_delay)
+        for chunk in self.chunks:
+            IOStream.get_default().send(StreamMessage(chunk))
+            time.sleep(0.01)
+        return SimpleNamespace(model="gpt-4o", cost=0.0, usage=SimpleNamespace(
+            prompt_tokens=10, completion_tokens=len(self.chunks), total_tokens=10 + len(self.chunks)))
+
+
+def test_streamed_completion_is_hedged_on_its_first_chunk():
+    hedger = RequestHedger("test_stream", min_samples=1, initial_delay=0.05)
+    wrapper = HedgingOpenAIWrapper(hedger, config_list=[{"model": "gpt-4o", "api_key": "test"}], stream=True)
+    wrapper._primary = StreamingWrapper(["slow ", "primary"], first_chunk_delay=1.0)
+    wrapper._hedge = StreamingWrapper(["fast ", "hedge"], first_chunk_delay=0.0)
+    received = []
+
+    with IOStream.set_default(TokenStream(received.append)):
+        response = wrapper.create(messages=[{"role": "user", "content": "Please prioritize the issue."}])
+    # The abandoned primary streams too, but not into the caller's stream
+    time.sleep(1.2)
+
+    assert "".join(received) == "fast hedge"
+    assert response.usage.completion_tokens == 2
+    assert hedger.stats()["hedged"] == 1
+    assert hedger.stats()["hedge_wins"] == 1
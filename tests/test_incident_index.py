@@ -0,0 +1,78 @@
+import threading
+
+from incident_index import IncidentIndex, issue_tokens
+from incident_pipeline import IncidentPipeline
+
+COMMON = "merchant payments checkout declined gateway"
+
+
+def fill(index, count, unique_tokens):
+    # Incidents sharing the common words, each different enough from the others to be declared on its own
+    for number in range(count):
+        words = " ".join(f"site{number}x{word}" for word in range(unique_tokens))
+        declare(index, f"{COMMON} {words}", f"GNOC-{number}")
+
+
+def declare(index, text, jira_id):
+    incident, created = index.claim("Merchant", "Payments", text)
+    assert created
+    index.resolve(incident, jira_id, {})
+    return incident
+
+
+def test_duplicate_report_is_attached():
+    index = IncidentIndex(window_seconds=3600, threshold=0.5, wait_seconds=1)
+    declare(index, "Checkout payments declined for merchant terminals in Berlin", "GNOC-1")
+
+    incident, created = index.claim("Merchant", "Payments", "Merchant terminals in Berlin: checkout payments declined")
+
+    assert not created
+    assert incident.jira_id == "GNOC-1"
+
+
+def test_match_is_scored_on_full_token_sets_past_the_common_token_limit():
+    index = IncidentIndex(window_seconds=3600, threshold=0.5, wait_seconds=1)
+    fill(index, 300, 6)
+    target = declare(index, f"{COMMON} terminal berlin", "GNOC-TARGET")
+    report = f"{COMMON} terminal berlin timeouts acquirer"
+    tokens = issue_tokens(report)
+    assert len(tokens & target.tokens) / len(tokens | target.tokens) >= 0.75
+
+    incident, created = index.claim("Merchant", "Payments", report)
+
+    assert not created
+    assert incident.jira_id == "GNOC-TARGET"
+
+
+def test_report_of_only_common_tokens_still_matches():
+    index = IncidentIndex(window_seconds=3600, threshold=0.5, wait_seconds=1)
+    fill(index, 300, 4)
+
+    incident, created = index.claim("Merchant", "Payments", COMMON)
+
+    assert not created
+    assert incident.jira_id.startswith("GNOC-")
+
+
+def test_duplicate_waits_for_the_declaration_as_long_as_the_caller_allows():
+    index = IncidentIndex(window_seconds=3600, threshold=0.5)
+    first, _ = index.claim("Merchant", "Payments", f"{COMMON} terminal berlin")
+    duplicate, created = index.claim("Merchant", "Payments", f"{COMMON} terminal berlin")
+    assert not created and duplicate is first
+    threading.Timer(0.2, index.resolve, (first, "GNOC-1", {})).start()
+
+    assert index.wait_until_ready(duplicate, timeout=5)
+    assert duplicate.jira_id == "GNOC-1"
+
+
+def test_configured_wait_overrides_the_caller_timeout():
+    index = IncidentIndex(window_seconds=3600, threshold=0.5, wait_seconds=0.05)
+    first, _ = index.claim("Merchant", "Payments", f"{COMMON} terminal berlin")
+
+    assert not index.wait_until_ready(first, timeout=60)
+
+
+def test_pipeline_waits_past_its_link_stage_timeouts():
+    pipeline = IncidentPipeline(None, None, stage_timeouts={"jira": 60, "white_board": 60, "status_page": 30})
+
+    assert pipeline.claim_wait_seconds() > 120
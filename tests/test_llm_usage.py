@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("autogen")
+
+from autogen import OpenAIWrapper
+
+import llm_usage
+from benchmark_servers import FakeBackends
+from hedging import HedgingOpenAIWrapper, RequestHedger
+from llm_cache import LLMResponseCache
+from model_router import UsageLedger
+
+
+@pytest.fixture
+def backends():
+    backends = FakeBackends(llm_latency=0.0, llm_tokens_per_second=1e6, service_latency=0.0).start()
+    yield backends
+    backends.stop()
+
+
+@pytest.mark.parametrize("hedged", [False, True])
+def test_cached_reply_is_neither_recorded_nor_charged(backends, tmp_path, monkeypatch, hedged):
+    ledger = UsageLedger()
+    monkeypatch.setattr(llm_usage, "usage_ledger", ledger)
+    config_list = [{"model": "gpt-4o", "base_url": f"{backends.url}/v1", "api_key": "test"}]
+    client = (HedgingOpenAIWrapper(RequestHedger("test", initial_delay=5), config_list=config_list, cache_seed=None)
+              if hedged else OpenAIWrapper(config_list=config_list, cache_seed=None))
+    cache = LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite3"))
+    agent = SimpleNamespace(name="assistant", system_message="You prioritize issues.", client=client,
+                            client_cache=cache.for_agent("assistant", 60))
+
+    with ledger.incident_budget(max_tokens=100000) as budget:
+        _, first = llm_usage.generate_with_usage(agent, "Please prioritize the issue. Issue:- checkout is down")
+        _, second = llm_usage.generate_with_usage(agent, "Please prioritize the issue. Issue:- checkout is down")
+
+    assert backends.stats()["llm_calls"] == 1
+    assert first["total_tokens"] > 0 and second["total_tokens"] == 0
+    assert ledger.stats()["agents"]["assistant"]["calls"] == 1
+    assert budget.stats()["calls"] == 1 and budget.stats()["tokens"] == first["total_tokens"]
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from notification_outbox import NotificationOutbox
+
+
+def recording_sender(sent, release=None):
+    def send(batch):
+        if release is not None:
+            release.wait(5)
+        sent.extend(payload["to"] for _, payload in batch)
+        return {row_id: (True, {"id": row_id}) for row_id, _ in batch}
+    return send
+
+
+def test_starting_a_second_outbox_does_not_resend_a_batch_in_flight(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    first_sent, second_sent, release = [], [], threading.Event()
+    first = NotificationOutbox({"email": recording_sender(first_sent, release)}, path=path, poll_interval=60)
+    first.enqueue("email", {"to": "a@example.com"}, "incident-1:insensitive")
+    first.enqueue("email", {"to": "b@example.com"}, "incident-1:sensitive")
+    sending = threading.Thread(target=first.drain)
+    sending.start()
+    time.sleep(0.2)
+
+    second = NotificationOutbox({"email": recording_sender(second_sent)}, path=path, poll_interval=60).start()
+    handled = second.drain()
+    release.set()
+    sending.join()
+    second.stop()
+
+    assert handled == 0
+    assert second_sent == []
+    assert sorted(first_sent) == ["a@example.com", "b@example.com"]
+    assert first.stats()["statuses"] == {"sent": 2}
+
+
+def test_batch_of_a_dead_outbox_is_reclaimed_after_its_lease(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    dead_sent, sent = [], []
+    dead = NotificationOutbox({"email": recording_sender(dead_sent)}, path=path, lease_seconds=0.1)
+    dead.enqueue("email", {"to": "a@example.com"}, "incident-1:insensitive")
+    batch = dead._claim("email")
+    survivor = NotificationOutbox({"email": recording_sender(sent)}, path=path)
+
+    assert survivor.drain() == 0
+    time.sleep(0.2)
+    assert survivor.drain() == 1
+    # The owner that lost its lease cannot overwrite the survivor's outcome
+    dead._deliver("email", batch)
+
+    assert sent == ["a@example.com"]
+    assert survivor.stats()["reclaimed"] == 1
+    assert dead.stats()["lost_leases"] == 1
+    assert survivor.stats()["statuses"] == {"sent": 1}
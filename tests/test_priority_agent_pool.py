@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("autogen")
+
+from priority_agent_pool import PriorityAgentPool
+
+
+class FakeAgent:
+    ingestion_manager = None
+    pdf_file = None
+
+    def reset(self):
+        pass
+
+
+def test_failed_agent_creation_gives_its_slot_back():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise RuntimeError("Chroma is not reachable")
+        return FakeAgent()
+
+    pool = PriorityAgentPool(size=1, agent_factory=factory, warm=False, use_cache=False, use_rules=False)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            with pool.acquire(timeout=1):
+                pass
+    assert pool.created == 0
+
+    with pool.acquire(timeout=1) as agent:
+        assert isinstance(agent, FakeAgent)
+    assert pool.created == 1
+
+
+def test_concurrent_agent_construction_builds_one_shared_agent(monkeypatch):
+    built = []
+
+    class SlowAgent(FakeAgent):
+        def __init__(self, config_list=None, chroma_client=None, ingestion_manager=None):
+            time.sleep(0.1)
+            built.append(config_list)
+            self.config_list = config_list or ["loaded"]
+            self.chroma_client = chroma_client or object()
+            self.ingestion_manager = ingestion_manager or object()
+
+    monkeypatch.setattr("priority_agent_pool.PriorityIdentificationAgent", SlowAgent)
+    pool = PriorityAgentPool(size=4, warm=False, use_cache=False, use_rules=False)
+    agents = queue.Queue()
+    threads = [threading.Thread(target=lambda: agents.put(pool.agent_factory())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert built.count(None) == 1
+    assert len({id(agent.chroma_client) for agent in agents.queue}) == 1
+    # One ingestion manager, so one embedding model and one embedding cache per process
+    assert len({id(agent.ingestion_manager) for agent in agents.queue}) == 1
+
+
+def test_follow_up_skips_the_rules():
+    class Rules:
+        def prioritize(self, issue_description, min_confidence):
+            return {"priority": "P3", "product": "Transit"}
+
+    class Manager:
+        rules = Rules()
+
+    class AgentAnswer(FakeAgent):
+        def prioritize_issue(self, issue_description):
+            return {"priority": "P1", "product": "Transit"}
+
+        def prioritize_issue_stream(self, issue_description, on_field):
+            return self.prioritize_issue(issue_description)
+
+    pool = PriorityAgentPool(size=1, agent_factory=AgentAnswer, warm=False, use_cache=False, use_rules=True)
+    pool._ingestion = (Manager(), None)
+    pool.check_document = lambda: None
+    issue = "Transit delays for all riders\nThis is a P1, not a P3"
+
+    assert pool.prioritize_issue(issue)["priority"] == "P3"
+    assert pool.prioritize_issue(issue, follow_up=True)["priority"] == "P1"
+    assert pool.prioritize_issue_stream(issue, lambda name, value: None, follow_up=True)["priority"] == "P1"
+
+
+def test_follow_up_bypasses_the_cache():
+    class Cache:
+        def __init__(self):
+            self.entries = {}
+
+        def lookup(self, issue_description):
+            return next(iter(self.entries.values()), None)
+
+        def store(self, issue_description, result):
+            self.entries[issue_description] = result
+
+    class AgentAnswer(FakeAgent):
+        def prioritize_issue(self, issue_description):
+            return {"priority": "P1" if "P1" in issue_description else "P3"}
+
+        def prioritize_issue_stream(self, issue_description, on_field):
+            return self.prioritize_issue(issue_description)
+
+    pool = PriorityAgentPool(size=1, agent_factory=AgentAnswer, warm=False, use_cache=False, use_rules=False)
+    pool.cache = Cache()
+    issue = "Transit delays for all riders"
+    correction = issue + "\nThis is a P1, not a P3"
+
+    assert pool.prioritize_issue(issue)["priority"] == "P3"
+    assert pool.prioritize_issue(correction, follow_up=True)["priority"] == "P1"
+    assert pool.prioritize_issue_stream(correction, lambda name, value: None, follow_up=True)["priority"] == "P1"
+    assert list(pool.cache.entries) == [issue]
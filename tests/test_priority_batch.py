@@ -0,0 +1,24 @@
+import json
+import sys
+
+import pytest
+
+pytest.importorskip("autogen")
+
+import priority_batch
+
+
+def test_failed_issues_are_not_checkpointed(monkeypatch, tmp_path):
+    input_path, output_path = tmp_path / "issues.jsonl", tmp_path / "results.jsonl"
+    input_path.write_text("\n".join(json.dumps({"id": issue_id, "issue": f"issue {issue_id}"})
+                                    for issue_id in ("ok", "failed")) + "\n")
+
+    def prioritize_batch(issues, *args, **kwargs):
+        for issue in issues:
+            yield issue["id"], {"priority": "P2"} if issue["id"] == "ok" else None
+
+    monkeypatch.setattr(priority_batch, "prioritize_batch", prioritize_batch)
+    monkeypatch.setattr(sys, "argv", ["priority_batch", "--input", str(input_path), "--output", str(output_path)])
+    priority_batch.main()
+
+    assert priority_batch.read_checkpoint(f"{output_path}.checkpoint") == {"ok"}
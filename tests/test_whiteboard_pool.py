@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from whiteboard_pool import OWNER_PROPERTY, SPARE_PROPERTY, WhiteboardPool
+
+
+class FakeDrive:
+    """
+    The part of the Drive files API the pool uses, over documents held in memory.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields=None):
+        document = self.documents[fileId]
+        return SimpleNamespace(execute=lambda: {"appProperties": dict(document["appProperties"])})
+
+    def update(self, fileId, body):
+        def execute():
+            document = self.documents[fileId]
+            document["name"] = body.get("name", document["name"])
+            for name, value in body.get("appProperties", {}).items():
+                if value is None:
+                    document["appProperties"].pop(name, None)
+                else:
+                    document["appProperties"][name] = value
+            return {}
+        return SimpleNamespace(execute=execute)
+
+
+class FakeGoogleServices:
+    def __init__(self, drive):
+        self.drive = drive
+
+    @contextmanager
+    def lease(self, name, version):
+        yield self.drive
+
+
+def test_a_spare_adopted_by_two_processes_is_claimed_once():
+    documents = {"spare-1": {"name": "[spare] template", "appProperties": {SPARE_PROPERTY: "template"}}}
+    services = FakeGoogleServices(FakeDrive(documents))
+    first, second = (WhiteboardPool(services, "template", clone_document=None, size=1) for _ in range(2))
+
+    assert first.claim("spare-1", "INC-1 - checkout is down")
+    assert not second.claim("spare-1", "INC-2 - transit delays")
+
+    assert documents["spare-1"]["name"] == "INC-1 - checkout is down"
+    assert documents["spare-1"]["appProperties"] == {OWNER_PROPERTY: first.owner}
+    assert second.stats()["lost_claims"] == 1